@@ -0,0 +1,42 @@
+"""Canonical notebook ownership and the read-access predicate built on it.
+
+Notebooks store their owner in ``owner_id`` and the users they are shared with
+in ``allowed_user_ids``, both as user ``ObjectId``s, and whether they are
+public only in ``visibility``.  ``scripts/migrate_mongodb_schema.py`` rewrites
+documents that still hold string ids, the legacy ``author`` field or
+``is_public``, so queries need a single branch per condition.
+
+Each branch of :func:`access_filter` is an equality on the first key of
+``ix_notebooks_owner_updated``, ``ix_notebooks_visibility_updated`` and
+``ix_notebooks_allowed_users`` respectively, which lets MongoDB answer the
+``$or`` from those indexes instead of scanning the collection.
+"""
+
+from bson.objectid import ObjectId
+
+
+def user_key(user_id):
+    """Return ``user_id`` as stored in ``owner_id`` and ``allowed_user_ids``."""
+    if isinstance(user_id, ObjectId):
+        return user_id
+    return ObjectId(user_id) if ObjectId.is_valid(str(user_id)) else user_id
+
+
+def owner_filter(user_id):
+    """Return the query matching notebooks owned by ``user_id``."""
+    return {'owner_id': user_key(user_id)}
+
+
+def access_filter(user_id):
+    """Return the query matching notebooks ``user_id`` may read.
+
+    Anonymous visitors (``user_id`` of ``None``) may only read public ones.
+    """
+    if user_id is None:
+        return {'visibility': 'public'}
+    user = user_key(user_id)
+    return {'$or': [
+        {'owner_id': user},
+        {'visibility': 'public'},
+        {'allowed_user_ids': user},
+    ]}
@@ -1,21 +1,38 @@
 # app.py
 import os
+from datetime import datetime, timezone
 from urllib.parse import urlsplit
 
+from bson.objectid import ObjectId
+
 from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_from_directory, make_response, flash
 from flask_restful import Api
+from access import access_filter, owner_filter, user_key
+from blob_store import DIGEST, configure_blob_store, notebook_blobs
+from invalidation import InvalidationBus
+from drafts import DraftSweeper
+from facets import FACETS, counts as facet_counts
+from conditional import is_not_modified, not_modified_response, notebook_etag, validator_headers
 from config import Config
-from models import mongo, get_notebook, get_user_by_username, get_user_by_id, notebook_html, create_notebook, create_user
+from models import mongo, user_cache, username_cache, invalidate_user, get_notebook, notebook_author, get_notebook_content, get_user_by_username, get_user_by_id, create_user, clone_notebook, resolve_usernames
 from resources import (
     CurrentUser, UserLogin, UserLogout, UserRegister, UserResource,
-    NotebookCreate, NotebookSave, NotebookQuery, NotebookDelete, authenticate_user
+    NotebookCreate, NotebookSave, NotebookCellsSave, NotebookQuery, NotebookDelete,
+    NotebookRevisions, NotebookRevision, NotebookRevisionDiff, authenticate_user
 )
 from editor_api import (
     EditorAdminOverview, EditorNotebookList, EditorNotebookQuery,
-    EditorNotebookRead, EditorSession,
+    EditorNotebookRead, EditorNotebookSearch, EditorSession, EditorTitleCompletion,
     create_editor_launch
 )
-from utils import clear_auth_cookie, decode_token, generate_token, set_auth_cookie
+from render_cache import (
+    BODY_TEMPLATE, DEFAULT_TEMPLATE, configure_render_cache, page_cache, page_key
+)
+from pagination import ORDER, find_page
+from render_jobs import FAILED, PENDING, render_status
+from rendering import RenderFailed, RenderPending, notebook_html, notebook_stylesheet
+from search import search
+from utils import clear_auth_cookie, decode_token, generate_token, load_token_user, set_auth_cookie
 from flask_debugtoolbar import DebugToolbarExtension
 import logging
 from flask_limiter import Limiter
@@ -32,6 +49,22 @@ limiter = Limiter(get_remote_address, app=app)
 
 # Initialize PyMongo
 mongo.init_app(app)
+configure_render_cache(page_cache, app.config, mongo.db)
+configure_blob_store(notebook_blobs, app.config, mongo.db)
+user_cache.configure(app.config['USER_CACHE_ENTRIES'], app.config['USER_CACHE_TTL_SECONDS'])
+username_cache.configure(app.config['USER_CACHE_ENTRIES'], app.config['USER_CACHE_TTL_SECONDS'])
+invalidation_bus = InvalidationBus(mongo.db, app.config['INVALIDATION_POLL_SECONDS'])
+invalidation_bus.subscribe('notebooks', page_cache.discard_local)
+invalidation_bus.subscribe('users', invalidate_user)
+if app.config['INVALIDATION_BUS_ENABLED']:
+    invalidation_bus.start()
+draft_sweeper = DraftSweeper(
+    mongo.db, app.config['DRAFT_SWEEP_AGE_SECONDS'],
+    app.config['DRAFT_SWEEP_INTERVAL_SECONDS'], app.config['DRAFT_SWEEP_BATCH_SIZE'],
+    app.config['DRAFT_CLONE_SWEEP_AGE_SECONDS'],
+)
+if app.config['DRAFT_SWEEP_INTERVAL_SECONDS'] > 0:
+    draft_sweeper.start()
 
 # Initialize Flask-RESTful API
 api = Api(app)
@@ -41,7 +74,7 @@ if app.debug:
 
 @app.after_request
 def add_security_headers(response):
-    response.headers['Content-Security-Policy'] = app.config['CONTENT_SECURITY_POLICY']
+    response.headers.setdefault('Content-Security-Policy', app.config['CONTENT_SECURITY_POLICY'])
     return response
 
 # API Routes
@@ -56,21 +89,29 @@ api.add_resource(CurrentUser, '/api/me')
 api.add_resource(UserResource, '/api/users/<string:user_id>')
 api.add_resource(NotebookCreate, '/api/notebooks/create')
 api.add_resource(NotebookSave, '/api/notebooks/save/<string:notebook_id>')
+api.add_resource(NotebookCellsSave, '/api/notebooks/<string:notebook_id>/cells')
 api.add_resource(NotebookQuery, '/api/notebooks/query/<string:notebook_id>')
 api.add_resource(NotebookDelete, '/api/notebooks/<string:notebook_id>/delete')
+api.add_resource(NotebookRevisions, '/api/notebooks/<string:notebook_id>/revisions')
+api.add_resource(NotebookRevision, '/api/notebooks/<string:notebook_id>/revisions/<int:revision>')
+api.add_resource(
+    NotebookRevisionDiff,
+    '/api/notebooks/<string:notebook_id>/revisions/<int:revision>/diff/<int:other>',
+)
 api.add_resource(EditorSession, '/api/editor/session')
 api.add_resource(EditorNotebookList, '/api/editor/notebooks')
 api.add_resource(EditorNotebookRead, '/api/editor/notebooks/<string:notebook_id>')
 api.add_resource(EditorNotebookQuery, '/api/editor/notebooks/query')
+api.add_resource(EditorNotebookSearch, '/api/editor/search')
+api.add_resource(EditorTitleCompletion, '/api/editor/titles')
 api.add_resource(EditorAdminOverview, '/api/editor/admin/overview')
 
 # Function to handle token retrieval and user info extraction
 def get_user_info_from_token():
     token = request.cookies.get('jwt_token1')
     if token:
-        user_id = decode_token(token)
+        user_id, user = load_token_user(token)
         if user_id:
-            user = get_user_by_id(user_id)
             if user:
                 return {
                     'user_id': user_id,
@@ -88,6 +129,130 @@ def get_user_info_from_token():
 # Frontend Routes
 
 
+def render_notebook_page(notebook):
+    """Return a notebook's HTML, rendering each revision only once.
+
+    With the render queue enabled the render worker normally stores the page
+    before the first reader arrives.  Readers arriving earlier are told the
+    page is being rendered, and a revision the worker gave up on is not
+    retried inside the request thread.  The notebook body is only loaded when
+    the page is not cached.
+    """
+    body_only = app.config['RENDER_EXTERNAL_CSS']
+
+    def render():
+        if app.config['RENDER_QUEUE_ENABLED']:
+            status = render_status(mongo.db, notebook['_id'], notebook.get('revision'))
+            if status == PENDING:
+                raise RenderPending(notebook['_id'])
+            if status == FAILED:
+                raise RenderFailed(notebook['_id'])
+        content = notebook.get('notebook') or get_notebook_content(notebook['_id'])
+        return notebook_html(content, body_only=body_only)
+    template = BODY_TEMPLATE if body_only else DEFAULT_TEMPLATE
+    return page_cache.get_or_render(page_key(notebook, template), render)
+
+
+def notebook_css_url():
+    """Return the fingerprinted stylesheet URL used by body-only pages."""
+    if not app.config['RENDER_EXTERNAL_CSS']:
+        return None
+    return url_for('notebook_stylesheet_asset', digest=notebook_stylesheet()[0])
+
+
+def notebook_page(notebook, is_author, user_info):
+    """Render a notebook page, answering revalidations with 304 Not Modified.
+
+    The page depends on the notebook revision, the signed-in user, the names
+    of the viewer and the author, and the stylesheet in use.  The author's
+    name normally comes from the process's username cache, which is dropped
+    when a user is renamed.  Pages carrying flashed messages are not validated.
+    """
+    notebook['author_username'] = notebook_author(notebook)
+    etag = None
+    if '_flashes' not in session:
+        etag = notebook_etag(
+            notebook, user_info['user_id'] or '', user_info['username'] or '',
+            notebook['author_username'], notebook_css_url(),
+        )
+    updated_at = notebook.get('updated_at')
+    if is_not_modified(etag, updated_at):
+        return not_modified_response(etag, updated_at)
+    response = make_response(render_template(
+        'notebook.html', notebook=render_notebook_page(notebook), notebook_css=notebook_css_url(),
+        id=notebook['_id'], is_author=is_author, **user_info
+    ))
+    response.headers.update(validator_headers(etag, updated_at))
+    return response
+
+
+@app.route('/assets/notebook-<digest>.css')
+def notebook_stylesheet_asset(digest):
+    current_digest, css = notebook_stylesheet()
+    if digest != current_digest:
+        return redirect(url_for('notebook_stylesheet_asset', digest=current_digest))
+    response = make_response(css)
+    response.mimetype = 'text/css'
+    # The URL changes whenever the content does, so browsers never revalidate.
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.set_etag(current_digest)
+    return response
+
+
+def blob_visibility(digest):
+    """Return ``public`` or ``private`` when the viewer may read a notebook using
+    the blob ``digest``, else ``None``."""
+    if mongo.db.notebooks.find_one({'blob_digests': digest, 'visibility': 'public'}, {'_id': 1}):
+        return 'public'
+    user_id = get_user_info_from_token()['user_id']
+    if user_id and mongo.db.notebooks.find_one(
+            {'$and': [{'blob_digests': digest}, access_filter(user_id)]}, {'_id': 1}):
+        return 'private'
+    return None
+
+
+@app.route('/blobs/<digest>')
+def notebook_blob(digest):
+    visibility = blob_visibility(digest) if DIGEST.fullmatch(digest) else None
+    blob = notebook_blobs.get(digest) if visibility else None
+    if blob is None:
+        return 'Not found', 404
+    content_type, content = blob
+    response = make_response(content)
+    response.mimetype = content_type
+    # Blobs are addressed by their content and never change; those of private
+    # notebooks stay out of shared caches.
+    response.headers['Cache-Control'] = f'{visibility}, max-age=31536000, immutable'
+    response.set_etag(digest)
+    # An SVG opened directly must not run scripts in the site's origin.
+    response.headers['Content-Security-Policy'] = "default-src 'none'; style-src 'unsafe-inline'; sandbox"
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+@app.errorhandler(RenderFailed)
+def render_failed_page(error):
+    user_info = get_user_info_from_token()
+    return render_template(
+        'error.html', error='This notebook could not be rendered.', is_author=False, **user_info
+    ), 503
+
+
+RENDER_RETRY_SECONDS = 5
+
+
+@app.errorhandler(RenderPending)
+def render_pending_page(error):
+    user_info = get_user_info_from_token()
+    response = make_response(render_template(
+        'error.html', error='This notebook is being rendered. Please reload the page in a moment.',
+        is_author=False, **user_info
+    ), 503)
+    response.headers['Retry-After'] = str(RENDER_RETRY_SECONDS)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
 def safe_local_url(candidate, fallback='/'):
     """Return a local redirect target without permitting an open redirect."""
     if not candidate:
@@ -112,27 +277,49 @@ def auth_return_url():
 
 @app.route('/')
 def index():
-    admin = get_user_by_username(app.config['ADMIN_USERNAME'])
-    if not admin:
-        user_info = get_user_info_from_token()
-        return render_template(
-            'error.html', error='Admin main page not found', is_author=False, **user_info
-        ), 404
+    """The newest public reports or, with ``INDEX_PAGE_NAME`` set, the administrator's page."""
     index_page_name = app.config['INDEX_PAGE_NAME']
-    query = {
-        'slug': index_page_name,
-        '$or': [
-            {'owner_id': str(admin['_id'])},
-            {'author': str(admin['_id'])},
-        ],
-    }
-    notebook = mongo.db.notebooks.find_one(query)
-    if not notebook:
-        user_info = get_user_info_from_token()
-        return render_template(
-            'error.html', error='Main page not found', is_author=False, **user_info
-        ), 404
-    return redirect(url_for('notebook', slug=index_page_name))
+    admin = get_user_by_username(app.config['ADMIN_USERNAME']) if index_page_name else None
+    if admin and mongo.db.notebooks.find_one(
+        {'slug': index_page_name, **owner_filter(admin['_id'])}
+    ):
+        return redirect(url_for('notebook', slug=index_page_name))
+    return latest_page()
+
+
+# Entries per page of /latest and in the Atom feed.
+FEED_PAGE_SIZE = 20
+ATOM_FEED_ENTRIES = 50
+
+
+def latest_page():
+    """A page of the public feed; reads ``public_feed`` only."""
+    user_info = get_user_info_from_token()
+    try:
+        entries, next_cursor = find_page(
+            mongo.db.public_feed, {}, None, FEED_PAGE_SIZE, request.args.get('cursor')
+        )
+    except ValueError as error:
+        return render_template('error.html', error=str(error), is_author=False, **user_info), 400
+    return render_template(
+        'latest.html', title='Latest reports', entries=entries, next_cursor=next_cursor,
+        is_author=False, **user_info
+    )
+
+
+@app.route('/latest')
+def latest():
+    return latest_page()
+
+
+@app.route('/feed.atom')
+def atom_feed():
+    entries = list(mongo.db.public_feed.find({}).sort(ORDER).limit(ATOM_FEED_ENTRIES))
+    updated = entries[0]['updated_at'] if entries else datetime.now(timezone.utc)
+    response = make_response(render_template('feed.xml', entries=entries, updated=updated))
+    response.headers['Content-Type'] = 'application/atom+xml; charset=utf-8'
+    response.headers['Cache-Control'] = 'public, max-age=300'
+    return response
 
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -182,12 +369,11 @@ def register():
                 'register.html', error_message=error_message, next_page=next_page
             )
         
-        # Create user and associated notebook
+        # Create the user
         role = 'admin' if username == app.config['ADMIN_USERNAME'] else 'user'
         user_id = create_user(username, password, role=role)
         if user_id:
-            # Create a notebook and authenticate the new user immediately.
-            create_notebook(user_id, username)
+            # Authenticate the new user immediately.
             token = generate_token(user_id)
             flash(f"Welcome, {username}. Your account was created successfully.", 'success')
             response = redirect(next_page)
@@ -204,9 +390,13 @@ def create():
     user_info = get_user_info_from_token()
     if not user_info['is_authenticated']:
         return redirect(url_for('login', next=request.path))
-    notebook_id = create_notebook(user_info['user_id'], user_info['username'])
+    # The draft only exists in the editor until it is first published, which
+    # creates the notebook under this reserved id.
+    notebook_id = str(ObjectId())
     editor_nonce = create_editor_launch(user_info['user_id'])
-    return render_template('edit.html', notebook_id=notebook_id, editor_nonce=editor_nonce, **user_info)
+    return render_template(
+        'edit.html', notebook_id=notebook_id, draft=True, editor_nonce=editor_nonce, **user_info
+    )
 
 @app.route('/create_fromtemplate/<slugid>')
 def create_fromtemplate(slugid):
@@ -214,15 +404,16 @@ def create_fromtemplate(slugid):
     if not user_info['is_authenticated']:
         return redirect(url_for('login', next=request.path))
     user_id=user_info['user_id']
-    notebook={}
-    if slugid=="blank":
-        notebook_id='-1'
-    else:
-        notebook = get_notebook(slugid,user_id)
-        notebook_id=str(notebook['_id'])
-    if 'message' in notebook and notebook['message'] == 'not_authorized':
+    # A template is copied inside MongoDB into a draft of the user, which the
+    # editor then loads like any other of their notebooks.
+    notebook_id = '-1' if slugid == "blank" else clone_notebook(slugid, user_id)
+    if notebook_id == {'message': 'not_authorized'}:
         flash('You are not authorized to access this notebook.')
         return render_template('error.html', error="Unauthorized access.", is_author=False, **user_info)
+    if notebook_id == {'message': 'not found'}:
+        return render_template(
+            'error.html', error='Template not found', is_author=False, **user_info
+        ), 404
     editor_nonce = create_editor_launch(user_id)
     return render_template('edit.html', notebook_id=notebook_id, editor_nonce=editor_nonce, **user_info)
 
@@ -240,7 +431,7 @@ def logout():
 def notebook(slug):
     user_info = get_user_info_from_token()
     user_id=user_info['user_id']
-    notebook = get_notebook(slug,user_id)    
+    notebook = get_notebook(slug, user_id, include_content=False)
     is_author = False
     print(user_id)
     if notebook:
@@ -251,10 +442,7 @@ def notebook(slug):
         if user_info['user_id'] and notebook['owner_id'] == str(user_info['user_id']):
             is_author = True
 
-        # Fetch author's username
-        notebook['author_username'] = notebook['author']
-
-        return render_template('notebook.html', notebook=notebook_html(notebook['notebook']),id=notebook['_id'], is_author=is_author, **user_info)
+        return notebook_page(notebook, is_author, user_info)
     else:
         return render_template('error.html', error='Not found', is_author=False, **user_info)
 
@@ -262,7 +450,7 @@ def notebook(slug):
 def notebookid(id):
     user_info = get_user_info_from_token()
     user_id=user_info['user_id']
-    notebook = get_notebook(id,user_id)
+    notebook = get_notebook(id, user_id, include_content=False)
 
     is_author = False
     if 'message' in notebook and notebook['message'] == 'not_authorized':
@@ -273,13 +461,91 @@ def notebookid(id):
         if user_info['user_id'] and notebook['owner_id'] == str(user_info['user_id']):
             is_author = True
 
-        # Fetch author's username
-        notebook['author_username'] = notebook['author']
-
-        return render_template('notebook.html', notebook=notebook_html(notebook['notebook']), id=notebook['_id'],is_author=is_author, **user_info)
+        return notebook_page(notebook, is_author, user_info)
     else:
         return render_template('notebook.html', notebook=None, is_author=False, **user_info)
 
+# What search and browse pages show of each notebook.
+SEARCH_RESULT_FIELDS = {'title': 1, 'slug': 1, 'owner_id': 1, 'updated_at': 1, 'summary': 1}
+BROWSE_PAGE_SIZE = 50
+
+
+def result_rows(documents):
+    """Return the rows listing ``documents``, resolving their authors in one query."""
+    authors = resolve_usernames([str(document.get('owner_id', '')) for document in documents])
+    return [{
+        'title': document.get('title') or document.get('slug', ''),
+        'slug': document.get('slug', ''),
+        'author': authors.get(str(document.get('owner_id', '')), 'Unknown'),
+        'updated_at': document.get('updated_at'),
+        'summary': document.get('summary', ''),
+    } for document in documents]
+
+
+@app.route('/search')
+def search_page():
+    user_info = get_user_info_from_token()
+    query = request.args.get('q', '').strip()[:200]
+    results = search(mongo.db, user_info['user_id'], query, SEARCH_RESULT_FIELDS) if query else []
+    documents = result_rows([document for document, _ in results])
+    return render_template(
+        'search.html', title='Search', query=query, documents=documents, is_author=False, **user_info
+    )
+
+
+def topic_names(topic_ids):
+    topic_ids = [topic_id for topic_id in topic_ids if isinstance(topic_id, ObjectId)]
+    if not topic_ids:
+        return {}
+    return {topic['_id']: topic['name']
+            for topic in mongo.db.topics.find({'_id': {'$in': topic_ids}}, {'name': 1})}
+
+
+def facet_rows(facet, found, names):
+    return [{'facet': facet, 'value': str(value), 'name': names.get(value, str(value)),
+             'count': count} for value, count in found]
+
+
+@app.route('/browse')
+def browse():
+    """Tags and topics with their counts, read from the maintained facet counts."""
+    user_info = get_user_info_from_token()
+    scopes = {'public': 'public'}
+    if user_info['user_id']:
+        scopes['mine'] = user_key(user_info['user_id'])
+    found = {(name, facet): facet_counts(mongo.db, facet, scope)
+             for name, scope in scopes.items() for facet in FACETS}
+    names = topic_names([value for (_, facet), values in found.items() if facet == 'topic'
+                         for value, _ in values])
+    sections = {name: {facet: facet_rows(facet, found[name, facet], names) for facet in FACETS}
+                for name in scopes}
+    return render_template(
+        'browse.html', title='Browse', sections=sections, is_author=False, **user_info
+    )
+
+
+@app.route('/browse/<facet>/<value>')
+def browse_facet(facet, value):
+    """The readable notebooks with a tag or topic, newest first."""
+    user_info = get_user_info_from_token()
+    if facet not in FACETS or (facet == 'topic' and not ObjectId.is_valid(value)):
+        return render_template('error.html', error='Not found', is_author=False, **user_info), 404
+    key = ObjectId(value) if facet == 'topic' else value
+    query = {'$and': [{FACETS[facet]: key}, access_filter(user_info['user_id'])]}
+    try:
+        documents, next_cursor = find_page(
+            mongo.db.notebooks, query, SEARCH_RESULT_FIELDS, BROWSE_PAGE_SIZE,
+            request.args.get('cursor'),
+        )
+    except ValueError as error:
+        return render_template('error.html', error=str(error), is_author=False, **user_info), 400
+    name = topic_names([key]).get(key, value) if facet == 'topic' else value
+    return render_template(
+        'browse.html', title=name, heading=f'{facet.capitalize()}: {name}', facet=facet,
+        value=value, documents=result_rows(documents), next_cursor=next_cursor,
+        is_author=False, **user_info
+    )
+
 @app.route('/edit/<identifier>')
 def edit_notebook(identifier):
     user_info = get_user_info_from_token()
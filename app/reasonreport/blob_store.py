@@ -0,0 +1,279 @@
+"""Content-addressed storage of large notebook images.
+
+Base64 images and SVG documents dominate notebook size and are copied into
+every revision, every notebook created from a template and every rendered page.
+At save time :meth:`BlobStore.externalize` moves each image output or markdown
+attachment of at least ``threshold`` bytes into a store keyed by the SHA-256 of
+its content and leaves a ``reasonreport-blob:<digest>`` reference in the
+notebook.  The editor gets the images back inline through
+:meth:`BlobStore.inline`; rendered pages link to ``/blobs/<digest>`` instead,
+which never changes content and is served with immutable cache headers.
+Notebooks list the digests they reference in ``blob_digests`` (see
+:func:`blob_digests`), and a blob is only served to viewers of a notebook
+referencing it.
+
+Blobs are shared between notebooks and never rewritten, so concurrent saves
+need no coordination.  Blobs no longer referenced by any notebook are kept.
+"""
+
+import base64
+import binascii
+import copy
+import hashlib
+import html
+import logging
+import os
+import re
+import tempfile
+from datetime import datetime, timezone
+
+from bson.binary import Binary
+
+BLOB_PREFIX = 'reasonreport-blob:'
+BLOB_URL = '/blobs/{digest}'
+# Image types stored as blobs; notebooks hold SVG as text and the rest base64.
+BLOB_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'image/svg+xml'}
+TEXT_TYPES = {'image/svg+xml'}
+DIGEST = re.compile(r'[0-9a-f]{64}')
+# What nbconvert writes for inline image outputs.
+OUTPUT_ALT = 'No description has been provided for this image'
+
+logger = logging.getLogger(__name__)
+
+
+def blob_reference(value):
+    """Return the digest a mime bundle value refers to, or ``None``."""
+    if isinstance(value, str) and value.startswith(BLOB_PREFIX):
+        digest = value[len(BLOB_PREFIX):]
+        return digest if DIGEST.fullmatch(digest) else None
+    return None
+
+
+def _bundles(notebook):
+    """Yield every output and attachment mime bundle of ``notebook``."""
+    for cell in notebook.get('cells', []):
+        for output in cell.get('outputs', []):
+            if isinstance(output.get('data'), dict):
+                yield output['data']
+        for bundle in (cell.get('attachments') or {}).values():
+            if isinstance(bundle, dict):
+                yield bundle
+
+
+def blob_digests(notebook):
+    """Return the sorted digests of the blobs ``notebook`` references."""
+    return sorted({
+        digest for bundle in _bundles(notebook)
+        for digest in map(blob_reference, bundle.values()) if digest
+    })
+
+
+def _decode(mime, value):
+    text = ''.join(value) if isinstance(value, list) else value
+    if not isinstance(text, str):
+        return None
+    if mime in TEXT_TYPES:
+        return text.encode('utf-8')
+    try:
+        return base64.b64decode(''.join(text.split()), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def _encode(mime, content):
+    if mime in TEXT_TYPES:
+        return content.decode('utf-8')
+    return base64.b64encode(content).decode('ascii')
+
+
+def _image_tag(digest, alt):
+    url = BLOB_URL.format(digest=digest)
+    return f'<img src="{url}" alt="{html.escape(alt)}" loading="lazy" decoding="async">'
+
+
+def link_blobs(notebook):
+    """Return a copy of ``notebook`` whose blob references are lazy-loaded images.
+
+    Image outputs become ``text/html`` ``<img>`` tags and markdown attachments
+    are replaced by their blob URL, so rendered pages stay small.  Notebooks
+    without references are returned unchanged.
+    """
+    if not any(blob_reference(value) for bundle in _bundles(notebook)
+               for value in bundle.values()):
+        return notebook
+    notebook = copy.deepcopy(notebook)
+    for cell in notebook.get('cells', []):
+        for output in cell.get('outputs', []):
+            data = output.get('data')
+            if not isinstance(data, dict):
+                continue
+            for mime, value in list(data.items()):
+                digest = blob_reference(value)
+                if digest:
+                    del data[mime]
+                    data.setdefault('text/html', _image_tag(digest, OUTPUT_ALT))
+        attachments = cell.get('attachments') or {}
+        for name, bundle in list(attachments.items()):
+            digest = next(filter(None, map(blob_reference, bundle.values())), None)
+            if not digest:
+                continue
+            del attachments[name]
+            target = re.escape(f'attachment:{name}')
+            source = ''.join(cell.get('source', ''))
+            source = re.sub(
+                rf'!\[([^\]]*)\]\({target}(?:\s+"[^"]*")?\)',
+                lambda match: _image_tag(digest, match.group(1)), source,
+            )
+            cell['source'] = source.replace(f'attachment:{name}', BLOB_URL.format(digest=digest))
+    return notebook
+
+
+class MongoBlobStore:
+    """Blobs kept in the ``blobs`` collection, one document per digest.
+
+    Every blob was part of a notebook document before, so it fits in one.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def missing(self, digests):
+        found = {
+            document['_id']
+            for document in self.collection.find({'_id': {'$in': list(digests)}}, {'_id': 1})
+        }
+        return [digest for digest in digests if digest not in found]
+
+    def put(self, digest, content_type, content):
+        self.collection.update_one({'_id': digest}, {'$setOnInsert': {
+            'content_type': content_type,
+            'data': Binary(content),
+            'size': len(content),
+            'created_at': datetime.now(timezone.utc),
+        }}, upsert=True)
+
+    def get_many(self, digests):
+        return {
+            document['_id']: (document['content_type'], bytes(document['data']))
+            for document in self.collection.find({'_id': {'$in': list(digests)}})
+        }
+
+
+class DiskBlobStore:
+    """Blobs kept as files named by digest on a shared volume.
+
+    Each file starts with its content type on a line of its own.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def missing(self, digests):
+        return [digest for digest in digests if not os.path.exists(self._path(digest))]
+
+    def put(self, digest, content_type, content):
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as blob:
+            blob.write(content_type.encode('ascii') + b'\n' + content)
+        os.replace(temporary, path)
+
+    def get_many(self, digests):
+        blobs = {}
+        for digest in digests:
+            try:
+                with open(self._path(digest), 'rb') as blob:
+                    content_type, content = blob.read().split(b'\n', 1)
+            except FileNotFoundError:
+                continue
+            blobs[digest] = (content_type.decode('ascii'), content)
+        return blobs
+
+
+class BlobStore:
+    """Move large images out of notebooks at save time and back for editing."""
+
+    def __init__(self, store=None, threshold=16384):
+        self.store = store
+        self.threshold = threshold
+
+    def configure(self, store, threshold):
+        self.store = store
+        self.threshold = threshold
+
+    def externalize(self, notebook):
+        """Replace large images in ``notebook`` with blob references, in place."""
+        self.store_images(self.references(notebook))
+        return notebook
+
+    def references(self, notebook):
+        """Replace large images in ``notebook`` with blob references, in place.
+
+        Nothing is stored yet; the returned images are passed to
+        :meth:`store_images` once the notebook is known to be saved.
+        """
+        pending = {}
+        if self.store is None or not self.threshold:
+            return pending
+        for bundle in _bundles(notebook):
+            for mime, value in bundle.items():
+                if mime not in BLOB_TYPES or blob_reference(value):
+                    continue
+                content = _decode(mime, value)
+                if content is None or len(content) < self.threshold:
+                    continue
+                digest = hashlib.sha256(content).hexdigest()
+                pending[digest] = (mime, content)
+                bundle[mime] = BLOB_PREFIX + digest
+        return pending
+
+    def store_images(self, pending):
+        """Store the images returned by :meth:`references` that are missing."""
+        if pending:
+            for digest in self.store.missing(list(pending)):
+                self.store.put(digest, *pending[digest])
+
+    def inline(self, notebook):
+        """Replace blob references in ``notebook`` with their content, in place."""
+        if self.store is None or notebook is None:
+            return notebook
+        digests = blob_digests(notebook)
+        if not digests:
+            return notebook
+        blobs = self.store.get_many(digests)
+        for bundle in _bundles(notebook):
+            for mime, value in list(bundle.items()):
+                digest = blob_reference(value)
+                if digest in blobs:
+                    bundle[mime] = _encode(mime, blobs[digest][1])
+                elif digest:
+                    logger.warning('Blob %s referenced by a notebook is missing', digest)
+        return notebook
+
+    def get(self, digest):
+        """Return ``(content_type, content)`` of a blob, or ``None``."""
+        if self.store is None or not DIGEST.fullmatch(digest):
+            return None
+        return self.store.get_many([digest]).get(digest)
+
+
+def configure_blob_store(blobs, config, database):
+    """Apply ``BLOB_STORE_*`` settings to ``blobs``."""
+    backend = config.get('BLOB_STORE_BACKEND', '')
+    if backend == 'mongo':
+        store = MongoBlobStore(database.blobs)
+    elif backend == 'disk':
+        store = DiskBlobStore(config.get('BLOB_STORE_DIR'))
+    elif not backend:
+        store = None
+    else:
+        raise ValueError(f'Unknown BLOB_STORE_BACKEND: {backend}')
+    blobs.configure(store, config.get('BLOB_THRESHOLD_BYTES', 16384))
+    return blobs
+
+
+notebook_blobs = BlobStore()
@@ -0,0 +1,190 @@
+"""Chunked storage of notebook cells outside the notebook document.
+
+A MongoDB document holds at most 16 MB and is read whole, so notebooks with
+large outputs are stored in chunked form: the ``notebooks`` document keeps
+``notebook_skeleton`` (the notebook without its cells) and ``cell_chunks``, an
+ordered list of references to ``notebook_cells`` documents holding one cell
+each.  Smaller notebooks keep the embedded ``notebook`` field, and the readers
+below accept both layouts.
+
+Chunks are immutable.  A save inserts chunks for new and changed cells, reuses
+the others, switches ``cell_chunks`` with its revision-guarded update and only
+then deletes the chunks the new revision no longer references.  A reader that
+loses that race re-reads the references and tries again.
+"""
+
+import hashlib
+import json
+
+import bson
+from bson.objectid import ObjectId
+
+# Projection of every field a notebook body can be stored in.
+CONTENT_FIELDS = {'notebook': 1, 'notebook_skeleton': 1, 'cell_chunks': 1}
+WITHOUT_CONTENT = {field: 0 for field in CONTENT_FIELDS}
+READ_ATTEMPTS = 3
+FETCH_BATCH_SIZE = 16
+
+
+class StaleChunks(LookupError):
+    """A referenced chunk was deleted by a newer save."""
+
+
+def is_chunked(document):
+    return 'cell_chunks' in document
+
+
+def should_chunk(notebook, threshold):
+    """Return whether ``notebook`` is at least ``threshold`` bytes of BSON.
+
+    A threshold of ``0`` or ``None`` keeps every notebook embedded.
+    """
+    return bool(threshold) and len(bson.encode(notebook)) >= threshold
+
+
+def may_outgrow(size, cells, threshold):
+    """Return whether an embedded notebook of ``size`` bytes of BSON may reach
+    ``threshold`` once ``cells`` are added to it."""
+    return bool(threshold) and size + len(bson.encode({'cells': cells})) >= threshold
+
+
+def cell_digest(cell):
+    canonical = json.dumps(cell, sort_keys=True, separators=(',', ':'),
+                           ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def skeleton(notebook):
+    """Return ``notebook`` without its cells."""
+    return {key: value for key, value in notebook.items() if key != 'cells'}
+
+
+def store_cells(db, notebook_id, cells, previous=()):
+    """Insert chunks for ``cells`` and return their references in order.
+
+    Cells identical to one referenced by ``previous`` reuse its chunk.
+    """
+    reusable = {}
+    for ref in previous:
+        reusable.setdefault(ref['digest'], []).append(ref)
+    refs = []
+    chunks = []
+    for cell in cells:
+        digest = cell_digest(cell)
+        if reusable.get(digest):
+            refs.append(reusable[digest].pop(0))
+            continue
+        chunk_id = ObjectId()
+        chunks.append({'_id': chunk_id, 'notebook_id': notebook_id,
+                       'digest': digest, 'cell': cell})
+        refs.append({'chunk_id': chunk_id, 'cell_id': cell.get('id'), 'digest': digest})
+    if chunks:
+        db.notebook_cells.insert_many(chunks, ordered=False)
+    return refs
+
+
+def discard_chunks(db, refs, keep=()):
+    """Delete the chunks in ``refs`` that ``keep`` does not reference."""
+    kept = {ref['chunk_id'] for ref in keep}
+    stale = [ref['chunk_id'] for ref in refs if ref['chunk_id'] not in kept]
+    if stale:
+        db.notebook_cells.delete_many({'_id': {'$in': stale}})
+
+
+def discard_notebooks(db, notebook_ids):
+    """Delete every chunk of the given notebooks."""
+    db.notebook_cells.delete_many({'notebook_id': {'$in': list(notebook_ids)}})
+
+
+def copy_notebook(db, source, document):
+    """Insert ``document`` with the body of the ``source`` notebook.
+
+    ``source`` needs ``_id``, ``revision`` and, when chunked, ``cell_chunks``.
+    Chunks are duplicated for ``document``, because saves delete the chunks
+    they replace, :data:`FETCH_BATCH_SIZE` at a time, so only an embedded
+    body, which is below the chunk threshold, is held in memory whole.
+    Returns ``False``, inserting nothing, when ``source`` was deleted or saved
+    again meanwhile.
+    """
+    refs = source.get('cell_chunks')
+    if refs is not None:
+        copies = []
+        try:
+            for offset in range(0, len(refs), FETCH_BATCH_SIZE):
+                batch = refs[offset:offset + FETCH_BATCH_SIZE]
+                chunks = [
+                    {'_id': ObjectId(), 'notebook_id': document['_id'],
+                     'digest': ref['digest'], 'cell': cell}
+                    for ref, cell in zip(batch, fetch_cells(db, batch))
+                ]
+                db.notebook_cells.insert_many(chunks)
+                copies.extend({**ref, 'chunk_id': chunk['_id']}
+                              for ref, chunk in zip(batch, chunks))
+        except StaleChunks:
+            discard_notebooks(db, [document['_id']])
+            return False
+        document = {**document, 'cell_chunks': copies}
+    # Reading the revision last keeps the chunk copy complete: a newer save
+    # only deletes the old chunks after it has switched the revision.
+    body = db.notebooks.find_one(
+        {'_id': source['_id'], 'revision': source.get('revision')},
+        {'_id': 0, 'notebook': 1, 'notebook_skeleton': 1},
+    )
+    if body is None:
+        discard_notebooks(db, [document['_id']])
+        return False
+    db.notebooks.insert_one({**body, **document})
+    return True
+
+
+def fetch_cells(db, refs, projection=None):
+    """Return the cells referenced by ``refs`` in order.
+
+    ``projection`` applies to the chunk documents, e.g. ``{'cell.source': 1}``.
+    """
+    ids = [ref['chunk_id'] for ref in refs]
+    found = {
+        chunk['_id']: chunk.get('cell', {})
+        for chunk in db.notebook_cells.find({'_id': {'$in': ids}}, projection)
+    }
+    if len(found) < len(set(ids)):
+        raise StaleChunks(ids)
+    return [found[chunk_id] for chunk_id in ids]
+
+
+def iter_cells(db, document, start=0, stop=None):
+    """Yield cells ``start:stop`` of a notebook document.
+
+    Chunks are fetched in batches, so callers can process a large notebook
+    without holding all of its outputs.  Raises :class:`StaleChunks` when a
+    newer save removed a chunk while iterating.
+    """
+    if not is_chunked(document):
+        yield from document['notebook'].get('cells', [])[start:stop]
+        return
+    refs = document['cell_chunks'][start:stop]
+    for offset in range(0, len(refs), FETCH_BATCH_SIZE):
+        yield from fetch_cells(db, refs[offset:offset + FETCH_BATCH_SIZE])
+
+
+def load_notebook(db, document, start=None, stop=None):
+    """Return the notebook stored in ``document``, optionally only cells ``start:stop``.
+
+    ``document`` needs ``_id`` and the :data:`CONTENT_FIELDS`.  Returns
+    ``None`` when the notebook was deleted meanwhile.
+    """
+    for _ in range(READ_ATTEMPTS):
+        if not is_chunked(document):
+            notebook = dict(document['notebook'])
+            if start is not None or stop is not None:
+                notebook['cells'] = notebook.get('cells', [])[start:stop]
+            return notebook
+        try:
+            cells = list(iter_cells(db, document, start or 0, stop))
+        except StaleChunks:
+            document = db.notebooks.find_one({'_id': document['_id']}, CONTENT_FIELDS)
+            if document is None:
+                return None
+            continue
+        return {**document['notebook_skeleton'], 'cells': cells}
+    raise StaleChunks(document['_id'])
@@ -0,0 +1,74 @@
+"""HTTP validators for notebook representations.
+
+A notebook's ``revision`` changes on every save, so ``(id, revision)`` plus
+whatever else changes the response body, such as the viewer and the names of
+the users it shows, is a strong validator.
+Callers compute it from a metadata-only lookup and answer revalidations with
+``304 Not Modified`` before the notebook content is loaded or rendered.
+"""
+
+import hashlib
+from datetime import timezone
+
+from flask import make_response, request
+
+
+def notebook_etag(document, *viewer):
+    """Return a strong ETag for ``document`` as seen by ``viewer``.
+
+    ``viewer`` holds everything besides the revision the response depends on.
+
+    Legacy documents without a revision have no reliable validator.
+    """
+    revision = document.get('revision')
+    if revision is None:
+        return None
+    parts = [str(document['_id']), str(revision), *(str(part) for part in viewer)]
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def _http_date(value):
+    if value is None or not hasattr(value, 'replace'):
+        return None
+    # PyMongo returns naive UTC datetimes; HTTP dates have second precision.
+    return value.replace(tzinfo=value.tzinfo or timezone.utc, microsecond=0)
+
+
+def is_conditional():
+    """Return whether the request carries validators worth checking first.
+
+    Only then is it cheaper to look up metadata before loading the body.
+    """
+    return bool(request.if_none_match or request.if_modified_since)
+
+
+def is_not_modified(etag, updated_at=None):
+    """Return whether the client's cached copy is still current.
+
+    ``If-None-Match`` takes precedence over ``If-Modified-Since`` (RFC 9110).
+    """
+    if etag is None:
+        return False
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    modified = _http_date(updated_at)
+    if modified is not None and request.if_modified_since:
+        return modified <= request.if_modified_since
+    return False
+
+
+def validator_headers(etag, updated_at=None):
+    """Return headers that let clients revalidate instead of refetching."""
+    if etag is None:
+        return {}
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+    modified = _http_date(updated_at)
+    if modified is not None:
+        headers['Last-Modified'] = modified.strftime('%a, %d %b %Y %H:%M:%S GMT')
+    return headers
+
+
+def not_modified_response(etag, updated_at=None):
+    response = make_response('', 304)
+    response.headers.update(validator_headers(etag, updated_at))
+    return response
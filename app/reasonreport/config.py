@@ -6,7 +6,7 @@ class Config:
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'development-jwt-key-change-me-32')
     MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://mongo:27017/flaskdb')
     ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
-    INDEX_PAGE_NAME = os.environ.get('INDEX_PAGE_NAME', 'mainpage')
+    INDEX_PAGE_NAME = os.environ.get('INDEX_PAGE_NAME', '')
     JWT_TOKEN_LOCATION='cookies'
     JWT_COOKIE_SECURE = os.environ.get('JWT_COOKIE_SECURE', 'true').lower() in {'1', 'true', 'yes'}
     JWT_ACCESS_TOKEN_EXPIRES = int(os.environ.get('JWT_ACCESS_TOKEN_EXPIRES', '86400'))
@@ -20,6 +20,55 @@ class Config:
         'REGISTRATION_RATE_LIMIT', '5 per minute'
     )
     RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI', 'memory://')
+    # Rendered notebook pages: per-worker LRU plus an optional shared tier
+    # ('mongo' or 'disk') so that every worker reuses one render per revision.
+    RENDER_CACHE_ENTRIES = int(os.environ.get('RENDER_CACHE_ENTRIES', '128'))
+    RENDER_CACHE_BACKEND = os.environ.get('RENDER_CACHE_BACKEND', '')
+    RENDER_CACHE_DIR = os.environ.get('RENDER_CACHE_DIR', '/tmp/reasonreport-pages')
+    # Serve notebook bodies and link the nbconvert styles as one cached asset
+    # instead of inlining them into every page.
+    RENDER_EXTERNAL_CSS = os.environ.get(
+        'RENDER_EXTERNAL_CSS', 'true'
+    ).lower() in {'1', 'true', 'yes'}
+    # Publishing queues a render job drained by render_worker.py, which needs a
+    # shared RENDER_CACHE_BACKEND to hand the HTML to the web workers.
+    RENDER_QUEUE_ENABLED = os.environ.get(
+        'RENDER_QUEUE_ENABLED', ''
+    ).lower() in {'1', 'true', 'yes'}
+    RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', '2'))
+    RENDER_JOB_TIMEOUT = int(os.environ.get('RENDER_JOB_TIMEOUT', '120'))
+    RENDER_JOB_MEMORY_MB = int(os.environ.get('RENDER_JOB_MEMORY_MB', '1024'))
+    RENDER_QUEUE_POLL_SECONDS = float(os.environ.get('RENDER_QUEUE_POLL_SECONDS', '1'))
+    # Per-worker cache of user records used to authenticate requests.  Changes
+    # made through another process become visible after at most the TTL.
+    USER_CACHE_ENTRIES = int(os.environ.get('USER_CACHE_ENTRIES', '1024'))
+    USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+    # Invalidate this process's caches when notebooks or users change elsewhere
+    # (MCP, scripts, other workers).  Uses change streams on a replica set and
+    # polls updated_at every INVALIDATION_POLL_SECONDS otherwise.
+    INVALIDATION_BUS_ENABLED = os.environ.get(
+        'INVALIDATION_BUS_ENABLED', ''
+    ).lower() in {'1', 'true', 'yes'}
+    INVALIDATION_POLL_SECONDS = float(os.environ.get('INVALIDATION_POLL_SECONDS', '5'))
+    # Delete the never-published notebook-<id> placeholders that /create used
+    # to insert once they are DRAFT_SWEEP_AGE_SECONDS old, and copies of
+    # notebooks never saved after DRAFT_CLONE_SWEEP_AGE_SECONDS; an interval
+    # of 0 disables the sweeper.
+    DRAFT_SWEEP_AGE_SECONDS = float(os.environ.get('DRAFT_SWEEP_AGE_SECONDS', '86400'))
+    DRAFT_CLONE_SWEEP_AGE_SECONDS = float(
+        os.environ.get('DRAFT_CLONE_SWEEP_AGE_SECONDS', '2592000')
+    )
+    DRAFT_SWEEP_INTERVAL_SECONDS = float(os.environ.get('DRAFT_SWEEP_INTERVAL_SECONDS', '0'))
+    DRAFT_SWEEP_BATCH_SIZE = int(os.environ.get('DRAFT_SWEEP_BATCH_SIZE', '500'))
+    # Notebooks of at least this many bytes store each cell in notebook_cells
+    # instead of one document, which MongoDB limits to 16 MB; 0 disables it.
+    CELL_CHUNK_THRESHOLD_BYTES = int(os.environ.get('CELL_CHUNK_THRESHOLD_BYTES', '1048576'))
+    # Images of at least BLOB_THRESHOLD_BYTES are moved out of saved notebooks
+    # into a content-addressed store ('mongo' or 'disk') and served from
+    # /blobs/<sha256>; an empty backend keeps them inline.
+    BLOB_STORE_BACKEND = os.environ.get('BLOB_STORE_BACKEND', 'mongo')
+    BLOB_STORE_DIR = os.environ.get('BLOB_STORE_DIR', '/var/lib/reasonreport/blobs')
+    BLOB_THRESHOLD_BYTES = int(os.environ.get('BLOB_THRESHOLD_BYTES', '16384'))
     CONTENT_SECURITY_POLICY = os.environ.get(
         'CONTENT_SECURITY_POLICY',
         "default-src 'self' data: blob:; "
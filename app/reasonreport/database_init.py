@@ -26,6 +26,7 @@ COLLECTION_VALIDATORS = {
                 "username_normalized": {"bsonType": "string", "minLength": 3},
                 "status": {"enum": ["active", "disabled", "pending"]},
                 "created_at": {"bsonType": "date"},
+                "updated_at": {"bsonType": "date"},
             },
         }
     },
@@ -39,6 +40,8 @@ COLLECTION_VALIDATORS = {
             "properties": {
                 "owner_id": _object_id(),
                 "title": {"bsonType": "string"},
+                "title_normalized": {"bsonType": "string"},
+                "title_prefixes": {"bsonType": "array", "items": {"bsonType": "string"}},
                 "slug": {"bsonType": "string"},
                 "created_at": {"bsonType": "date"},
                 "updated_at": {"bsonType": "date"},
@@ -46,6 +49,66 @@ COLLECTION_VALIDATORS = {
                 "allowed_user_ids": {"bsonType": "array", "items": _object_id()},
                 "topic_ids": {"bsonType": "array", "items": _object_id()},
                 "revision": {"bsonType": "int", "minimum": 1},
+                "content_hash": {"bsonType": "string"},
+                "cell_chunks": {"bsonType": "array"},
+                "summary": {"bsonType": "string"},
+                "first_image": {"bsonType": ["object", "null"]},
+                "cell_count": {"bsonType": "int", "minimum": 0},
+                "word_count": {"bsonType": ["int", "long"], "minimum": 0},
+                "code_languages": {"bsonType": "array", "items": {"bsonType": "string"}},
+                "blob_digests": {"bsonType": "array", "items": {"bsonType": "string"}},
+            },
+        }
+    },
+    "blobs": {
+        "$jsonSchema": {
+            "bsonType": "object",
+            "required": ["content_type", "data", "size", "created_at"],
+            "properties": {
+                "_id": {"bsonType": "string", "pattern": "^[0-9a-f]{64}$"},
+                "content_type": {"bsonType": "string"},
+                "data": {"bsonType": "binData"},
+                "size": {"bsonType": ["int", "long"]},
+                "created_at": {"bsonType": "date"},
+            },
+        }
+    },
+    "notebook_cells": {
+        "$jsonSchema": {
+            "bsonType": "object",
+            "required": ["notebook_id", "digest", "cell"],
+            "properties": {
+                "notebook_id": _object_id(),
+                "digest": {"bsonType": "string"},
+                "cell": {"bsonType": "object"},
+            },
+        }
+    },
+    "notebook_revisions": {
+        "$jsonSchema": {
+            "bsonType": "object",
+            "required": ["notebook_id", "revision", "base", "created_at", "skeleton", "order", "cells"],
+            "properties": {
+                "notebook_id": _object_id(),
+                "revision": {"bsonType": "int", "minimum": 1},
+                "base": {"bsonType": "int", "minimum": 1},
+                "created_at": {"bsonType": "date"},
+                "skeleton": {"bsonType": "object"},
+                "order": {"bsonType": "array"},
+                "cells": {"bsonType": "object"},
+                "parts": {"bsonType": "int", "minimum": 1},
+            },
+        }
+    },
+    "notebook_revision_cells": {
+        "$jsonSchema": {
+            "bsonType": "object",
+            "required": ["notebook_id", "revision", "part", "cells"],
+            "properties": {
+                "notebook_id": _object_id(),
+                "revision": {"bsonType": "int", "minimum": 1},
+                "part": {"bsonType": "int", "minimum": 1},
+                "cells": {"bsonType": "object"},
             },
         }
     },
@@ -87,6 +150,81 @@ COLLECTION_VALIDATORS = {
         "$jsonSchema": {"bsonType": "object", "required": ["user_id", "expires_at"],
                         "properties": {"user_id": _object_id(), "expires_at": {"bsonType": "date"}}}
     },
+    "rendered_pages": {
+        "$jsonSchema": {
+            "bsonType": "object",
+            "required": ["notebook_id", "revision", "template", "html", "rendered_at"],
+            "properties": {
+                "revision": {"bsonType": "int", "minimum": 0},
+                "template": {"bsonType": "string"},
+                "html": {"bsonType": "string"},
+                "rendered_at": {"bsonType": "date"},
+            },
+        }
+    },
+    "render_jobs": {
+        "$jsonSchema": {
+            "bsonType": "object",
+            "required": ["notebook_id", "status", "enqueued_at", "attempts"],
+            "properties": {
+                "notebook_id": _object_id(),
+                "status": {"enum": ["queued", "running", "failed"]},
+                "enqueued_at": {"bsonType": "date"},
+                "attempts": {"bsonType": "int", "minimum": 0},
+            },
+        }
+    },
+    "search_documents": {
+        "$jsonSchema": {
+            "bsonType": "object",
+            "required": ["revision", "length"],
+            "properties": {
+                "_id": _object_id(),
+                "revision": {"bsonType": "int", "minimum": 1},
+                "length": {"bsonType": ["int", "long"], "minimum": 0},
+            },
+        }
+    },
+    "search_postings": {
+        "$jsonSchema": {
+            "bsonType": "object",
+            "required": ["term", "notebook_id", "revision", "tf", "length"],
+            "properties": {
+                "term": {"bsonType": "string"},
+                "notebook_id": _object_id(),
+                "revision": {"bsonType": "int", "minimum": 1},
+                "tf": {"bsonType": "int", "minimum": 1},
+                "length": {"bsonType": ["int", "long"], "minimum": 1},
+            },
+        }
+    },
+    "facet_counts": {
+        "$jsonSchema": {
+            "bsonType": "object",
+            "required": ["facet", "value", "scope", "count"],
+            "properties": {
+                "facet": {"enum": ["tag", "topic"]},
+                "count": {"bsonType": ["int", "long"]},
+            },
+        }
+    },
+    "public_feed": {
+        "$jsonSchema": {
+            "bsonType": "object",
+            "required": ["revision", "title", "slug", "author", "summary", "published_at",
+                         "updated_at"],
+            "properties": {
+                "_id": _object_id(),
+                "revision": {"bsonType": "int", "minimum": 1},
+                "title": {"bsonType": "string"},
+                "slug": {"bsonType": "string"},
+                "author": {"bsonType": "string"},
+                "summary": {"bsonType": "string"},
+                "published_at": {"bsonType": "date"},
+                "updated_at": {"bsonType": "date"},
+            },
+        }
+    },
     "mcp_tokens": {
         "$jsonSchema": {
             "bsonType": "object",
@@ -108,13 +246,33 @@ INDEXES = {
     "users": [
         ([('username_normalized', ASCENDING)], {"name": "uq_users_username_normalized", "unique": True}),
         ([('status', ASCENDING), ('created_at', DESCENDING)], {"name": "ix_users_status_created"}),
+        # Polled by the invalidation bus when change streams are unavailable.
+        ([('updated_at', ASCENDING)], {"name": "ix_users_updated", "sparse": True}),
     ],
     "notebooks": [
         ([('slug', ASCENDING)], {"name": "uq_notebooks_slug", "unique": True}),
         ([('owner_id', ASCENDING), ('updated_at', DESCENDING)], {"name": "ix_notebooks_owner_updated"}),
+        ([('updated_at', DESCENDING)], {"name": "ix_notebooks_updated"}),
         ([('visibility', ASCENDING), ('updated_at', DESCENDING)], {"name": "ix_notebooks_visibility_updated"}),
         ([('allowed_user_ids', ASCENDING)], {"name": "ix_notebooks_allowed_users"}),
         ([('topic_ids', ASCENDING)], {"name": "ix_notebooks_topics"}),
+        ([('tags', ASCENDING), ('updated_at', DESCENDING)], {"name": "ix_notebooks_tags_updated"}),
+        # Title completion reads the newest titles with a prefix in index order.
+        ([('title_prefixes', ASCENDING), ('updated_at', DESCENDING)],
+         {"name": "ix_notebooks_title_prefix_updated"}),
+        # /blobs/<digest> looks for a notebook the viewer may read that uses the blob.
+        ([('blob_digests', ASCENDING)], {"name": "ix_notebooks_blob_digests", "sparse": True}),
+    ],
+    "notebook_cells": [
+        ([('notebook_id', ASCENDING)], {"name": "ix_notebook_cells_notebook"}),
+    ],
+    "notebook_revisions": [
+        ([('notebook_id', ASCENDING), ('revision', DESCENDING)],
+         {"name": "uq_notebook_revisions_revision", "unique": True}),
+    ],
+    "notebook_revision_cells": [
+        ([('notebook_id', ASCENDING), ('revision', ASCENDING), ('part', ASCENDING)],
+         {"name": "uq_notebook_revision_cells_part", "unique": True}),
     ],
     "audit_events": [
         ([('occurred_at', DESCENDING), ('event_type', ASCENDING)], {"name": "ix_audit_time_type"}),
@@ -128,6 +286,33 @@ INDEXES = {
     "editor_launches": [
         ([('expires_at', ASCENDING)], {"name": "ttl_editor_launch", "expireAfterSeconds": 0}),
     ],
+    "rendered_pages": [
+        ([('notebook_id', ASCENDING)], {"name": "ix_rendered_pages_notebook"}),
+        # Superseded revisions are never read again; let MongoDB discard them.
+        ([('rendered_at', ASCENDING)], {"name": "ttl_rendered_pages", "expireAfterSeconds": 7 * 86400}),
+    ],
+    "render_jobs": [
+        ([('notebook_id', ASCENDING)], {"name": "uq_render_jobs_notebook", "unique": True}),
+        ([('status', ASCENDING), ('enqueued_at', ASCENDING)], {"name": "ix_render_jobs_status_enqueued"}),
+        ([('finished_at', ASCENDING)], {"name": "ttl_render_jobs_finished", "expireAfterSeconds": 7 * 86400}),
+    ],
+    "search_postings": [
+        # Query terms read their postings most frequent first.
+        ([('term', ASCENDING), ('tf', DESCENDING)], {"name": "ix_search_postings_term_tf"}),
+        ([('notebook_id', ASCENDING), ('revision', ASCENDING)],
+         {"name": "ix_search_postings_notebook"}),
+    ],
+    "facet_counts": [
+        ([('facet', ASCENDING), ('scope', ASCENDING), ('value', ASCENDING)],
+         {"name": "uq_facet_counts_key", "unique": True}),
+        ([('facet', ASCENDING), ('scope', ASCENDING), ('count', DESCENDING)],
+         {"name": "ix_facet_counts_scope_count"}),
+    ],
+    "public_feed": [
+        # Pages of the feed are read in pagination.ORDER.
+        ([('updated_at', DESCENDING), ('_id', DESCENDING)], {"name": "ix_public_feed_updated"}),
+        ([('owner_id', ASCENDING)], {"name": "ix_public_feed_owner"}),
+    ],
     "mcp_tokens": [
         ([('token_hash', ASCENDING)], {"name": "uq_mcp_token_hash", "unique": True}),
         ([('user_id', ASCENDING), ('created_at', DESCENDING)], {"name": "ix_mcp_user_created"}),
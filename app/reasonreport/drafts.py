@@ -0,0 +1,103 @@
+"""Removal of stored drafts that were never published.
+
+Older versions inserted a private notebook titled ``""`` with the slug
+``notebook-<id>`` on every ``/create`` visit and every registration.
+:class:`DraftSweeper` deletes these placeholders once they are older than a
+configurable age, in batches, so a large backlog does not turn into one
+long-running delete.  Copies of notebooks (see ``models.clone_notebook``)
+have the same shape until their first publish and carry ``cloned_from``.
+They are the user's work in progress, so they get a longer age of their own
+and are only swept while they were never saved.
+"""
+
+from datetime import datetime, timedelta, timezone
+import logging
+import threading
+
+from pymongo.errors import PyMongoError
+
+import cell_store
+
+logger = logging.getLogger('reasonreport.drafts')
+
+SWEEP_BATCH_SIZE = 500
+CLONE_MAX_AGE = 30 * 86400
+
+
+def placeholder_filter(max_age, clone_max_age=CLONE_MAX_AGE):
+    """Return the query matching placeholders untouched for ``max_age`` seconds
+    and copies untouched for ``clone_max_age`` seconds.
+
+    The anchored slug prefix lets MongoDB scan ``uq_notebooks_slug``; a
+    draft that was published got a title and a later revision.
+    """
+    now = datetime.now(timezone.utc)
+    return {
+        'slug': {'$regex': '^notebook-[0-9a-f]{24}$'},
+        'title': '',
+        'revision': 1,
+        '$or': [
+            {'cloned_from': {'$exists': False},
+             'created_at': {'$lt': now - timedelta(seconds=max_age)}},
+            {'cloned_from': {'$exists': True},
+             'created_at': {'$lt': now - timedelta(seconds=clone_max_age)}},
+        ],
+    }
+
+
+def sweep_placeholders(db, max_age, batch_size=SWEEP_BATCH_SIZE, clone_max_age=CLONE_MAX_AGE):
+    """Delete untouched drafts older than their age limit, with their chunks.
+
+    Each batch re-applies the filter to the ids it read, so a draft published
+    in the meantime is kept.  Returns the number deleted.
+    """
+    query = placeholder_filter(max_age, clone_max_age)
+    deleted = 0
+    while True:
+        ids = [document['_id'] for document in
+               db.notebooks.find(query, {'_id': 1}).limit(batch_size)]
+        if not ids:
+            return deleted
+        deleted += db.notebooks.delete_many({**query, '_id': {'$in': ids}}).deleted_count
+        kept = {document['_id'] for document in
+                db.notebooks.find({'_id': {'$in': ids}}, {'_id': 1})}
+        cell_store.discard_notebooks(db, [notebook_id for notebook_id in ids
+                                          if notebook_id not in kept])
+        if len(ids) < batch_size:
+            return deleted
+
+
+class DraftSweeper:
+    """Run :func:`sweep_placeholders` every ``interval`` seconds."""
+
+    def __init__(self, database, max_age, interval=3600.0, batch_size=SWEEP_BATCH_SIZE,
+                 clone_max_age=CLONE_MAX_AGE):
+        self.db = database
+        self.max_age = max_age
+        self.interval = interval
+        self.batch_size = batch_size
+        self.clone_max_age = clone_max_age
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='draft-sweeper', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                deleted = sweep_placeholders(
+                    self.db, self.max_age, self.batch_size, self.clone_max_age
+                )
+            except PyMongoError:
+                logger.warning('Sweeping unpublished drafts failed', exc_info=True)
+            else:
+                if deleted:
+                    logger.info('Deleted %s unpublished drafts', deleted)
+            self._stop.wait(self.interval)
@@ -10,7 +10,17 @@ from bson.objectid import ObjectId
 from flask import request
 from flask_restful import Resource
 
-from models import mongo
+from access import access_filter, user_key
+from blob_store import notebook_blobs
+from cell_store import CONTENT_FIELDS, WITHOUT_CONTENT, load_notebook
+from conditional import (
+    is_conditional, is_not_modified, not_modified_response, notebook_etag, validator_headers
+)
+from models import mongo, resolve_usernames
+from pagination import find_page
+from search import search
+from summaries import SUMMARY_FIELDS
+from titles import complete
 from utils import token_required
 
 SESSION_TTL_SECONDS = 900
@@ -18,6 +28,13 @@ LAUNCH_TTL_SECONDS = 60
 EDITOR_HEADER = 'X-ReasonReport-Editor'
 TOKEN_HEADER = 'X-ReasonReport-Editor-Token'
 QUERY_FIELDS = {'_id', 'title', 'slug', 'owner_id', 'is_public'}
+# Listings never need the notebook body, which dominates document size.
+SUMMARY_PROJECTION = {
+    field: 1 for field in
+    ('title', 'slug', 'owner_id', 'created_at', 'updated_at', 'visibility', *SUMMARY_FIELDS)
+}
+OVERVIEW_PROJECTION = {'title': 1, 'slug': 1, 'owner_id': 1}
+TITLE_PROJECTION = {'title': 1, 'slug': 1}
 
 
 def _digest(token):
@@ -76,32 +93,46 @@ def editor_session_required(function):
     return decorated
 
 
-def _access_filter(user_id):
-    return {'$or': [
-        {'owner_id': str(user_id)},
-        # Read compatibility until every legacy document has been saved.
-        {'author': str(user_id)},
-        {'visibility': 'public'},
-        {'allowed_user_ids': ObjectId(user_id)},
-        {'is_public': True},
-    ]}
+def _owner_id(document):
+    return str(document.get('owner_id', ''))
 
 
-def _summary(document):
-    owner_id = str(document.get('owner_id', document.get('author', '')))
-    owner = (mongo.db.users.find_one({'_id': ObjectId(owner_id)})
-             if ObjectId.is_valid(owner_id) else None)
-    created_at = document.get('created_at', document.get('date'))
+def _summaries(documents):
+    """Summarize documents, resolving all of their authors in one query."""
+    documents = list(documents)
+    authors = resolve_usernames([_owner_id(document) for document in documents])
+    return [_summary(document, authors) for document in documents]
+
+
+def _page(query, limit, cursor):
+    """Respond with one page of summaries and the cursor of the next one."""
+    try:
+        documents, next_cursor = find_page(
+            mongo.db.notebooks, query, SUMMARY_PROJECTION, limit, cursor
+        )
+    except ValueError as error:
+        return {'message': str(error)}, 400
+    return {'documents': _summaries(documents), 'next_cursor': next_cursor}, 200
+
+
+def _summary(document, authors):
+    owner_id = _owner_id(document)
+    created_at = document.get('created_at')
     updated_at = document.get('updated_at', created_at)
     return {
         'id': str(document['_id']),
         'title': document.get('title', ''),
         'slug': document.get('slug', ''),
         'owner_id': owner_id,
-        'author': owner.get('username', 'Unknown') if owner else 'Unknown',
+        'author': authors.get(owner_id, 'Unknown'),
         'created_at': created_at.isoformat() if hasattr(created_at, 'isoformat') else created_at,
         'updated_at': updated_at.isoformat() if hasattr(updated_at, 'isoformat') else updated_at,
-        'is_public': bool(document.get('is_public', False)),
+        'is_public': document.get('visibility') == 'public',
+        'summary': document.get('summary', ''),
+        'image_url': (document.get('first_image') or {}).get('url'),
+        'cell_count': document.get('cell_count'),
+        'word_count': document.get('word_count'),
+        'code_languages': document.get('code_languages', []),
     }
 
 
@@ -134,8 +165,7 @@ class EditorNotebookList(Resource):
     @editor_session_required
     def get(self):
         limit = min(max(request.args.get('limit', 50, type=int), 1), 100)
-        documents = mongo.db.notebooks.find(_access_filter(request.user['id'])).sort('updated_at', -1).limit(limit)
-        return {'documents': [_summary(document) for document in documents]}, 200
+        return _page(access_filter(request.user['id']), limit, request.args.get('cursor'))
 
 
 class EditorNotebookRead(Resource):
@@ -144,14 +174,25 @@ class EditorNotebookRead(Resource):
     def get(self, notebook_id):
         if not ObjectId.is_valid(notebook_id):
             return {'message': 'Notebook not found'}, 404
-        document = mongo.db.notebooks.find_one({
-            '$and': [{'_id': ObjectId(notebook_id)}, _access_filter(request.user['id'])]
-        })
+        document = mongo.db.notebooks.find_one(
+            {'$and': [{'_id': ObjectId(notebook_id)}, access_filter(request.user['id'])]},
+            WITHOUT_CONTENT if is_conditional() else None,
+        )
         if not document:
             return {'message': 'Notebook not found'}, 404
-        result = _summary(document)
-        result['notebook'] = document['notebook']
-        return {'document': result}, 200
+        # The summary names the author, who may be renamed without a new revision.
+        author = resolve_usernames([_owner_id(document)]).get(_owner_id(document), 'Unknown')
+        etag = notebook_etag(document, author)
+        updated_at = document.get('updated_at')
+        if is_not_modified(etag, updated_at):
+            return not_modified_response(etag, updated_at)
+        if is_conditional():
+            document.update(
+                mongo.db.notebooks.find_one({'_id': document['_id']}, CONTENT_FIELDS) or {}
+            )
+        [result] = _summaries([document])
+        result['notebook'] = notebook_blobs.inline(load_notebook(mongo.db, document))
+        return {'document': result}, 200, validator_headers(etag, updated_at)
 
 
 class EditorNotebookQuery(Resource):
@@ -170,13 +211,50 @@ class EditorNotebookQuery(Resource):
                 if not ObjectId.is_valid(str(value)):
                     return {'documents': []}, 200
                 value = ObjectId(value)
+            elif key == 'owner_id':
+                value = user_key(value)
+            elif key == 'is_public':
+                # Public notebooks are recognized by their visibility alone.
+                key, value = 'visibility', 'public' if value else {'$ne': 'public'}
             query[key] = value
         limit = payload.get('limit', 50)
         if not isinstance(limit, int):
             return {'message': 'Limit must be an integer'}, 400
         limit = min(max(limit, 1), 100)
-        documents = mongo.db.notebooks.find({'$and': [query, _access_filter(request.user['id'])]}).sort('updated_at', -1).limit(limit)
-        return {'documents': [_summary(document) for document in documents]}, 200
+        return _page(
+            {'$and': [query, access_filter(request.user['id'])]}, limit, payload.get('cursor')
+        )
+
+
+class EditorNotebookSearch(Resource):
+    @token_required
+    @editor_session_required
+    def get(self):
+        query = request.args.get('q', '').strip()[:200]
+        if not query:
+            return {'message': 'Search text is missing'}, 400
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        results = search(mongo.db, request.user['id'], query, SUMMARY_PROJECTION, limit)
+        summaries = _summaries(document for document, _ in results)
+        for summary, (_, score) in zip(summaries, results):
+            summary['score'] = round(score, 4)
+        return {'documents': summaries}, 200
+
+
+class EditorTitleCompletion(Resource):
+    @token_required
+    @editor_session_required
+    def get(self):
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+        documents = complete(
+            mongo.db, request.user['id'], request.args.get('prefix', '')[:200],
+            TITLE_PROJECTION, limit,
+        )
+        return {'documents': [{
+            'id': str(document['_id']),
+            'title': document.get('title', ''),
+            'slug': document.get('slug', ''),
+        } for document in documents]}, 200
 
 
 class EditorAdminOverview(Resource):
@@ -186,23 +264,15 @@ class EditorAdminOverview(Resource):
         if request.user.get('role') != 'admin':
             return {'message': 'Administrator access required'}, 403
 
-        documents = list(mongo.db.notebooks.find({}).sort('updated_at', -1).limit(10))
-        author_ids = {
-            document.get('owner_id', document.get('author')) for document in documents
-        }
-        author_ids.discard(None)
-        authors = {
-            str(user['_id']): user.get('username', 'Unknown')
-            for user in mongo.db.users.find({'_id': {'$in': [
-                ObjectId(author_id) for author_id in author_ids
-                if ObjectId.is_valid(str(author_id))
-            ]}})
-        }
+        documents = list(
+            mongo.db.notebooks.find({}, OVERVIEW_PROJECTION).sort('updated_at', -1).limit(10)
+        )
+        authors = resolve_usernames([_owner_id(document) for document in documents])
         return {
             'user_count': mongo.db.users.count_documents({}),
             'documents': [{
                 'title': document.get('title', ''),
                 'slug': document.get('slug', ''),
-                'author': authors.get(str(document.get('owner_id', document.get('author'))), 'Unknown'),
+                'author': authors.get(_owner_id(document), 'Unknown'),
             } for document in documents],
         }, 200
@@ -0,0 +1,92 @@
+"""Notebook counts per tag and per topic, maintained as notebooks change.
+
+``facet_counts`` holds one document per facet (``tag`` or ``topic``), value
+and scope: ``public`` counts the public notebooks with the value and an owner
+id counts all notebooks of that owner.  Every create, update and delete
+passes the notebook's previous and new state to :func:`record_change`, which
+applies the difference with ``$inc``, so browsing by tag or topic reads a few
+small documents from ``ix_facet_counts_scope_count`` instead of grouping the
+``notebooks`` collection.  :func:`rebuild` recomputes the counts from scratch
+for existing databases.
+"""
+
+from collections import Counter
+
+from pymongo import DESCENDING, DeleteOne, ReplaceOne, UpdateOne
+
+FACETS = {'tag': 'tags', 'topic': 'topic_ids'}
+# What record_change needs of a notebook.
+FACET_FIELDS = {field: 1 for field in ('owner_id', 'visibility', *FACETS.values())}
+PUBLIC = 'public'
+
+
+def facet_keys(notebook):
+    """Return the ``(facet, value, scope)`` counters ``notebook`` adds to."""
+    if not notebook:
+        return set()
+    scopes = [notebook.get('owner_id')]
+    if notebook.get('visibility') == 'public':
+        scopes.append(PUBLIC)
+    return {(facet, value, scope)
+            for facet, field in FACETS.items()
+            for value in notebook.get(field) or []
+            for scope in scopes}
+
+
+def _key(facet, value, scope):
+    return {'facet': facet, 'value': value, 'scope': scope}
+
+
+def apply_deltas(db, deltas):
+    """Add ``deltas``, a mapping of counter keys to increments, to the counts."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    db.facet_counts.bulk_write([
+        UpdateOne(_key(*key), {'$inc': {'count': delta}}, upsert=True)
+        for key, delta in deltas.items()
+    ], ordered=False)
+    emptied = [_key(*key) for key, delta in deltas.items() if delta < 0]
+    if emptied:
+        db.facet_counts.delete_many({'$or': emptied, 'count': {'$lte': 0}})
+
+
+def record_change(db, before, after):
+    """Count the change of a notebook from ``before`` to ``after``.
+
+    ``before`` is ``None`` for a created notebook and ``after`` for a deleted
+    one.
+    """
+    old, new = facet_keys(before), facet_keys(after)
+    apply_deltas(db, {**{key: -1 for key in old - new}, **{key: 1 for key in new - old}})
+
+
+def record_deletions(db, notebooks):
+    """Count the deletion of several notebooks."""
+    deltas = Counter()
+    for notebook in notebooks:
+        deltas.update(facet_keys(notebook))
+    apply_deltas(db, {key: -count for key, count in deltas.items()})
+
+
+def counts(db, facet, scope=PUBLIC, limit=50):
+    """Return ``[(value, count)]`` of a facet in ``scope``, most frequent first."""
+    return [(document['value'], document['count']) for document in db.facet_counts.find(
+        {'facet': facet, 'scope': scope, 'count': {'$gt': 0}}, {'_id': 0, 'value': 1, 'count': 1}
+    ).sort('count', DESCENDING).limit(limit)]
+
+
+def rebuild(db):
+    """Recompute every count from ``notebooks`` and return how many there are."""
+    totals = Counter()
+    for notebook in db.notebooks.find({}, FACET_FIELDS):
+        totals.update(facet_keys(notebook))
+    operations = [ReplaceOne(_key(*key), {**_key(*key), 'count': count}, upsert=True)
+                  for key, count in totals.items()]
+    current = {(document['facet'], document['value'], document['scope']): document['_id']
+               for document in db.facet_counts.find({}, {'facet': 1, 'value': 1, 'scope': 1})}
+    operations += [DeleteOne({'_id': document_id})
+                   for key, document_id in current.items() if key not in totals]
+    if operations:
+        db.facet_counts.bulk_write(operations, ordered=False)
+    return len(totals)
@@ -0,0 +1,122 @@
+"""The newest public notebooks, kept ready to list.
+
+``public_feed`` holds one entry per public notebook among the
+:data:`FEED_LENGTH` most recently updated, with what a listing shows already
+computed: title, slug, author name and a plain-text summary.  Every save
+passes the stored notebook to :func:`record`, which writes its entry when it
+is public and removes it otherwise, so the home page, ``/latest`` and the Atom
+feed read a page of small entries from ``ix_public_feed_updated`` and never
+query ``notebooks``.  Entries carry the revision they were built from and a
+save never replaces a newer one.
+
+The feed only ever loses entries to deletions and unpublishing until newer
+publications refill it; :func:`rebuild` recomputes it from ``notebooks`` and
+runs with the schema migration on databases that have no feed yet.
+"""
+
+import re
+
+from bson.objectid import ObjectId
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from cell_store import CONTENT_FIELDS, load_notebook
+from pagination import ORDER
+from search import notebook_text
+
+FEED_LENGTH = 500
+SUMMARY_LENGTH = 300
+WHITESPACE = re.compile(r'\s+')
+# What record needs of a stored notebook besides its body.
+FEED_SOURCE_FIELDS = {
+    field: 1 for field in ('owner_id', 'visibility', 'revision', 'title', 'slug', 'summary',
+                           'created_at', 'updated_at')
+}
+
+
+def summary_text(document, notebook=None):
+    """Return the summary of a notebook as at most :data:`SUMMARY_LENGTH` characters of text."""
+    text = document.get('summary') or notebook_text(notebook)[0]
+    text = WHITESPACE.sub(' ', text).strip()
+    if len(text) > SUMMARY_LENGTH:
+        text = text[:SUMMARY_LENGTH - 1].rsplit(' ', 1)[0] + '…'
+    return text
+
+
+def author_name(db, owner_id):
+    user = db.users.find_one({'_id': owner_id}, {'username': 1}) if owner_id else None
+    return (user or {}).get('username', 'Unknown')
+
+
+def entry(db, document, notebook=None, author=None):
+    """Return the feed entry of a stored public notebook."""
+    return {
+        'revision': document['revision'],
+        'title': document.get('title') or document['slug'],
+        'slug': document['slug'],
+        'owner_id': document.get('owner_id'),
+        'author': author or author_name(db, document.get('owner_id')),
+        'summary': summary_text(document, notebook),
+        'published_at': document.get('created_at') or document['updated_at'],
+        'updated_at': document['updated_at'],
+    }
+
+
+def record(db, document, notebook=None, author=None):
+    """Bring the entry of a saved notebook up to date.
+
+    ``document`` holds at least :data:`FEED_SOURCE_FIELDS` as stored by the
+    save and ``notebook`` its body, from which the summary is taken when the
+    document has none.  Returns whether the feed was written.
+    """
+    notebook_id = ObjectId(document['_id'])
+    newer = {'_id': notebook_id, 'revision': {'$lt': document['revision']}}
+    if document.get('visibility') != 'public':
+        return db.public_feed.delete_one(newer).deleted_count > 0
+    try:
+        db.public_feed.update_one(
+            newer, {'$set': entry(db, document, notebook, author)}, upsert=True
+        )
+    except DuplicateKeyError:  # the entry is of a later revision
+        return False
+    trim(db)
+    return True
+
+
+def trim(db):
+    """Drop the entries after the newest :data:`FEED_LENGTH`."""
+    boundary = next(iter(db.public_feed.find({}, {'updated_at': 1}).sort(ORDER)
+                         .skip(FEED_LENGTH - 1).limit(1)), None)
+    if boundary:
+        db.public_feed.delete_many({'$or': [
+            {'updated_at': {'$lt': boundary['updated_at']}},
+            {'updated_at': boundary['updated_at'], '_id': {'$lt': boundary['_id']}},
+        ]})
+
+
+def discard(db, notebook_ids):
+    """Remove deleted notebooks from the feed."""
+    notebook_ids = [ObjectId(notebook_id) for notebook_id in notebook_ids]
+    if notebook_ids:
+        db.public_feed.delete_many({'_id': {'$in': notebook_ids}})
+
+
+def rename_author(db, owner_id, username):
+    """Show a user's new name on their entries."""
+    db.public_feed.update_many({'owner_id': owner_id}, {'$set': {'author': username}})
+
+
+def rebuild(db):
+    """Recompute the feed from ``notebooks`` and return its length."""
+    entries = []
+    for document in db.notebooks.find({'visibility': 'public'}, FEED_SOURCE_FIELDS) \
+            .sort('updated_at', DESCENDING).limit(FEED_LENGTH):
+        notebook = None
+        if not document.get('summary'):
+            stored = db.notebooks.find_one({'_id': document['_id']}, CONTENT_FIELDS)
+            notebook = load_notebook(db, stored) if stored else None
+        entries.append({'_id': document['_id'], **entry(db, document, notebook)})
+    db.public_feed.delete_many({})
+    if entries:
+        db.public_feed.insert_many(entries)
+    return len(entries)
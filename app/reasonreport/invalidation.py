@@ -0,0 +1,105 @@
+"""Propagate changes made by other processes to this process's caches.
+
+The MCP server, maintenance scripts and other web workers write to MongoDB
+directly, so a worker cannot rely on its own write paths to invalidate its
+caches.  :class:`InvalidationBus` tails a change stream on the subscribed
+collections and calls each subscriber with the changed document id.
+
+Change streams need a replica set (a single-node one is enough).  On a
+standalone server the bus polls the subscribed collections for recently
+``updated_at`` documents instead; deletions are then only noticed through the
+caches' own expiry and existence checks.
+"""
+
+from datetime import datetime, timezone
+import logging
+import threading
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger('reasonreport.invalidation')
+
+CHANGE_OPERATIONS = ['insert', 'update', 'replace', 'delete']
+# The resume token has fallen off the oplog; events may have been missed.
+CHANGE_STREAM_HISTORY_LOST = 286
+
+
+class InvalidationBus:
+    """Call subscribers with the id of every changed document."""
+
+    def __init__(self, database, poll_interval=5.0):
+        self.db = database
+        self.poll_interval = poll_interval
+        self.subscribers = {}
+        self._resume_token = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, collection, callback):
+        self.subscribers.setdefault(collection, []).append(callback)
+
+    def publish(self, collection, document_id):
+        for callback in self.subscribers.get(collection, []):
+            try:
+                callback(document_id)
+            except Exception:
+                logger.exception('Invalidating %s %s failed', collection, document_id)
+
+    def start(self):
+        if self._thread is None and self.subscribers:
+            self._thread = threading.Thread(
+                target=self.run, name='invalidation-bus', daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.watch()
+            except OperationFailure as error:
+                if error.code == CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning('Change stream history lost; resuming from now')
+                    self._resume_token = None
+                    continue
+                logger.info('Change streams unavailable (%s); polling instead', error)
+                self.poll()
+            except PyMongoError:
+                logger.warning('Change stream interrupted', exc_info=True)
+                self._stop.wait(self.poll_interval)
+
+    def watch(self):
+        pipeline = [{'$match': {
+            'ns.coll': {'$in': list(self.subscribers)},
+            'operationType': {'$in': CHANGE_OPERATIONS},
+        }}]
+        with self.db.watch(
+            pipeline, resume_after=self._resume_token, max_await_time_ms=1000
+        ) as stream:
+            while not self._stop.is_set():
+                change = stream.try_next()
+                self._resume_token = stream.resume_token
+                if change is not None:
+                    self.publish(change['ns']['coll'], change['documentKey']['_id'])
+
+    def poll(self):
+        since = {collection: datetime.now(timezone.utc) for collection in self.subscribers}
+        while not self._stop.wait(self.poll_interval):
+            for collection in self.subscribers:
+                try:
+                    since[collection] = self.poll_once(collection, since[collection])
+                except PyMongoError:
+                    logger.warning('Polling %s for changes failed', collection, exc_info=True)
+
+    def poll_once(self, collection, since):
+        """Publish documents updated after ``since``; return the new high-water mark."""
+        changed = self.db[collection].find(
+            {'updated_at': {'$gt': since}}, {'updated_at': 1}
+        ).sort('updated_at', 1)
+        for document in changed:
+            self.publish(collection, document['_id'])
+            since = document['updated_at']
+        return since
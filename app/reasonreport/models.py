@@ -1,13 +1,33 @@
 # models.py
+from flask import current_app, g, has_app_context
 from flask_pymongo import PyMongo
+from pymongo import ReturnDocument
 from werkzeug.security import generate_password_hash
 from bson.objectid import ObjectId
 from slugify import slugify
 import nbformat
-from nbconvert import HTMLExporter
 from datetime import datetime, timezone
+import hashlib
+import json
+import re
+import cell_store
+import facets
+import feed
+import revisions
+import search
+from access import owner_filter, user_key
+from slugs import allocate_slug, write_with_slug
+from summaries import SUMMARY_FIELDS, summary_fields
+from titles import title_fields
+from blob_store import blob_digests, notebook_blobs
+from caching import LRUCache
+from render_cache import page_cache
 
 mongo = PyMongo()
+# User records by id, configured from USER_CACHE_* when the app starts.
+user_cache = LRUCache(max_entries=1024, ttl=30)
+# Usernames by user id, for pages and validators naming other users.
+username_cache = LRUCache(max_entries=1024, ttl=30)
 USER_ROLES = frozenset({'admin', 'editor', 'user'})
 
 # User Operations
@@ -46,7 +66,44 @@ def get_user_by_username(username):
 def get_user_by_id(user_id):
     if not ObjectId.is_valid(str(user_id)):
         return None
-    return mongo.db.users.find_one({'_id': ObjectId(user_id)})
+    user = user_cache.get(str(user_id))
+    if user is None:
+        user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
+        if user:
+            user_cache.set(str(user_id), user)
+    # Callers may modify the record; keep the cached copy pristine.
+    return dict(user) if user else None
+
+def invalidate_user(user_id):
+    """Forget cached data about a user after it has been changed or deleted."""
+    user_cache.pop(str(user_id))
+    username_cache.pop(str(user_id))
+    if has_app_context():
+        g.get('usernames', {}).pop(str(user_id), None)
+
+def resolve_usernames(user_ids):
+    """
+    Return ``{str(user_id): username}`` for the given ids.
+
+    Names are taken from the process caches when present; all other ids not
+    yet seen in the current request are fetched with a single ``$in`` query.
+    Unknown or invalid ids are left out of the result.
+    """
+    memo = g.setdefault('usernames', {}) if has_app_context() else {}
+    keys = {str(user_id) for user_id in user_ids if user_id is not None}
+    for key in keys - memo.keys():
+        if (username := username_cache.get(key)) is not None:
+            memo[key] = username
+        elif (user := user_cache.get(key)) is not None:
+            memo[key] = user.get('username', 'Unknown')
+    missing = [ObjectId(key) for key in keys - memo.keys() if ObjectId.is_valid(key)]
+    if missing:
+        for user in mongo.db.users.find({'_id': {'$in': missing}}, {'username': 1}):
+            memo[str(user['_id'])] = user.get('username', 'Unknown')
+            username_cache.set(str(user['_id']), memo[str(user['_id'])])
+    for key in keys - memo.keys():
+        memo[key] = None  # remember misses too
+    return {key: memo[key] for key in keys if memo[key] is not None}
 
 def update_user(user_id, update_fields):
     if not ObjectId.is_valid(str(user_id)):
@@ -55,43 +112,61 @@ def update_user(user_id, update_fields):
         raise ValueError(f"Role must be one of: {', '.join(sorted(USER_ROLES))}")
     if 'username' in update_fields:
         update_fields['username_normalized'] = update_fields['username'].strip().casefold()
+    update_fields['updated_at'] = datetime.now(timezone.utc)
     result = mongo.db.users.update_one({'_id': ObjectId(user_id)}, {'$set': update_fields})
+    invalidate_user(user_id)
+    if result.matched_count and 'username' in update_fields:
+        feed.rename_author(mongo.db, user_key(user_id), update_fields['username'])
     return result.matched_count > 0
 
 def delete_user(user_id):
     if not ObjectId.is_valid(str(user_id)):
         return False
     result = mongo.db.users.delete_one({'_id': ObjectId(user_id)})
-    mongo.db.notebooks.delete_many({'$or': [
-        {'owner_id': str(user_id)}, {'author': str(user_id)}
-    ]})
+    invalidate_user(user_id)
+    owned = owner_filter(user_id)
+    notebooks = list(mongo.db.notebooks.find(owned, facets.FACET_FIELDS))
+    notebook_ids = [notebook['_id'] for notebook in notebooks]
+    mongo.db.notebooks.delete_many(owned)
+    cell_store.discard_notebooks(mongo.db, notebook_ids)
+    revisions.discard_history(mongo.db, notebook_ids)
+    search.discard(mongo.db, notebook_ids)
+    facets.record_deletions(mongo.db, notebooks)
+    feed.discard(mongo.db, notebook_ids)
     return result.deleted_count > 0
 
 
 # Notebook Operations
 DEFAULT_TITLE = "Please enter the title here"
 SLUG_TITLE_MAX_LENGTH = 50
-
-
-def create_notebook(author_id, author_name=None):
-    nb = create_notebook_content(author_id, author_name)
-    now = datetime.now(timezone.utc)
-    notebook_id = ObjectId()
-    notebook = {
-        '_id': notebook_id,
-        'notebook': nb,
-        'owner_id': str(author_id),
-        'created_at': now,
-        'updated_at': now,
-        'title': "",
-        'slug': f"notebook-{notebook_id}",
-        'visibility': 'private',
-        'allowed_user_ids': [],
-        'topic_ids': [],
-        'revision': 1,
-    }
-    mongo.db.notebooks.insert_one(notebook)
-    return str(notebook_id)
+# Stored fields a save needs besides the new notebook content.
+PUBLICATION_FIELDS = {
+    field: 1 for field in ('owner_id', 'author', 'slug', 'revision', 'created_at', 'date',
+                           'visibility', 'allowed_user_ids', 'topic_ids', 'tags', 'content_hash',
+                           'summary')
+}
+# Notebooks of at least this many bytes of BSON keep their cells in
+# notebook_cells; configured from CELL_CHUNK_THRESHOLD_BYTES.
+DEFAULT_CHUNK_THRESHOLD = 1 << 20
+# Everything a publication can change; equal hashes mean a save is a no-op.
+CONTENT_HASH_FIELDS = ('notebook', 'visibility', 'allowed_user_ids', 'topic_ids')
+# What a cell-level save reads to re-derive the title; outputs and attachments
+# stay in MongoDB.
+CELL_OUTLINE_FIELDS = {
+    field: 1 for field in ('notebook.cells.id', 'notebook.cells.cell_type',
+                           'notebook.cells.source', 'notebook.cells.metadata.type',
+                           'notebook.metadata', 'notebook.nbformat', 'notebook.nbformat_minor')
+}
+# The same outline read from chunked cells.
+CHUNK_OUTLINE_FIELDS = {
+    field: 1 for field in ('cell.id', 'cell.cell_type', 'cell.source', 'cell.metadata.type')
+}
+CELL_OPERATIONS = {'insert', 'update', 'delete', 'move'}
+# What cloning reads from the source besides its body, which stays in MongoDB.
+CLONE_SOURCE_FIELDS = {
+    field: 1 for field in ('owner_id', 'visibility', 'allowed_user_ids', 'revision',
+                           'cell_chunks', 'blob_digests', *SUMMARY_FIELDS)
+}
 
 
 def create_notebook_content(author_id, author_name=None):
@@ -112,15 +187,127 @@ def create_notebook_content(author_id, author_name=None):
     
     return nb
 
-def create_new_notebook(author_id, author_name, notebook_json):
+def create_new_notebook(author_id, author_name, notebook_json, notebook_id=None):
+    """
+    Insert a new notebook and return ``(notebook_id, slug)``.
+
+    ``notebook_id`` is the id the editor reserved for a draft.  Publishing the
+    same draft twice raises ``DuplicateKeyError`` for the ``_id`` index.
+    """
+    if notebook_id is not None and not ObjectId.is_valid(str(notebook_id)):
+        raise ValueError('notebook_id must be an ObjectId')
     notebook = build_notebook_document(author_id, author_name, notebook_json)
-    result = mongo.db.notebooks.insert_one(notebook)
-    return str(result.inserted_id), notebook['slug']
+    notebook['_id'] = ObjectId(notebook_id) if notebook_id else ObjectId()
+    nb = notebook.pop('notebook')
+    content, _, refs = notebook_storage(notebook['_id'], nb)
+    notebook.update(content)
+
+    def insert(slug):
+        notebook['slug'] = slug
+        mongo.db.notebooks.insert_one(notebook)
+
+    try:
+        write_with_slug(mongo.db, slug_base(notebook['title']), insert, slug=notebook['slug'])
+    except Exception:
+        cell_store.discard_chunks(mongo.db, refs)
+        raise
+    revisions.record_notebook(mongo.db, notebook['_id'], notebook['revision'], nb)
+    search.index_notebook(mongo.db, notebook['_id'], notebook['revision'], nb, notebook['title'])
+    facets.record_change(mongo.db, None, notebook)
+    feed.record(mongo.db, notebook, nb, author_name)
+    return str(notebook['_id']), notebook['slug']
+
+
+def clone_notebook(query, user_id):
+    """
+    Copy a notebook the user may read, by id or slug, into a draft they own.
+
+    The draft is a private, untitled ``notebook-<id>`` document whose body,
+    including references to shared blobs, is copied inside MongoDB; it gets a
+    title and slug when it is first published.  Returns the new id or a
+    message dict: ``not found`` or ``not_authorized``.
+    """
+    if isinstance(query, str) and ObjectId.is_valid(query):
+        lookup = {'_id': ObjectId(query)}
+    else:
+        lookup = {'slug': query}
+    for _ in range(cell_store.READ_ATTEMPTS):
+        source = mongo.db.notebooks.find_one(lookup, CLONE_SOURCE_FIELDS)
+        if source is None:
+            return {'message': 'not found'}
+        if not check_authorization(source, user_id):
+            return {'message': 'not_authorized'}
+        notebook_id = ObjectId()
+        now = datetime.now(timezone.utc)
+        draft = {
+            '_id': notebook_id,
+            'owner_id': user_key(user_id),
+            'created_at': now,
+            'updated_at': now,
+            'title': '',
+            **title_fields(''),
+            'slug': f'notebook-{notebook_id}',
+            'visibility': 'private',
+            'allowed_user_ids': [],
+            'topic_ids': [],
+            'revision': 1,
+            'cloned_from': source['_id'],
+            # The body is copied unchanged, and so are the fields derived from it.
+            **{field: source[field] for field in (*SUMMARY_FIELDS, 'blob_digests')
+               if field in source},
+        }
+        if cell_store.copy_notebook(mongo.db, source, draft):
+            return str(notebook_id)
+    return {'message': 'not found'}
+
+
+def chunk_threshold():
+    if has_app_context():
+        return current_app.config.get('CELL_CHUNK_THRESHOLD_BYTES', DEFAULT_CHUNK_THRESHOLD)
+    return DEFAULT_CHUNK_THRESHOLD
+
+
+def notebook_storage(notebook_id, notebook, previous=()):
+    """
+    Return ``(set, unset, refs)`` fields storing ``notebook`` in its layout.
 
-def save_notebook(notebook_id, author_id, author_name, notebook_json):
-    existing = mongo.db.notebooks.find_one({'_id': ObjectId(notebook_id)})
+    Large notebooks get their cells stored in chunks first, reusing unchanged
+    chunks from ``previous``; ``refs`` lists the chunks the fields reference.
+    """
+    if cell_store.should_chunk(notebook, chunk_threshold()):
+        refs = cell_store.store_cells(mongo.db, notebook_id, notebook['cells'], previous)
+        return (
+            {'notebook_skeleton': cell_store.skeleton(notebook), 'cell_chunks': refs},
+            {'notebook': ''},
+            refs,
+        )
+    return {'notebook': notebook}, {'notebook_skeleton': '', 'cell_chunks': ''}, []
+
+def save_notebook(notebook_id, author_id, author_name, notebook_json, expected_revision=None):
+    """
+    Publish a new revision of a notebook owned by ``author_id``.
+
+    The write is one ``find_one_and_update`` guarded by the owner and the
+    revision that was read (or ``expected_revision`` when the client sent
+    one), so concurrent saves cannot overwrite each other.  Returns
+    ``{'slug': ..., 'revision': ...}`` or a message dict: ``not found``,
+    ``not_authorized`` or ``conflict``.  When the content hash is unchanged
+    nothing is written and the result is marked ``unchanged``.  Committed
+    revisions are added to the notebook's :mod:`revisions` history.
+    """
+    if not ObjectId.is_valid(str(notebook_id)):
+        return {'message': 'not found'}
+    existing = mongo.db.notebooks.find_one(
+        {'_id': ObjectId(notebook_id)}, {**PUBLICATION_FIELDS, 'cell_chunks': 1}
+    )
     if not existing:
-        return "not_found"
+        return {'message': 'not found'}
+    owner_field = 'owner_id' if 'owner_id' in existing else 'author'
+    if str(existing.get(owner_field)) != str(author_id):
+        return {'message': 'not_authorized'}
+    revision = existing.get('revision', 0)
+    if expected_revision is not None and int(expected_revision) != revision:
+        return {'message': 'conflict'}
     notebook_json = dict(notebook_json)
     notebook_json.setdefault('visibility', existing.get('visibility', 'public'))
     notebook_json.setdefault('allowed_user_ids', existing.get('allowed_user_ids', []))
@@ -131,38 +318,323 @@ def save_notebook(notebook_id, author_id, author_name, notebook_json):
         notebook_json,
         notebook_id=notebook_id,
         created_at=existing.get('created_at', existing.get('date')),
-        revision=existing.get('revision', 0) + 1,
+        revision=revision + 1,
+        current_slug=existing.get('slug'),
+        previous=existing,
+        unchanged_hash=existing.get('content_hash'),
+    )
+    if update_fields is None:
+        return {'slug': existing['slug'], 'revision': revision, 'unchanged': True}
+    previous = existing.get('cell_chunks', [])
+    nb = update_fields.pop('notebook')
+    content, unset, refs = notebook_storage(existing['_id'], nb, previous)
+    update_fields.update(content)
+
+    def publish(slug):
+        update_fields['slug'] = slug
+        return mongo.db.notebooks.find_one_and_update(
+            {
+                '_id': existing['_id'],
+                owner_field: existing[owner_field],
+                'revision': existing['revision'] if 'revision' in existing else {'$exists': False},
+            },
+            {'$set': update_fields, '$unset': {'author': '', 'date': '', **unset}},
+            projection={'slug': 1, 'revision': 1},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    updated = write_with_slug(
+        mongo.db, slug_base(update_fields['title']), publish, existing['_id'], update_fields['slug']
     )
-    mongo.db.notebooks.update_one(
+    if not updated:
+        cell_store.discard_chunks(mongo.db, refs, keep=previous)
+        return {'message': 'conflict'}
+    cell_store.discard_chunks(mongo.db, previous, keep=refs)
+    revisions.record_notebook(mongo.db, existing['_id'], updated['revision'], nb)
+    search.index_notebook(mongo.db, existing['_id'], updated['revision'], nb, update_fields['title'])
+    facets.record_change(mongo.db, existing, {**existing, **update_fields})
+    feed.record(mongo.db, {**existing, **update_fields, **updated}, nb, author_name)
+    return {'slug': updated['slug'], 'revision': updated['revision']}
+
+
+def save_notebook_cells(notebook_id, author_id, base_revision, operations):
+    """
+    Publish a new revision by applying cell operations to ``base_revision``.
+
+    Only inserted and updated cells are validated and sent to MongoDB.  A
+    single update rebuilds the cell list from the stored cells (or the chunk
+    references of a chunked notebook), guarded by owner and revision like
+    :func:`save_notebook`, and returns the
+    same results; an empty change set writes nothing.  A ``metadata``
+    operation replaces the notebook metadata, except for the title derived
+    from the first cell.  Notebooks whose cells have no ids, and embedded
+    notebooks the changes may grow past the chunk threshold, yield
+    ``{'message': 'unsupported'}`` and must be saved in full, which moves
+    their cells to chunks.
+    """
+    if not ObjectId.is_valid(str(notebook_id)):
+        return {'message': 'not found'}
+    existing = mongo.db.notebooks.find_one(
         {'_id': ObjectId(notebook_id)},
-        {'$set': update_fields, '$unset': {'author': '', 'date': ''}}
+        {**PUBLICATION_FIELDS, **CELL_OUTLINE_FIELDS, 'notebook_skeleton': 1, 'cell_chunks': 1,
+         'first_image': 1, 'blob_digests': 1, 'notebook_size': {'$bsonSize': '$notebook'}},
+    )
+    if not existing:
+        return {'message': 'not found'}
+    owner_field = 'owner_id' if 'owner_id' in existing else 'author'
+    if str(existing.get(owner_field)) != str(author_id):
+        return {'message': 'not_authorized'}
+    if existing.get('revision') != base_revision:
+        return {'message': 'conflict'}
+    chunked = cell_store.is_chunked(existing)
+    if chunked:
+        notebook = existing['notebook_skeleton']
+        refs = {ref['cell_id']: ref for ref in existing['cell_chunks']}
+        cell_ids = [ref['cell_id'] for ref in existing['cell_chunks']]
+    else:
+        notebook = existing.get('notebook', {})
+        cell_ids = [cell.get('id') for cell in notebook.get('cells', [])]
+    if (notebook.get('nbformat', 0), notebook.get('nbformat_minor', 0)) < (4, 5) \
+            or not all(cell_ids):
+        return {'message': 'unsupported'}
+
+    metadata, operations = take_metadata_operation(operations)
+    order, touched = apply_cell_operations(cell_ids, operations)
+    if metadata is not None and _without_title(metadata) == \
+            _without_title(notebook.get('metadata', {})):
+        metadata = None
+    if metadata is not None:
+        notebook = {**notebook, 'metadata': metadata}
+    # A stored draft (see clone_notebook) gets its title and slug even when
+    # it is published unchanged.
+    draft = existing['slug'] == f"notebook-{existing['_id']}"
+    if not touched and order == cell_ids and metadata is None and not draft:
+        return {'slug': existing['slug'], 'revision': base_revision, 'unchanged': True}
+    notebook_blobs.externalize({'cells': list(touched.values())})
+    # New metadata is written in full, so it counts like an added cell.
+    added = list(touched.values()) + ([metadata] if metadata is not None else [])
+    if not chunked and cell_store.may_outgrow(
+            existing.get('notebook_size') or 0, added, chunk_threshold()):
+        return {'message': 'unsupported'}
+    if chunked:
+        kept = [refs[i] for i in order if i not in touched]
+        try:
+            cells = cell_store.fetch_cells(mongo.db, kept, CHUNK_OUTLINE_FIELDS)
+        except cell_store.StaleChunks:  # a newer revision replaced them
+            return {'message': 'conflict'}
+    else:
+        cells = notebook.get('cells', [])
+    outline = {cell['id']: {'metadata': {}, **cell} for cell in cells}
+    # The outline holds every source, which is all the search index needs.
+    published = nbformat.from_dict(
+        {**notebook, 'cells': [touched.get(i, outline.get(i)) for i in order]}
+    )
+    title, slug = publication_title(published, notebook_id, existing.get('slug'))
+    derived = summary_fields(published, existing, touched)
+    # Digests of removed cells are kept; untouched cells are only outlined here.
+    derived['blob_digests'] = sorted(
+        set(existing.get('blob_digests', [])) | set(blob_digests({'cells': list(touched.values())}))
+    )
+    query = {'_id': existing['_id'], owner_field: existing[owner_field], 'revision': base_revision}
+    skeleton = cell_store.skeleton(notebook)
+    skeleton['metadata'] = {**skeleton.get('metadata', {}), 'title': title}
+    # Unchanged metadata is left in place apart from its title.
+    metadata_fields = ({'metadata.title': title} if metadata is None
+                       else {'metadata': skeleton['metadata']})
+    digests = {i: cell_store.cell_digest(cell) for i, cell in touched.items()}
+    changed = {digests[i]: cell for i, cell in touched.items()}
+    updated_at = datetime.now(timezone.utc)
+    if chunked:
+        stored = [i for i in order if i in touched]
+        refs.update(zip(stored, cell_store.store_cells(
+            mongo.db, existing['_id'], [touched[i] for i in stored]
+        )))
+        chunks = [refs[i] for i in order]
+
+        def publish(slug):
+            return mongo.db.notebooks.find_one_and_update(
+                query,
+                {
+                    '$set': {
+                        'cell_chunks': chunks,
+                        **{f'notebook_skeleton.{field}': value
+                           for field, value in metadata_fields.items()},
+                        'title': title,
+                        **title_fields(title),
+                        **derived,
+                        'slug': slug,
+                        'updated_at': updated_at,
+                    },
+                    '$inc': {'revision': 1},
+                    '$unset': {'content_hash': ''},
+                },
+                projection={'slug': 1, 'revision': 1},
+                return_document=ReturnDocument.AFTER,
+            )
+
+        updated = write_with_slug(mongo.db, slug_base(title), publish, existing['_id'], slug)
+        previous = existing['cell_chunks']
+        if not updated:
+            cell_store.discard_chunks(mongo.db, chunks, keep=previous)
+            return {'message': 'conflict'}
+        cell_store.discard_chunks(mongo.db, previous, keep=chunks)
+        revisions.record_revision(
+            mongo.db, existing['_id'], updated['revision'], skeleton,
+            [[ref['cell_id'], ref['digest']] for ref in chunks], changed,
+        )
+        search.index_notebook(mongo.db, existing['_id'], updated['revision'], published, title)
+        feed.record(mongo.db, {**existing, **updated, **derived, 'title': title,
+                              'updated_at': updated_at}, published)
+        return {'slug': updated['slug'], 'revision': updated['revision']}
+
+    slots = [{'cell': touched[i]} if i in touched else {'id': i} for i in order]
+
+    def publish(slug):
+        return mongo.db.notebooks.find_one_and_update(
+            query,
+            [{'$set': {
+                # Untouched cells, outputs included, are copied inside MongoDB.
+                'notebook.cells': {'$map': {
+                    'input': {'$literal': slots},
+                    'as': 'slot',
+                    'in': {'$ifNull': ['$$slot.cell', {'$arrayElemAt': [{'$filter': {
+                        'input': '$notebook.cells',
+                        'cond': {'$eq': ['$$this.id', '$$slot.id']},
+                    }}, 0]}]},
+                }},
+                **{f'notebook.{field}': {'$literal': value}
+                   for field, value in metadata_fields.items()},
+                'title': {'$literal': title},
+                **{field: {'$literal': value}
+                   for field, value in {**title_fields(title), **derived}.items()},
+                'slug': {'$literal': slug},
+                'updated_at': updated_at,
+                'revision': {'$add': ['$revision', 1]},
+                # Hashing would need every cell; the next full save recomputes it.
+                'content_hash': '$$REMOVE',
+            }}],
+            projection={'slug': 1, 'revision': 1},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    updated = write_with_slug(mongo.db, slug_base(title), publish, existing['_id'], slug)
+    if not updated:
+        return {'message': 'conflict'}
+    # Digests of untouched cells are taken from the previous revision.
+    revisions.record_revision(
+        mongo.db, existing['_id'], updated['revision'], skeleton,
+        [[i, digests.get(i)] for i in order], changed,
     )
-    return update_fields['slug']
+    search.index_notebook(mongo.db, existing['_id'], updated['revision'], published, title)
+    feed.record(mongo.db, {**existing, **updated, **derived, 'title': title,
+                          'updated_at': updated_at}, published)
+    return {'slug': updated['slug'], 'revision': updated['revision']}
+
+
+def apply_cell_operations(cell_ids, operations):
+    """
+    Apply insert, update, delete and move operations to a list of cell ids.
+
+    Returns the resulting order of ids and the validated content of every
+    inserted or updated cell, keyed by id.
+    """
+    if not isinstance(operations, list):
+        raise ValueError("Operations must be a list")
+    order = list(cell_ids)
+    touched = {}
+    for operation in operations:
+        kind = operation.get('op') if isinstance(operation, dict) else None
+        if kind not in CELL_OPERATIONS:
+            raise ValueError("Cell operations must be insert, update, delete or move")
+        if kind in {'insert', 'update'}:
+            cell = validate_cell(operation.get('cell'))
+            cell_id = cell['id']
+        else:
+            cell_id = operation.get('id')
+        if kind == 'insert' and cell_id in order:
+            raise ValueError(f"Cell {cell_id} already exists")
+        if kind != 'insert' and cell_id not in order:
+            raise ValueError(f"Unknown cell {cell_id}")
+        if kind in {'insert', 'move'}:
+            index = operation.get('index')
+            last = len(order) - (kind == 'move')
+            if isinstance(index, bool) or not isinstance(index, int) or not 0 <= index <= last:
+                raise ValueError("Cell index is out of range")
+        if kind in {'delete', 'move'}:
+            order.remove(cell_id)
+        if kind in {'insert', 'move'}:
+            order.insert(index, cell_id)
+        if kind == 'delete':
+            touched.pop(cell_id, None)
+        elif kind != 'move':
+            touched[cell_id] = cell
+    return order, touched
+
+
+def take_metadata_operation(operations):
+    """
+    Split a ``metadata`` operation off ``operations``.
+
+    Returns the validated notebook metadata it sets, or ``None``, and the
+    remaining cell operations.
+    """
+    if not isinstance(operations, list):
+        raise ValueError("Operations must be a list")
+    metadata, cell_operations = None, []
+    for operation in operations:
+        if isinstance(operation, dict) and operation.get('op') == 'metadata':
+            metadata = operation.get('metadata')
+            if not isinstance(metadata, dict):
+                raise ValueError("Notebook metadata must be an object")
+            try:
+                nbformat.validate(nbformat.v4.new_notebook(metadata=metadata))
+            except Exception as error:
+                raise ValueError(f"Invalid notebook metadata: {error}") from error
+        else:
+            cell_operations.append(operation)
+    return metadata, cell_operations
+
+
+def _without_title(metadata):
+    return {key: value for key, value in metadata.items() if key != 'title'}
+
+
+def validate_cell(cell):
+    """Validate a single nbformat 4.5 cell submitted by the editor."""
+    if not isinstance(cell, dict) or not isinstance(cell.get('id'), str):
+        raise ValueError("Cells must be notebook cells with an id")
+    try:
+        node = nbformat.from_dict(cell)
+        nbformat.validate(nbformat.v4.new_notebook(cells=[node]))
+    except Exception as error:
+        raise ValueError(f"Invalid cell {cell['id']}: {error}") from error
+    if node.metadata.get('type') in {'author', 'date'}:
+        raise ValueError("Author and date cells are managed by the server")
+    return node
 
 
 def build_notebook_document(author_id, author_name, notebook_json,
-                            notebook_id=None, created_at=None, revision=1):
-    """Validate notebook JSON and derive safe server-side publication fields."""
+                            notebook_id=None, created_at=None, revision=1, current_slug=None,
+                            previous=None, unchanged_hash=None):
+    """
+    Validate notebook JSON and derive safe server-side publication fields.
+
+    A notebook keeps ``current_slug`` while its title still produces it, which
+    spares the uniqueness queries on ordinary saves.  ``previous`` is the
+    stored document of a saved notebook, see :func:`summaries.summary_fields`.
+    When the content hash equals ``unchanged_hash``, ``None`` is returned
+    before any image is stored or slug allocated.
+    """
     raw_notebook = notebook_json.get('notebook', notebook_json)
     try:
         nb = nbformat.from_dict(raw_notebook)
         nbformat.validate(nb)
     except Exception as error:
         raise ValueError(f"Invalid notebook: {error}") from error
-    title = find_document_title(nb)
-    if not title:
-        raise ValueError("The document's first line must contain a title")
-
-    # Check the placeholder only after reading the current first line from the
-    # edited notebook, then synchronize standard notebook metadata.
-    if title.casefold() == DEFAULT_TITLE.casefold():
-        raise ValueError(f'Title must be different from "{DEFAULT_TITLE}"')
-    initial_slug = slugify(title[:SLUG_TITLE_MAX_LENGTH])
-    if not initial_slug:
-        raise ValueError("Notebook title must produce a valid slug")
-    slug = ensure_unique_slug(initial_slug, notebook_id)
+    title = valid_title(nb)
     nb.metadata['title'] = title
     set_author_cell(nb, author_name)
+    images = notebook_blobs.references(nb)
     visibility = notebook_json.get('visibility', 'public')
     if visibility not in {'public', 'private'}:
         raise ValueError("Visibility must be public or private")
@@ -170,20 +642,75 @@ def build_notebook_document(author_id, author_name, notebook_json,
         notebook_json.get('allowed_users', notebook_json.get('allowed_user_ids', [])),
         author_id,
     ) if visibility == 'private' else []
-    now = datetime.now(timezone.utc)
-    return {
+    document = {
         'notebook': nb,
-        'owner_id': str(author_id),
-        'slug': slug,
-        'title': title,
-        'created_at': created_at or now,
-        'updated_at': now,
         'visibility': visibility,
         'allowed_user_ids': allowed_user_ids,
         'topic_ids': notebook_json.get('topic_ids', []),
-        'is_public': visibility == 'public',
-        'revision': revision,
     }
+    document['content_hash'] = content_hash(document)
+    if document['content_hash'] == unchanged_hash:
+        return None
+    notebook_blobs.store_images(images)
+    now = datetime.now(timezone.utc)
+    document.update({
+        'owner_id': user_key(author_id),
+        'slug': publication_slug(title, notebook_id, current_slug),
+        'title': title,
+        **title_fields(title),
+        'created_at': created_at or now,
+        'updated_at': now,
+        'revision': revision,
+        **summary_fields(nb, previous),
+        'blob_digests': blob_digests(nb),
+    })
+    return document
+
+
+def content_hash(document):
+    """Return a canonical SHA-256 of the publication fields of ``document``.
+
+    Keys are sorted and ids compare by their string form, so the hash depends
+    only on content, not on key order or how ids happen to be stored.
+    """
+    fields = {field: document.get(field) for field in CONTENT_HASH_FIELDS}
+    canonical = json.dumps(fields, sort_keys=True, separators=(',', ':'),
+                           ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def publication_title(nb, notebook_id=None, current_slug=None):
+    """Return the ``(title, slug)`` a notebook is published under."""
+    title = valid_title(nb)
+    return title, publication_slug(title, notebook_id, current_slug)
+
+
+def valid_title(nb):
+    """Return the title of ``nb``, raising ``ValueError`` when it cannot be published."""
+    title = find_document_title(nb)
+    if not title:
+        raise ValueError("The document's first line must contain a title")
+
+    # Check the placeholder only after reading the current first line from the
+    # edited notebook, then synchronize standard notebook metadata.
+    if title.casefold() == DEFAULT_TITLE.casefold():
+        raise ValueError(f'Title must be different from "{DEFAULT_TITLE}"')
+    if not slug_base(title):
+        raise ValueError("Notebook title must produce a valid slug")
+    return title
+
+
+def publication_slug(title, notebook_id=None, current_slug=None):
+    """Return ``current_slug`` while ``title`` still produces it, else a free slug."""
+    initial_slug = slug_base(title)
+    if current_slug and re.fullmatch(rf'{re.escape(initial_slug)}(-\d+)?', current_slug):
+        return current_slug
+    return allocate_slug(mongo.db, initial_slug, notebook_id)
+
+
+def slug_base(title):
+    """Return the slug a notebook titled ``title`` gets when it is free."""
+    return slugify(title[:SLUG_TITLE_MAX_LENGTH])
 
 
 def set_author_cell(notebook, author_name):
@@ -206,24 +733,41 @@ def set_author_cell(notebook, author_name):
         cleaned.append(cell)
     notebook.cells = cleaned
 
-def get_notebook(query, user_id):
+def get_notebook(query, user_id, include_content=True):
+    """
+    Find a notebook by id or slug and check that the user may read it.
+
+    With ``include_content=False`` the notebook body is not loaded; callers
+    fetch it with :func:`get_notebook_content` only when they need it.  The
+    author's name is not looked up either; see :func:`notebook_author`.
+    """
+    projection = None if include_content else cell_store.WITHOUT_CONTENT
     if isinstance(query, str) and ObjectId.is_valid(query):
-        notebook = mongo.db.notebooks.find_one({'_id': ObjectId(query)})
+        notebook = mongo.db.notebooks.find_one({'_id': ObjectId(query)}, projection)
     else:
-        notebook = mongo.db.notebooks.find_one({'slug': query})
+        notebook = mongo.db.notebooks.find_one({'slug': query}, projection)
     
     if notebook:
         if check_authorization(notebook, user_id):
             owner_id = str(notebook.get('owner_id', notebook.get('author', '')))
             notebook['owner_id'] = owner_id
-            owner = get_user_by_id(owner_id)
-            notebook['author'] = owner.get('username', 'Unknown') if owner else 'Unknown'
             return notebook
         else:
             return {'message': 'not_authorized'}
     else:
         return {'message':'not found'}
 
+def notebook_author(notebook):
+    """Return the username of the owner of a notebook from :func:`get_notebook`."""
+    return resolve_usernames([notebook['owner_id']]).get(notebook['owner_id'], 'Unknown')
+
+def get_notebook_content(notebook_id, start=None, stop=None):
+    """Return a notebook's content, optionally only cells ``start:stop``."""
+    document = mongo.db.notebooks.find_one(
+        {'_id': ObjectId(notebook_id)}, cell_store.CONTENT_FIELDS
+    )
+    return cell_store.load_notebook(mongo.db, document, start, stop) if document else None
+
 def check_authorization(notebook, user_id):
     """
     Check if a user is authorized to access a notebook.
@@ -238,36 +782,15 @@ def check_authorization(notebook, user_id):
             or str(user_id) in allowed_user_ids)
 
 def delete_notebook(notebook_id):
-    mongo.db.notebooks.delete_one({'_id': ObjectId(notebook_id)})
-
-def notebook_html(notebook):
-    notebook_content = nbformat.from_dict(notebook)
-    html_exporter = HTMLExporter(template_name="classic")
-    (body, resources) = html_exporter.from_notebook_node(notebook_content)
-    return body
-
-
-def ensure_unique_slug(initial_slug, notebook_id=None):
-    """
-    Ensure the generated slug is unique in the database by appending a number if necessary.
-
-    :param initial_slug: The initial slug generated from the title.
-    :return: A unique slug that doesn't already exist in the MongoDB collection.
-    """
-    slug = initial_slug
-    counter = 1
-    
-    # Keep checking if the slug exists in the database
-    query = {'slug': slug}
-    if notebook_id:
-        query['_id'] = {'$ne': ObjectId(notebook_id)}
-    while mongo.db.notebooks.find_one(query):
-        # If it exists, append or increment the counter to make it unique
-        slug = f"{initial_slug}-{counter}"
-        query['slug'] = slug
-        counter += 1
-    
-    return slug
+    deleted = mongo.db.notebooks.find_one_and_delete(
+        {'_id': ObjectId(notebook_id)}, projection=facets.FACET_FIELDS
+    )
+    facets.record_change(mongo.db, deleted, None)
+    feed.discard(mongo.db, [ObjectId(notebook_id)])
+    cell_store.discard_notebooks(mongo.db, [ObjectId(notebook_id)])
+    revisions.discard_history(mongo.db, [ObjectId(notebook_id)])
+    search.discard(mongo.db, [ObjectId(notebook_id)])
+    page_cache.invalidate(notebook_id)
 
 
 def find_cells_by_metadata(notebook_json, key, value):
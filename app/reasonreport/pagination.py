@@ -0,0 +1,67 @@
+"""Keyset pagination of notebook listings, newest first.
+
+Listings are ordered by ``(updated_at, _id)`` descending.  A page ends with an
+opaque cursor encoding the position of its last document; the next page
+queries for documents strictly after that position instead of skipping the
+ones already returned, so every page costs the same however deep it is.
+Documents updated while a client pages move to the front of the listing and
+are not returned twice.
+"""
+
+import base64
+from datetime import datetime, timedelta, timezone
+import json
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import DESCENDING
+
+ORDER = [('updated_at', DESCENDING), ('_id', DESCENDING)]
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MILLISECOND = timedelta(milliseconds=1)
+
+
+def _milliseconds(value):
+    # MongoDB stores dates in milliseconds; PyMongo returns naive UTC datetimes.
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // MILLISECOND
+
+
+def encode_cursor(document):
+    """Return the cursor of the position after ``document``."""
+    position = [_milliseconds(document['updated_at']), str(document['_id'])]
+    return base64.urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Return ``(updated_at, _id)`` of a cursor or raise ``ValueError``."""
+    try:
+        milliseconds, document_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return EPOCH + milliseconds * MILLISECOND, ObjectId(document_id)
+    except (AttributeError, OverflowError, TypeError, ValueError, InvalidId) as error:
+        raise ValueError('Invalid cursor') from error
+
+
+def after(cursor):
+    """Return the query matching documents after ``cursor`` in :data:`ORDER`."""
+    updated_at, document_id = decode_cursor(cursor)
+    return {'$or': [
+        {'updated_at': {'$lt': updated_at}},
+        {'updated_at': updated_at, '_id': {'$lt': document_id}},
+    ]}
+
+
+def find_page(collection, query, projection, limit, cursor=None):
+    """Return ``(documents, next_cursor)`` for one page of ``query``.
+
+    ``next_cursor`` is ``None`` on the last page.  ``ValueError`` is raised
+    for a malformed ``cursor``.
+    """
+    if cursor:
+        query = {'$and': [query, after(cursor)]}
+    documents = list(collection.find(query, projection).sort(ORDER).limit(limit + 1))
+    if len(documents) <= limit:
+        return documents, None
+    documents = documents[:limit]
+    return documents, encode_cursor(documents[-1])
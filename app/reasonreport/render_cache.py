@@ -0,0 +1,181 @@
+"""Rendered notebook pages cached by notebook revision.
+
+A stored notebook never changes without its ``revision`` being advanced, so the
+HTML produced for ``(notebook id, revision, template)`` stays valid until the
+next save.  Each worker keeps recently viewed pages in a bounded LRU; an
+optional shared store (a MongoDB collection or a directory on a shared volume)
+lets every gunicorn worker reuse a single render.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+
+from bson.objectid import ObjectId
+from pymongo.errors import DocumentTooLarge, PyMongoError
+
+from caching import LRUCache
+
+DEFAULT_TEMPLATE = 'classic'
+BODY_TEMPLATE = 'classic-body'
+
+logger = logging.getLogger(__name__)
+
+
+def page_key(document, template=DEFAULT_TEMPLATE):
+    """Return the cache key of a notebook document, or ``None`` if uncacheable.
+
+    Legacy documents without a revision cannot be told apart across edits and
+    are therefore always rendered.
+    """
+    revision = document.get('revision')
+    if revision is None:
+        return None
+    return str(document['_id']), int(revision), template
+
+
+class MongoRenderStore:
+    """Shared render store kept in the ``rendered_pages`` collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @staticmethod
+    def _id(key):
+        notebook_id, revision, template = key
+        return f'{notebook_id}:{revision}:{template}'
+
+    def get(self, key):
+        document = self.collection.find_one({'_id': self._id(key)}, {'html': 1})
+        return document['html'] if document else None
+
+    def set(self, key, html):
+        notebook_id, revision, template = key
+        self.collection.replace_one({'_id': self._id(key)}, {
+            'notebook_id': ObjectId(notebook_id) if ObjectId.is_valid(notebook_id) else notebook_id,
+            'revision': revision,
+            'template': template,
+            'html': html,
+            'rendered_at': datetime.now(timezone.utc),
+        }, upsert=True)
+
+    def delete_notebook(self, notebook_id):
+        values = [notebook_id]
+        if ObjectId.is_valid(notebook_id):
+            values.append(ObjectId(notebook_id))
+        self.collection.delete_many({'notebook_id': {'$in': values}})
+
+
+class DiskRenderStore:
+    """Shared render store kept as one file per page on a shared volume."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        notebook_id, revision, template = key
+        return os.path.join(self.directory, notebook_id, f'{revision}-{template}.html')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as page:
+                return page.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, html):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write beside the target and rename so readers never see partial pages.
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as page:
+            page.write(html)
+        os.replace(temporary, path)
+
+    def delete_notebook(self, notebook_id):
+        shutil.rmtree(os.path.join(self.directory, notebook_id), ignore_errors=True)
+
+
+class RenderCache:
+    """Two-tier page cache: per-process LRU in front of an optional shared store."""
+
+    STORE_ERRORS = (OSError, PyMongoError)
+
+    def __init__(self, max_entries=128, store=None):
+        self.local = LRUCache(max_entries)
+        self.store = store
+
+    def configure(self, max_entries, store=None):
+        self.local = LRUCache(max_entries)
+        self.store = store
+
+    def get(self, key):
+        html = self.local.get(key)
+        if html is None and self.store is not None:
+            try:
+                html = self.store.get(key)
+            except self.STORE_ERRORS:
+                logger.warning('Shared render store is unavailable', exc_info=True)
+            if html is not None:
+                self.local.set(key, html)
+        return html
+
+    def set(self, key, html):
+        self.local.set(key, html)
+        if self.store is not None:
+            try:
+                self.store.set(key, html)
+            except DocumentTooLarge:
+                logger.info('Rendered page %s exceeds the shared store limit', key)
+            except self.STORE_ERRORS:
+                logger.warning('Shared render store is unavailable', exc_info=True)
+
+    def get_or_render(self, key, render):
+        """Return cached HTML for ``key``, calling ``render()`` only on a miss."""
+        if key is None:
+            return render()
+        html = self.get(key)
+        if html is None:
+            html = render()
+            self.set(key, html)
+        return html
+
+    def discard_local(self, notebook_id):
+        """Drop this process's copies of a notebook that changed elsewhere."""
+        notebook_id = str(notebook_id)
+        self.local.discard_where(lambda key: key[0] == notebook_id)
+
+    def invalidate(self, notebook_id):
+        """Drop every cached revision of a notebook, e.g. after deletion."""
+        notebook_id = str(notebook_id)
+        self.discard_local(notebook_id)
+        if self.store is not None:
+            try:
+                self.store.delete_notebook(notebook_id)
+            except self.STORE_ERRORS:
+                logger.warning('Shared render store is unavailable', exc_info=True)
+
+
+def render_store(backend, database, directory):
+    """Return the shared store selected by ``RENDER_CACHE_BACKEND``, if any."""
+    if backend == 'mongo':
+        return MongoRenderStore(database.rendered_pages)
+    if backend == 'disk':
+        return DiskRenderStore(directory)
+    if not backend:
+        return None
+    raise ValueError(f'Unknown RENDER_CACHE_BACKEND: {backend}')
+
+
+def configure_render_cache(cache, config, database):
+    """Apply ``RENDER_CACHE_*`` settings to ``cache``."""
+    store = render_store(
+        config.get('RENDER_CACHE_BACKEND', ''), database, config.get('RENDER_CACHE_DIR')
+    )
+    cache.configure(config.get('RENDER_CACHE_ENTRIES', 128), store)
+    return cache
+
+
+page_cache = RenderCache()
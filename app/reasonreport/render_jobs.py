@@ -0,0 +1,127 @@
+"""MongoDB-backed queue of notebook revisions waiting to be pre-rendered.
+
+Both the Flask application and the MCP server enqueue a job whenever they
+commit a new revision, so this module only depends on PyMongo and receives the
+database handle explicitly.  There is at most one job per notebook: enqueueing
+again while a job is pending or running simply asks for another render of the
+newest revision.  ``render_worker.py`` claims jobs under a lease and writes the
+HTML into the shared render store read by the web workers, which answer
+readers of a revision still in the queue with :data:`PENDING` instead of
+rendering it themselves.
+"""
+
+from datetime import datetime, timedelta, timezone
+import secrets
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+MAX_ATTEMPTS = 3
+PENDING = 'pending'
+FAILED = 'failed'
+LEASE_FIELDS = {'lease_token': '', 'lease_until': ''}
+
+
+def _notebook_id(notebook_id):
+    return ObjectId(notebook_id) if ObjectId.is_valid(str(notebook_id)) else notebook_id
+
+
+def enqueue_render(db, notebook_id, revision=None):
+    """Ask the render workers to render the current revision of a notebook."""
+    update = {
+        '$set': {'status': 'queued', 'enqueued_at': datetime.now(timezone.utc), 'attempts': 0},
+        '$unset': {'lease_token': '', 'lease_until': '', 'error': '', 'finished_at': ''},
+    }
+    if revision is not None:
+        update['$max'] = {'revision': int(revision)}
+    query = {'notebook_id': _notebook_id(notebook_id)}
+    try:
+        db.render_jobs.update_one(query, update, upsert=True)
+    except DuplicateKeyError:  # a concurrent publish inserted the job first
+        db.render_jobs.update_one(query, update)
+
+
+def fail_abandoned_jobs(db, now):
+    """Mark jobs whose last allowed lease expired as failed."""
+    db.render_jobs.update_many(
+        {'status': 'running', 'lease_until': {'$lt': now}, 'attempts': {'$gte': MAX_ATTEMPTS}},
+        {
+            '$set': {'status': FAILED, 'finished_at': now, 'error': 'Render lease expired'},
+            '$unset': LEASE_FIELDS,
+        },
+    )
+
+
+def claim_render_job(db, lease_seconds):
+    """Lease the oldest runnable job, including jobs abandoned by a dead worker.
+
+    A job abandoned on its last attempt is failed rather than left running.
+    """
+    now = datetime.now(timezone.utc)
+    fail_abandoned_jobs(db, now)
+    return db.render_jobs.find_one_and_update(
+        {
+            '$or': [
+                {'status': 'queued'},
+                {'status': 'running', 'lease_until': {'$lt': now}},
+            ],
+            'attempts': {'$lt': MAX_ATTEMPTS},
+        },
+        {
+            '$set': {
+                'status': 'running',
+                'lease_token': secrets.token_hex(16),
+                'lease_until': now + timedelta(seconds=lease_seconds),
+            },
+            '$inc': {'attempts': 1},
+        },
+        sort=[('enqueued_at', ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def finish_render_job(db, job, error=None, revision=None):
+    """Record the outcome of a leased job.
+
+    The lease token guards against a newer publish that re-queued the job while
+    it was being rendered; in that case the job is left queued for the newer
+    revision.  Failed renders are retried until ``MAX_ATTEMPTS`` is reached.
+    """
+    query = {'_id': job['_id'], 'lease_token': job['lease_token']}
+    if error is None:
+        db.render_jobs.delete_one(query)
+        return
+    changes = {'error': str(error)[:2000]}
+    if revision is not None:
+        changes['revision'] = int(revision)
+    if job.get('attempts', 0) >= MAX_ATTEMPTS:
+        changes.update({'status': FAILED, 'finished_at': datetime.now(timezone.utc)})
+    else:
+        changes['status'] = 'queued'
+    db.render_jobs.update_one(query, {'$set': changes, '$unset': LEASE_FIELDS})
+
+
+def render_status(db, notebook_id, revision):
+    """Return the queue's state for this exact notebook revision.
+
+    :data:`PENDING` while a worker will still render it, :data:`FAILED` once
+    the workers gave up on it, including when its last lease expired, and
+    ``None`` when no job covers it.
+    """
+    job = db.render_jobs.find_one({
+        'notebook_id': _notebook_id(notebook_id),
+        'revision': revision,
+    }, {'status': 1, 'attempts': 1, 'lease_until': 1})
+    if job is None:
+        return None
+    if job.get('status') == FAILED:
+        return FAILED
+    lease_until = job.get('lease_until')
+    if job.get('status') == 'running' and lease_until is not None \
+            and job.get('attempts', 0) >= MAX_ATTEMPTS:
+        if lease_until.tzinfo is None:  # PyMongo returns naive UTC datetimes
+            lease_until = lease_until.replace(tzinfo=timezone.utc)
+        if lease_until < datetime.now(timezone.utc):
+            return FAILED
+    return PENDING
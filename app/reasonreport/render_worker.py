@@ -0,0 +1,142 @@
+"""Drain the render queue with a pool of isolated renderer processes.
+
+Run ``python render_worker.py`` next to the web application with the same
+``MONGO_URI`` and ``RENDER_CACHE_*`` settings.  Each of the ``RENDER_WORKERS``
+slots owns one renderer process with an address-space limit.  A notebook that
+exceeds ``RENDER_JOB_TIMEOUT`` or its memory limit only costs that process,
+which is replaced before the slot claims its next job.
+"""
+
+import logging
+import multiprocessing
+import signal
+import threading
+
+from pymongo import MongoClient
+from pymongo.errors import DocumentTooLarge, PyMongoError
+
+from cell_store import CONTENT_FIELDS, load_notebook
+from config import Config
+from render_cache import BODY_TEMPLATE, DEFAULT_TEMPLATE, page_key, render_store
+from render_jobs import claim_render_job, finish_render_job
+from rendering import notebook_html
+
+logger = logging.getLogger('reasonreport.render_worker')
+
+
+def _limit_memory(limit_bytes):
+    import resource
+    if limit_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+
+
+class RenderSlot:
+    """Render queued notebooks one at a time in a dedicated child process."""
+
+    def __init__(self, database, store, timeout, memory_limit, body_only=False):
+        self.db = database
+        self.store = store
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.body_only = body_only
+        self.template = BODY_TEMPLATE if body_only else DEFAULT_TEMPLATE
+        self.pool = None
+
+    def _renderer(self):
+        if self.pool is None:
+            # Spawned children do not inherit the parent's MongoClient threads.
+            context = multiprocessing.get_context('spawn')
+            self.pool = context.Pool(
+                1, initializer=_limit_memory, initargs=(self.memory_limit,),
+                maxtasksperchild=100,
+            )
+        return self.pool
+
+    def _discard_renderer(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def run_once(self):
+        """Render one job; return ``False`` when the queue was empty."""
+        job = claim_render_job(self.db, lease_seconds=self.timeout * 2)
+        if not job:
+            return False
+        document = self.db.notebooks.find_one(
+            {'_id': job['notebook_id']}, {**CONTENT_FIELDS, 'revision': 1}
+        )
+        notebook = load_notebook(self.db, document) if document else None
+        if notebook is None:
+            finish_render_job(self.db, job)
+            return True
+        revision = document.get('revision')
+        try:
+            html = self._renderer().apply_async(
+                notebook_html, (notebook, self.body_only)
+            ).get(self.timeout)
+        except multiprocessing.TimeoutError:
+            self._discard_renderer()
+            logger.warning('Rendering %s timed out', job['notebook_id'])
+            finish_render_job(
+                self.db, job, f'Rendering exceeded {self.timeout} seconds', revision
+            )
+            return True
+        except Exception as error:  # raised inside the renderer process
+            logger.warning('Rendering %s failed: %r', job['notebook_id'], error)
+            finish_render_job(self.db, job, repr(error), revision)
+            return True
+        try:
+            self.store.set(page_key(document, self.template), html)
+        except DocumentTooLarge:
+            # Readers will render this revision themselves; retrying cannot help.
+            finish_render_job(self.db, job)
+            return True
+        finish_render_job(self.db, job)
+        return True
+
+    def run(self, stop, poll_interval):
+        try:
+            while not stop.is_set():
+                try:
+                    if not self.run_once():
+                        stop.wait(poll_interval)
+                except PyMongoError:
+                    logger.exception('Render queue is unavailable')
+                    stop.wait(poll_interval * 5)
+        finally:
+            self._discard_renderer()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    client = MongoClient(Config.MONGO_URI, serverSelectionTimeoutMS=5000)
+    database = client.get_default_database()
+    store = render_store(Config.RENDER_CACHE_BACKEND, database, Config.RENDER_CACHE_DIR)
+    if store is None:
+        raise SystemExit('RENDER_CACHE_BACKEND must be "mongo" or "disk" for the render worker')
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    threads = [
+        threading.Thread(
+            target=RenderSlot(
+                database, store, Config.RENDER_JOB_TIMEOUT,
+                Config.RENDER_JOB_MEMORY_MB * 1024 * 1024, Config.RENDER_EXTERNAL_CSS,
+            ).run,
+            args=(stop, Config.RENDER_QUEUE_POLL_SECONDS),
+            name=f'render-slot-{index}',
+        )
+        for index in range(Config.RENDER_WORKERS)
+    ]
+    for thread in threads:
+        thread.start()
+    logger.info('Render worker started with %d slots', len(threads))
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=1)
+
+
+if __name__ == '__main__':
+    main()
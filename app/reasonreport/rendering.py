@@ -0,0 +1,175 @@
+"""Notebook to HTML conversion.
+
+Pages are assembled from independently rendered cells.  Each cell's HTML
+fragment is cached under a digest of everything that affects its markup, so
+re-rendering a notebook after a small edit only converts the changed cells; the
+surrounding page (stylesheets and scripts) is cached per notebook metadata.
+
+In body-only mode the page shell is replaced by bare notebook containers and
+the shell's inline stylesheets are served once, as the content-addressed asset
+returned by :func:`notebook_stylesheet`.  The shell's scripts (jQuery,
+require.js, MathJax and widget state) are kept around the containers.
+
+Kept free of Flask and MongoDB imports so that the render worker's isolated
+child processes can import it cheaply.
+"""
+
+import hashlib
+import json
+import re
+import secrets
+import threading
+
+import nbformat
+from jinja2 import DictLoader
+from nbconvert import HTMLExporter
+
+from blob_store import link_blobs
+from caching import LRUCache
+
+CELLS_MARKER = '<!--reasonreport:cells-->'
+BODY_PREFIX = (
+    '<div tabindex="-1" id="notebook" class="border-box-sizing">\n'
+    '<div class="container" id="notebook-container">\n'
+)
+BODY_SUFFIX = '</div>\n</div>\n'
+STYLE_BLOCK = re.compile(r'<style[^>]*>(.*?)</style>', re.DOTALL)
+SCRIPT_BLOCK = re.compile(r'<script\b[^>]*>.*?</script>', re.DOTALL)
+TEMPLATES = DictLoader({
+    # The classic page with the cell loop replaced by a marker.
+    'reasonreport_page.html.j2': (
+        "{%- extends 'index.html.j2' -%}"
+        "{%- block body_loop -%}" + CELLS_MARKER + "{%- endblock body_loop -%}"
+    ),
+    # Only the cell markup of the classic template, each cell followed by a
+    # boundary string so that one conversion can be split into fragments.
+    'reasonreport_cells.html.j2': (
+        "{%- extends 'base.html.j2' -%}"
+        "{%- block any_cell scoped -%}{{ super() }}{{ resources.cell_boundary }}"
+        "{%- endblock any_cell -%}"
+    ),
+})
+
+fragment_cache = LRUCache(max_entries=8192)
+shell_cache = LRUCache(max_entries=64)
+_exporters = threading.local()
+
+
+class RenderFailed(RuntimeError):
+    """A notebook revision is known to be unrenderable within worker limits."""
+
+
+class RenderPending(RuntimeError):
+    """A notebook revision is queued for, or being rendered by, a render worker."""
+
+
+def _exporter(template_file):
+    # Exporters keep per-conversion state, so each thread gets its own.
+    exporters = _exporters.__dict__
+    if template_file not in exporters:
+        exporters[template_file] = HTMLExporter(
+            template_name='classic', extra_loaders=[TEMPLATES], template_file=template_file
+        )
+    return exporters[template_file]
+
+
+def _digest(value):
+    encoded = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def _render_context(metadata):
+    """Notebook-level metadata that changes how individual cells are rendered."""
+    language_info = metadata.get('language_info', {})
+    return {
+        'language': language_info.get('name'),
+        'lexer': language_info.get('pygments_lexer'),
+        'kernel_language': metadata.get('kernelspec', {}).get('language'),
+    }
+
+
+def cell_digest(cell, context):
+    """Return the cache key of a cell's HTML: its source, outputs and metadata."""
+    return _digest({'cell': cell, 'context': context})
+
+
+def _page_shell(metadata):
+    key = _digest(metadata)
+    shell = shell_cache.get(key)
+    if shell is None:
+        page, _ = _exporter('reasonreport_page.html.j2').from_notebook_node(
+            nbformat.v4.new_notebook(metadata=metadata)
+        )
+        shell = tuple(page.split(CELLS_MARKER, 1))
+        shell_cache.set(key, shell)
+    return shell
+
+
+def _body_shell(metadata):
+    """Return the bare containers wrapped in the page shell's scripts."""
+    key = 'body:' + _digest(metadata)
+    shell = shell_cache.get(key)
+    if shell is None:
+        prefix, suffix = _page_shell(metadata)
+        shell = (
+            '\n'.join(SCRIPT_BLOCK.findall(prefix) + [BODY_PREFIX]),
+            '\n'.join([BODY_SUFFIX] + SCRIPT_BLOCK.findall(suffix)),
+        )
+        shell_cache.set(key, shell)
+    return shell
+
+
+def _render_cells(cells, metadata):
+    """Convert ``cells`` in a single nbconvert pass and split the result.
+
+    A random boundary follows every cell, so the exporter's per-call setup is
+    paid once rather than once per cell.
+    """
+    boundary = f'<!--reasonreport-boundary-{secrets.token_hex(16)}-->'
+    body, _ = _exporter('reasonreport_cells.html.j2').from_notebook_node(
+        nbformat.v4.new_notebook(cells=cells, metadata=metadata),
+        resources={'cell_boundary': boundary},
+    )
+    fragments = body.split(boundary)[:-1]
+    if len(fragments) != len(cells):
+        raise RuntimeError('Rendered cells could not be separated')
+    return fragments
+
+
+def notebook_stylesheet():
+    """Return ``(digest, css)`` for the styles of body-only notebook pages."""
+    stylesheet = shell_cache.get('stylesheet')
+    if stylesheet is None:
+        prefix, _ = _page_shell(nbformat.v4.new_notebook().metadata)
+        css = '\n'.join(block.strip() for block in STYLE_BLOCK.findall(prefix)) + '\n'
+        stylesheet = (hashlib.sha256(css.encode('utf-8')).hexdigest()[:16], css)
+        shell_cache.set('stylesheet', stylesheet)
+    return stylesheet
+
+
+def notebook_html(notebook, body_only=False):
+    """Render a notebook as a classic-template HTML page.
+
+    With ``body_only`` the result omits the document head and inline
+    stylesheets, which pages link from :func:`notebook_stylesheet` instead,
+    but keeps the shell's scripts so that LaTeX and widgets still work.  Only cells
+    whose digest is not cached are converted.  Externalized images are linked
+    from the blob store rather than inlined.
+    """
+    notebook_content = nbformat.from_dict(link_blobs(notebook))
+    metadata = notebook_content.metadata
+    context = _render_context(metadata)
+    keys = [cell_digest(cell, context) for cell in notebook_content.cells]
+    fragments = {key: fragment_cache.get(key) for key in keys}
+    missing = {key: cell for key, cell in zip(keys, notebook_content.cells)
+               if fragments[key] is None}
+    if missing:
+        rendered = _render_cells(list(missing.values()), metadata)
+        for key, fragment in zip(missing, rendered):
+            fragment_cache.set(key, fragment)
+            fragments[key] = fragment
+    if body_only:
+        prefix, suffix = _body_shell(metadata)
+    else:
+        prefix, suffix = _page_shell(metadata)
+    return prefix + ''.join(fragments[key] for key in keys) + suffix
@@ -3,8 +3,15 @@ from flask_restful import Resource, reqparse
 from flask import current_app, jsonify, make_response, request
 from models import (
     create_user, get_user_by_username, get_user_by_id, update_user, delete_user,
-    create_notebook_content, create_new_notebook, save_notebook, get_notebook, delete_notebook
+    create_notebook_content, create_new_notebook, save_notebook, save_notebook_cells, get_notebook, get_notebook_content,
+    delete_notebook, resolve_usernames,
+    mongo
 )
+from blob_store import notebook_blobs
+from conditional import is_conditional, is_not_modified, not_modified_response, notebook_etag, validator_headers
+from pymongo.errors import DuplicateKeyError
+from render_jobs import enqueue_render
+from revisions import diff_revisions, list_revisions, load_revision
 from utils import clear_auth_cookie, set_auth_cookie, token_required, generate_token
 from werkzeug.security import check_password_hash, generate_password_hash
 import logging
@@ -136,6 +143,12 @@ class UserResource(Resource):
         return clear_auth_cookie(response)
 
 # Notebook Operations
+def queue_render(notebook_id, revision=None):
+    """Pre-render a newly committed revision outside the request thread."""
+    if current_app.config['RENDER_QUEUE_ENABLED']:
+        enqueue_render(mongo.db, notebook_id, revision)
+
+
 class NotebookCreate(Resource): #todo add logic to validate the notebook
     @token_required
     def post(self):
@@ -143,36 +156,128 @@ class NotebookCreate(Resource): #todo add logic to validate the notebook
         payload = request.get_json(silent=True) or {}
         try:
             notebook_id, slug = create_new_notebook(
-                author_id, request.user['username'], payload
+                author_id, request.user['username'], payload, payload.get('notebook_id')
             )
         except (ValueError, TypeError) as error:
             return {'message': str(error)}, 400
+        except DuplicateKeyError:
+            return {'message': 'This notebook was already published. Open it to edit it.'}, 409
+        queue_render(notebook_id)
         return {
             'message': 'Notebook created',
             'notebook_id': notebook_id,
             'slug': slug,
         }, 201
 
+def save_response(notebook_id, result):
+    """Translate a ``save_notebook`` result into an API response."""
+    if result.get('message') == 'not found':
+        return {'message': 'Notebook not found'}, 404
+    if result.get('message') == 'not_authorized':
+        return {'message': 'Unauthorized access to this notebook'}, 403
+    if result.get('message') == 'conflict':
+        return {
+            'message': 'This notebook was changed elsewhere. Reload it before publishing again.'
+        }, 409
+    if not result.get('unchanged'):
+        queue_render(notebook_id, result['revision'])
+    return {
+        'message': 'OK', 'notebook_id': notebook_id,
+        'slug': result['slug'], 'revision': result['revision'],
+    }, 200
+
+
 class NotebookSave(Resource):
     @token_required
     def put(self, notebook_id):
         payload = request.get_json(silent=True) or {}
-        notebook = get_notebook(notebook_id, request.user['id'])
-        if not notebook or notebook.get('message') == 'not found':
-            return {'message': 'Notebook not found'}, 404
-        if notebook.get('message') == 'not_authorized':
-            return {'message': 'Unauthorized access to this notebook'}, 403
-        if notebook['owner_id'] != request.user['id']:
-            return {'message': 'Unauthorized access to this notebook'}, 403
+        expected_revision = payload.get('expected_revision')
+        if expected_revision is not None and (
+                isinstance(expected_revision, bool) or not isinstance(expected_revision, int)):
+            return {'message': 'expected_revision must be an integer'}, 400
         try:
-            slug = save_notebook(
-                notebook_id, request.user['id'], request.user['username'], payload
+            result = save_notebook(
+                notebook_id, request.user['id'], request.user['username'], payload,
+                expected_revision,
             )
         except (ValueError, TypeError) as error:
             return {'message': str(error)}, 400
-        if not slug:
-            return {'message': 'Notebook not found'}, 404
-        return {'message': 'OK', 'notebook_id': notebook_id, 'slug': slug}, 200
+        return save_response(notebook_id, result)
+
+
+class NotebookCellsSave(Resource):
+    """Publish only the cells that changed since ``base_revision``."""
+
+    @token_required
+    def patch(self, notebook_id):
+        payload = request.get_json(silent=True) or {}
+        base_revision = payload.get('base_revision')
+        if isinstance(base_revision, bool) or not isinstance(base_revision, int):
+            return {'message': 'base_revision must be an integer'}, 400
+        try:
+            result = save_notebook_cells(
+                notebook_id, request.user['id'], base_revision, payload.get('operations')
+            )
+        except (ValueError, TypeError) as error:
+            return {'message': str(error)}, 400
+        if result.get('message') == 'unsupported':
+            return {'message': 'This notebook must be published in full'}, 422
+        return save_response(notebook_id, result)
+
+
+def owned_notebook(notebook_id):
+    """Return ``(notebook, None)`` for the requesting owner, else ``(None, response)``."""
+    notebook = get_notebook(notebook_id, request.user['id'], include_content=False)
+    if not notebook or notebook.get('message') == 'not found':
+        return None, ({'message': 'Notebook not found'}, 404)
+    if notebook.get('message') == 'not_authorized' or notebook['owner_id'] != request.user['id']:
+        return None, ({'message': 'Unauthorized access to this notebook'}, 403)
+    return notebook, None
+
+
+class NotebookRevisions(Resource):
+    """List the recorded revisions of an owned notebook, newest first."""
+
+    @token_required
+    def get(self, notebook_id):
+        notebook, error = owned_notebook(notebook_id)
+        if error:
+            return error
+        return {'revisions': [
+            {**item, 'created_at': item['created_at'].isoformat()}
+            for item in list_revisions(mongo.db, notebook['_id'])
+        ]}, 200
+
+
+class NotebookRevision(Resource):
+    """Return an owned notebook as it was at an earlier revision."""
+
+    @token_required
+    def get(self, notebook_id, revision):
+        notebook, error = owned_notebook(notebook_id)
+        if error:
+            return error
+        content = load_revision(mongo.db, notebook['_id'], revision)
+        if content is None:
+            return {'message': 'Revision not found'}, 404
+        return {'notebook': notebook_blobs.inline(content), 'revision': revision}, 200
+
+
+class NotebookRevisionDiff(Resource):
+    """Return the cell operations turning ``revision`` into ``other``."""
+
+    @token_required
+    def get(self, notebook_id, revision, other):
+        notebook, error = owned_notebook(notebook_id)
+        if error:
+            return error
+        diff = diff_revisions(mongo.db, notebook['_id'], revision, other)
+        if diff is None:
+            return {'message': 'Revision not found'}, 404
+        if diff['operations'] is None:
+            return {'message': 'Revisions without cell ids cannot be compared'}, 422
+        notebook_blobs.inline({'cells': [op['cell'] for op in diff['operations'] if 'cell' in op]})
+        return diff, 200
 
 class NotebookQuery(Resource):
     @token_required
@@ -186,7 +291,7 @@ class NotebookQuery(Resource):
                 )
             }, 200
         else:
-            notebook = get_notebook(notebook_id,user_id)
+            notebook = get_notebook(notebook_id, user_id, include_content=not is_conditional())
         
         if not notebook or notebook.get('message') == 'not found':
             return {'message': 'Notebook not found'}, 404
@@ -195,19 +300,30 @@ class NotebookQuery(Resource):
         #notebook['date']=notebook['date'].isoformat()
         if notebook['owner_id'] != request.user['id']:
             return {'message': 'Unauthorized access to this notebook'}, 403
-        
+
+        allowed_user_ids = notebook.get('allowed_user_ids', [])
+        usernames = resolve_usernames(allowed_user_ids)
+        allowed_users = [
+            usernames[str(user_id)] for user_id in allowed_user_ids
+            if str(user_id) in usernames
+        ]
+        # Renaming an allowed user changes the response but not the revision.
+        etag = notebook_etag(notebook, user_id, *allowed_users)
+        updated_at = notebook.get('updated_at')
+        if is_not_modified(etag, updated_at):
+            return not_modified_response(etag, updated_at)
         notebook['_id'] = str(notebook['_id'])
         return {
-            'notebook': notebook['notebook'],
+            'notebook': notebook_blobs.inline(
+                notebook.get('notebook') or get_notebook_content(notebook['_id'])
+            ),
             'slug': notebook.get('slug', ''),
+            'revision': notebook.get('revision'),
             'visibility': notebook.get(
                 'visibility', 'public' if notebook.get('is_public', True) else 'private'
             ),
-            'allowed_users': [
-                user['username'] for user_id in notebook.get('allowed_user_ids', [])
-                if (user := get_user_by_id(user_id))
-            ],
-        }, 200
+            'allowed_users': allowed_users,
+        }, 200, validator_headers(etag, updated_at)
 
 class NotebookDelete(Resource):
     @token_required
@@ -0,0 +1,275 @@
+"""Revision history of notebooks stored as snapshots and cell-level deltas.
+
+Every committed revision gets one ``notebook_revisions`` record holding the
+notebook without its cells (``skeleton``) and ``order``, the ``[cell_id,
+digest]`` pairs of its cells.  A snapshot record also holds every cell in
+``cells``, keyed by digest; a delta record only holds the cells that were not
+part of the previous revision.  A snapshot is written every
+``SNAPSHOT_INTERVAL`` revisions, so reading any revision fetches one snapshot
+and at most ``SNAPSHOT_INTERVAL - 1`` deltas.
+
+Records are written after the notebook update that committed the revision.
+When the previous record or a cell's content is unknown, the revision is read
+back from ``notebooks`` and recorded in full; if a newer save already replaced
+it, that revision is left out of the history and the next one starts a new
+snapshot.  Cells beyond :data:`RECORD_CELL_BYTES` of BSON, as in snapshots of
+chunked notebooks, continue in ``notebook_revision_cells`` parts, so no
+record reaches MongoDB's document size limit.  A revision that cannot be
+recorded is logged and left out; the save that committed it still succeeds.
+"""
+
+from datetime import datetime, timezone
+import logging
+
+import bson
+from bson.errors import InvalidDocument
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+import cell_store
+
+SNAPSHOT_INTERVAL = 10
+RECORD_CELL_BYTES = 8 << 20
+SUMMARY_FIELDS = {'_id': 0, 'revision': 1, 'base': 1, 'created_at': 1}
+
+logger = logging.getLogger(__name__)
+
+
+def _notebook_id(notebook_id):
+    return ObjectId(notebook_id) if ObjectId.is_valid(str(notebook_id)) else notebook_id
+
+
+def split_notebook(notebook):
+    """Return ``(skeleton, order, cells)`` describing ``notebook``."""
+    order = []
+    cells = {}
+    for cell in notebook.get('cells', []):
+        digest = cell_store.cell_digest(cell)
+        order.append([cell.get('id'), digest])
+        cells[digest] = cell
+    return cell_store.skeleton(notebook), order, cells
+
+
+def _stored_revision(db, notebook_id, revision):
+    """Return ``split_notebook`` of the stored notebook if still at ``revision``."""
+    document = db.notebooks.find_one(
+        {'_id': notebook_id, 'revision': revision}, cell_store.CONTENT_FIELDS
+    )
+    if document is None:
+        return None
+    try:
+        notebook = cell_store.load_notebook(db, document)
+    except cell_store.StaleChunks:
+        return None
+    return split_notebook(notebook) if notebook is not None else None
+
+
+def split_cells(cells, limit=RECORD_CELL_BYTES):
+    """Return ``cells`` as a list of mappings of about ``limit`` bytes of BSON each."""
+    parts, part, size = [], {}, 0
+    for digest, cell in cells.items():
+        cell_size = len(bson.encode({digest: cell}))
+        if part and size + cell_size > limit:
+            parts.append(part)
+            part, size = {}, 0
+        part[digest] = cell
+        size += cell_size
+    parts.append(part)
+    return parts
+
+
+def _insert_record(db, record, limit):
+    """Insert ``record``, moving cells past ``limit`` bytes to continuation parts.
+
+    Parts are written first, so a record is only visible once complete.
+    """
+    parts = split_cells(record['cells'], limit)
+    record['cells'] = parts[0]
+    if len(parts) > 1:
+        record['parts'] = len(parts) - 1
+        key = {'notebook_id': record['notebook_id'], 'revision': record['revision']}
+        for number, cells in enumerate(parts[1:], 1):
+            db.notebook_revision_cells.insert_one({**key, 'part': number, 'cells': cells})
+    try:
+        db.notebook_revisions.insert_one(record)
+    except Exception:
+        if len(parts) > 1:
+            db.notebook_revision_cells.delete_many(key)
+        raise
+
+
+def record_revision(db, notebook_id, revision, skeleton, order, cells=None,
+                    interval=SNAPSHOT_INTERVAL, limit=RECORD_CELL_BYTES):
+    """Add ``revision`` of a notebook to its history.
+
+    ``order`` lists ``[cell_id, digest]`` pairs; a ``None`` digest means the
+    cell is unchanged since the previous revision.  ``cells`` maps digests to
+    content and needs at least the cells that are new in this revision.
+    Returns the record, or ``None`` when the revision could not be recorded.
+    """
+    try:
+        return _record_revision(db, _notebook_id(notebook_id), revision, skeleton, order,
+                                cells or {}, interval, limit)
+    except DuplicateKeyError:  # already recorded by a retried save
+        return None
+    except (PyMongoError, InvalidDocument):
+        logger.exception('Revision %s of notebook %s could not be recorded',
+                         revision, notebook_id)
+        return None
+
+
+def _record_revision(db, notebook_id, revision, skeleton, order, cells, interval, limit):
+    previous = db.notebook_revisions.find_one(
+        {'notebook_id': notebook_id, 'revision': revision - 1}, {'order': 1, 'base': 1}
+    )
+    if previous is not None:
+        unchanged = {cell_id: digest for cell_id, digest in previous['order'] if cell_id}
+        order = [[cell_id, digest or unchanged.get(cell_id)] for cell_id, digest in order]
+    delta = previous is not None and revision - previous['base'] < interval
+    known = {digest for _, digest in previous['order']} if delta else set()
+    needed = {digest for _, digest in order if digest not in known}
+    if None in needed or not needed <= cells.keys():
+        stored = _stored_revision(db, notebook_id, revision)
+        if stored is None:
+            logger.warning('Revision %s of notebook %s was replaced before it was recorded',
+                           revision, notebook_id)
+            return None
+        skeleton, order, cells = stored
+        needed = {digest for _, digest in order if digest not in known}
+    record = {
+        'notebook_id': notebook_id,
+        'revision': revision,
+        'base': previous['base'] if delta else revision,
+        'created_at': datetime.now(timezone.utc),
+        'skeleton': skeleton,
+        'order': order,
+        'cells': {digest: cells[digest] for digest in needed},
+    }
+    _insert_record(db, record, limit)
+    return record
+
+
+def record_notebook(db, notebook_id, revision, notebook):
+    """Add ``revision`` with its complete ``notebook`` to the history."""
+    return record_revision(db, notebook_id, revision, *split_notebook(notebook))
+
+
+def record_document(db, document):
+    """Add the revision held by a ``notebooks`` document in either layout.
+
+    Chunked notebooks are described by their chunk references, so only the
+    chunks of new cells are read.
+    """
+    if cell_store.is_chunked(document):
+        order = [[ref['cell_id'], ref['digest']] for ref in document['cell_chunks']]
+        return record_revision(db, document['_id'], document['revision'],
+                               document['notebook_skeleton'], order)
+    return record_notebook(db, document['_id'], document['revision'], document['notebook'])
+
+
+def rebuild(records):
+    """Return the notebook of the last of ``records``, ordered by revision.
+
+    The first record must be the snapshot the others are based on.
+    """
+    pool = {}
+    for record in records:
+        pool.update(record['cells'])
+    target = records[-1]
+    return {**target['skeleton'], 'cells': [pool[digest] for _, digest in target['order']]}
+
+
+def load_revision(db, notebook_id, revision):
+    """Return the notebook at ``revision``, or ``None`` if it is not recorded."""
+    notebook_id = _notebook_id(notebook_id)
+    target = db.notebook_revisions.find_one(
+        {'notebook_id': notebook_id, 'revision': revision}, {'base': 1}
+    )
+    if target is None:
+        return None
+    records = list(db.notebook_revisions.find(
+        {'notebook_id': notebook_id, 'revision': {'$gte': target['base'], '$lte': revision}}
+    ).sort('revision', ASCENDING))
+    if [record['revision'] for record in records] != list(range(target['base'], revision + 1)):
+        return None
+    continued = {record['revision']: record for record in records if record.get('parts')}
+    if continued:
+        found = {}
+        for part in db.notebook_revision_cells.find(
+                {'notebook_id': notebook_id, 'revision': {'$in': list(continued)}}):
+            continued[part['revision']]['cells'].update(part['cells'])
+            found[part['revision']] = found.get(part['revision'], 0) + 1
+        if any(found.get(number) != record['parts'] for number, record in continued.items()):
+            return None
+    return rebuild(records)
+
+
+def list_revisions(db, notebook_id, limit=100):
+    """Return the newest recorded revisions of a notebook, newest first."""
+    cursor = db.notebook_revisions.find(
+        {'notebook_id': _notebook_id(notebook_id)}, SUMMARY_FIELDS
+    ).sort('revision', DESCENDING).limit(limit)
+    return [
+        {'revision': record['revision'], 'created_at': record['created_at'],
+         'snapshot': record['base'] == record['revision']}
+        for record in cursor
+    ]
+
+
+def cell_operations(before, after):
+    """Return the cell operations turning ``before`` cells into ``after``.
+
+    The operations use the format accepted by cell-level saves.  Returns
+    ``None`` when a cell has no id.
+    """
+    if not all(isinstance(cell.get('id'), str) for cell in [*before, *after]):
+        return None
+    previous = {cell['id']: cell for cell in before}
+    current = {cell['id'] for cell in after}
+    operations = []
+    order = []
+    for cell in before:
+        if cell['id'] in current:
+            order.append(cell['id'])
+        else:
+            operations.append({'op': 'delete', 'id': cell['id']})
+    for index, cell in enumerate(after):
+        cell_id = cell['id']
+        opened = previous.get(cell_id)
+        if opened is None:
+            operations.append({'op': 'insert', 'index': index, 'cell': cell})
+            order.insert(index, cell_id)
+            continue
+        if order[index] != cell_id:
+            operations.append({'op': 'move', 'id': cell_id, 'index': index})
+            order.remove(cell_id)
+            order.insert(index, cell_id)
+        if cell_store.cell_digest(opened) != cell_store.cell_digest(cell):
+            operations.append({'op': 'update', 'cell': cell})
+    return operations
+
+
+def diff_revisions(db, notebook_id, old, new):
+    """Return how revision ``new`` of a notebook differs from ``old``.
+
+    The result holds the cell ``operations`` and, when it changed, the new
+    notebook ``metadata``.  Returns ``None`` when a revision is not recorded
+    and ``{'operations': None}`` when the cells cannot be matched by id.
+    """
+    before = load_revision(db, notebook_id, old)
+    after = load_revision(db, notebook_id, new)
+    if before is None or after is None:
+        return None
+    diff = {'from': old, 'to': new,
+            'operations': cell_operations(before['cells'], after['cells'])}
+    if before.get('metadata') != after.get('metadata'):
+        diff['metadata'] = after.get('metadata')
+    return diff
+
+
+def discard_history(db, notebook_ids):
+    """Delete the history of the given notebooks."""
+    query = {'notebook_id': {'$in': [_notebook_id(notebook_id) for notebook_id in notebook_ids]}}
+    db.notebook_revisions.delete_many(query)
+    db.notebook_revision_cells.delete_many(query)
@@ -0,0 +1,175 @@
+"""Ranked full-text search over notebook titles, summaries and cell text.
+
+Notebooks are indexed when they are saved.  The source of their markdown and
+code cells (outputs are skipped) is split into terms and every distinct term
+gets one posting in ``search_postings`` holding its weighted frequency: terms
+of the title count three times, terms of the summary and tags twice.
+``search_documents`` records the revision and length indexed for each
+notebook and the ``corpus`` document of ``search_stats`` the totals BM25
+needs, maintained with ``$inc``.
+
+:func:`search` scores the postings of the query terms with BM25, reading them
+from ``ix_search_postings_term_tf`` in decreasing frequency, and returns the
+best notebooks that pass :func:`access.access_filter`.  Only the
+:data:`MAX_POSTINGS` most frequent postings of a term are scored, so a term
+found in most notebooks costs a bounded read; notebooks ranked on such a term
+alone are the ones using it most.
+"""
+
+from collections import Counter, defaultdict
+import math
+import re
+
+from bson.objectid import ObjectId
+from pymongo import DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from access import access_filter
+
+TOKEN = re.compile(r'\w+')
+# Embedded images would otherwise fill the index with base64 fragments.
+DATA_URI = re.compile(r'data:[^\s)"\']*')
+STOPWORDS = frozenset(
+    'an and are as at be but by for from has have in is it its of on or that the this '
+    'to was were will with'.split()
+)
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 40
+TITLE_WEIGHT = 3
+SUMMARY_WEIGHT = 2
+MAX_TEXT_LENGTH = 1_000_000
+MAX_TERMS = 5000
+MAX_QUERY_TERMS = 8
+MAX_POSTINGS = 1000
+CANDIDATE_BATCH = 100
+K1 = 1.2
+B = 0.75
+POSTING_FIELDS = {'_id': 0, 'notebook_id': 1, 'tf': 1, 'length': 1}
+
+
+def tokenize(text):
+    """Return the searchable terms of ``text`` in order."""
+    return [term for term in TOKEN.findall(DATA_URI.sub(' ', text[:MAX_TEXT_LENGTH]).casefold())
+            if MIN_TERM_LENGTH <= len(term) <= MAX_TERM_LENGTH and term not in STOPWORDS]
+
+
+def _source(cell):
+    source = cell.get('source', '')
+    return ''.join(source) if isinstance(source, list) else source
+
+
+def notebook_text(notebook):
+    """Return the ``(summary, body)`` text of a notebook's markdown and code cells."""
+    summary, body = [], []
+    for cell in (notebook or {}).get('cells', []):
+        if cell.get('cell_type') not in ('markdown', 'code'):
+            continue
+        is_summary = (cell.get('metadata') or {}).get('type') == 'summary'
+        (summary if is_summary else body).append(_source(cell))
+    return '\n'.join(summary), '\n'.join(body)
+
+
+def term_frequencies(title, summary, tags, notebook):
+    """Return the weighted frequency of every term of a notebook."""
+    summary_cells, body = notebook_text(notebook)
+    frequencies = Counter(tokenize(body))
+    for term in tokenize('\n'.join([summary or '', summary_cells, *tags])):
+        frequencies[term] += SUMMARY_WEIGHT
+    for term in tokenize(title or ''):
+        frequencies[term] += TITLE_WEIGHT
+    return dict(frequencies.most_common(MAX_TERMS))
+
+
+def index_notebook(db, notebook_id, revision, notebook, title='', summary='', tags=()):
+    """Replace the postings of a notebook by those of ``revision``.
+
+    Returns ``False`` without writing when a later revision is already
+    indexed, so concurrent saves leave the newest one searchable.
+    """
+    notebook_id = ObjectId(notebook_id)
+    frequencies = term_frequencies(title, summary, tags, notebook)
+    length = sum(frequencies.values())
+    try:
+        previous = db.search_documents.find_one_and_update(
+            {'_id': notebook_id, 'revision': {'$lt': revision}},
+            {'$set': {'revision': revision, 'length': length}},
+            upsert=True, return_document=ReturnDocument.BEFORE,
+        )
+    except DuplicateKeyError:  # the indexed revision is not older
+        return False
+    db.search_stats.update_one(
+        {'_id': 'corpus'},
+        {'$inc': {'documents': 0 if previous else 1,
+                  'length': length - (previous or {}).get('length', 0)}},
+        upsert=True,
+    )
+    if frequencies:
+        db.search_postings.insert_many([
+            {'term': term, 'notebook_id': notebook_id, 'revision': revision,
+             'tf': tf, 'length': length}
+            for term, tf in frequencies.items()
+        ], ordered=False)
+    db.search_postings.delete_many({'notebook_id': notebook_id, 'revision': {'$lt': revision}})
+    return True
+
+
+def discard(db, notebook_ids):
+    """Remove deleted notebooks from the index."""
+    notebook_ids = [ObjectId(notebook_id) for notebook_id in notebook_ids]
+    if not notebook_ids:
+        return
+    removed = [document for document in
+               (db.search_documents.find_one_and_delete({'_id': notebook_id}, {'length': 1})
+                for notebook_id in notebook_ids) if document]
+    db.search_postings.delete_many({'notebook_id': {'$in': notebook_ids}})
+    if removed:
+        db.search_stats.update_one(
+            {'_id': 'corpus'},
+            {'$inc': {'documents': -len(removed),
+                      'length': -sum(document.get('length', 0) for document in removed)}},
+        )
+
+
+def score(db, terms):
+    """Return the BM25 score of every notebook holding one of ``terms``."""
+    stats = db.search_stats.find_one({'_id': 'corpus'}) or {}
+    documents = max(stats.get('documents', 0), 1)
+    average_length = max(stats.get('length', 0), 1) / documents
+    scores = defaultdict(float)
+    for term in terms:
+        postings = list(db.search_postings.find({'term': term}, POSTING_FIELDS)
+                        .sort('tf', DESCENDING).limit(MAX_POSTINGS))
+        frequency = len(postings)
+        if frequency == MAX_POSTINGS:
+            frequency = db.search_postings.count_documents({'term': term})
+        weight = math.log(1 + (documents - frequency + 0.5) / (frequency + 0.5))
+        for posting in postings:
+            tf = posting['tf']
+            norm = K1 * (1 - B + B * posting['length'] / average_length)
+            scores[posting['notebook_id']] += weight * tf * (K1 + 1) / (tf + norm)
+    return scores
+
+
+def search(db, user_id, text, projection=None, limit=20):
+    """Return up to ``limit`` ``(document, score)`` pairs matching ``text``.
+
+    Documents are read from ``notebooks`` with ``projection`` and ranked best
+    first.
+    """
+    terms = list(dict.fromkeys(tokenize(text or '')))[:MAX_QUERY_TERMS]
+    if not terms or limit < 1:
+        return []
+    scores = score(db, terms)
+    ranked = sorted(scores, key=scores.__getitem__, reverse=True)
+    readable = access_filter(user_id)
+    results = []
+    for start in range(0, len(ranked), CANDIDATE_BATCH):
+        batch = ranked[start:start + CANDIDATE_BATCH]
+        found = {document['_id']: document for document in db.notebooks.find(
+            {'$and': [{'_id': {'$in': batch}}, readable]}, projection
+        )}
+        results.extend((found[notebook_id], scores[notebook_id])
+                       for notebook_id in batch if notebook_id in found)
+        if len(results) >= limit:
+            break
+    return results[:limit]
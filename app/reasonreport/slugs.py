@@ -0,0 +1,53 @@
+"""Allocation of unique notebook slugs.
+
+A notebook published as ``title`` gets the slug ``title``, or ``title-N`` with
+the smallest free ``N`` when that is taken.  :func:`allocate_slug` reads every
+taken candidate with one anchored prefix query on ``uq_notebooks_slug``
+instead of probing candidates one by one.  Two concurrent publishes can still
+pick the same slug; the unique index rejects the second write and
+:func:`write_with_slug` allocates again and retries it.
+"""
+
+import re
+
+from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+SLUG_ATTEMPTS = 5
+
+
+def allocate_slug(db, base, notebook_id=None):
+    """Return ``base`` or the first free ``base-N``, ignoring ``notebook_id``."""
+    query = {'slug': {'$regex': f'^{re.escape(base)}(-[0-9]+)?$'}}
+    if notebook_id:
+        query['_id'] = {'$ne': ObjectId(notebook_id)}
+    taken = {document['slug'] for document in db.notebooks.find(query, {'_id': 0, 'slug': 1})}
+    if base not in taken:
+        return base
+    counter = 1
+    while f'{base}-{counter}' in taken:
+        counter += 1
+    return f'{base}-{counter}'
+
+
+def is_slug_conflict(error):
+    """Return whether a ``DuplicateKeyError`` was raised by the slug index."""
+    details = error.details or {}
+    return 'slug' in details.get('keyPattern', {}) or 'uq_notebooks_slug' in str(error)
+
+
+def write_with_slug(db, base, write, notebook_id=None, slug=None):
+    """Return ``write(slug)`` for a free slug derived from ``base``.
+
+    ``slug`` is tried first when given.  When another notebook took the slug
+    meanwhile a new one is allocated, up to :data:`SLUG_ATTEMPTS` times.
+    """
+    for attempt in range(SLUG_ATTEMPTS):
+        if slug is None:
+            slug = allocate_slug(db, base, notebook_id)
+        try:
+            return write(slug)
+        except DuplicateKeyError as error:
+            if not is_slug_conflict(error) or attempt == SLUG_ATTEMPTS - 1:
+                raise
+            slug = None
@@ -9,6 +9,8 @@
     const documentId = iframe.dataset.documentId;
     const editorUrl = iframe.dataset.editorUrl;
     const editorNonce = iframe.dataset.editorNonce;
+    // A draft is not stored until its first publish creates it under documentId.
+    const draft = iframe.dataset.draft === 'true';
     const expectedOrigin = window.location.origin;
     let editorReady = false;
     let publishing = false;
@@ -142,7 +144,7 @@
         const message = event.data;
         if (message.msgtype === 'ready') {
             installEditorButtons();
-            send({ msgtype: 'create', documentId, editorNonce });
+            send({ msgtype: 'create', documentId, editorNonce, draft });
         } else if (message.msgtype === 'loaded') {
             editorReady = true;
             if (visibilitySelect && message.visibility) {
@@ -161,7 +163,7 @@
             }
             window.location.assign(`/slug/${encodeURIComponent(slug)}`);
         } else if (message.msgtype === 'cleanup-result') {
-            window.location.assign(documentId === '-1' ? '/' : `/id/${documentId}`);
+            window.location.assign(draft || documentId === '-1' ? '/' : `/id/${documentId}`);
         } else if (message.msgtype === 'error') {
             finishPublishing();
             closing = false;
@@ -56,10 +56,25 @@ async def refresh_session():
 
 
 async def list_documents(limit=50):
-    """List notebooks the logged-in user may read."""
+    """List the newest notebooks the logged-in user may read."""
     return (await _request(f'/api/editor/notebooks?limit={int(limit)}'))['documents']
 
 
+async def iter_documents(page_size=50):
+    """Yield every notebook the logged-in user may read, newest first, page by page."""
+    cursor = None
+    while True:
+        path = f'/api/editor/notebooks?limit={int(page_size)}'
+        if cursor:
+            path += f'&cursor={quote(cursor, safe="")}'
+        page = await _request(path)
+        for document in page['documents']:
+            yield document
+        cursor = page.get('next_cursor')
+        if not cursor:
+            return
+
+
 async def get_document(notebook_id):
     """Read a notebook by ID when it is public or owned by the logged-in user."""
     return (await _request(f'/api/editor/notebooks/{quote(str(notebook_id), safe="")}'))['document']
@@ -74,6 +89,36 @@ async def query_documents(filters=None, limit=50):
     ))['documents']
 
 
+async def iter_query_documents(filters=None, page_size=50):
+    """Yield every notebook matching ``filters``, newest first, following the page cursors."""
+    cursor = None
+    while True:
+        page = await _request(
+            '/api/editor/notebooks/query',
+            method='POST',
+            payload={'filters': filters or {}, 'limit': int(page_size), 'cursor': cursor},
+        )
+        for document in page['documents']:
+            yield document
+        cursor = page.get('next_cursor')
+        if not cursor:
+            return
+
+
+async def search_documents(text, limit=20):
+    """Return the readable notebooks best matching ``text``, with their relevance ``score``."""
+    return (await _request(
+        f'/api/editor/search?q={quote(str(text))}&limit={int(limit)}'
+    ))['documents']
+
+
+async def complete_titles(prefix, limit=10):
+    """Return the newest readable notebooks whose title starts with ``prefix``."""
+    return (await _request(
+        f'/api/editor/titles?prefix={quote(str(prefix))}&limit={int(limit)}'
+    ))['documents']
+
+
 async def admin_overview():
     """Return user count and the 10 newest pages; available only to admin."""
     return await _request('/api/editor/admin/overview')
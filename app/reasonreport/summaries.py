@@ -0,0 +1,134 @@
+"""Listing fields derived from a notebook's cells when it is saved.
+
+A notebook's summary lives in its markdown cells tagged ``metadata.type ==
+'summary'``, and its size, languages and pictures are only known by reading
+every cell.  :func:`summary_fields` extracts them once per save into small
+fields of the ``notebooks`` document:
+
+``summary``
+    The text of the summary cells, whitespace collapsed.  Notebooks without
+    one keep the summary they were stored with, such as one given through
+    MCP.
+``first_image``
+    ``{'cell_id', 'url'}`` of the first image a listing can link to: a
+    markdown image, or an output or attachment moved to the blob store.
+    Inline ``data:`` images are skipped.
+``cell_count`` and ``word_count``
+    The number of cells and of words in markdown cells.
+``code_languages``
+    The kernel language and cell-magic languages of the code cells.
+
+Listings then project these fields instead of the notebook body.
+"""
+
+import re
+
+from blob_store import BLOB_TYPES, BLOB_URL, blob_reference
+
+SUMMARY_FIELDS = ('summary', 'first_image', 'cell_count', 'word_count', 'code_languages')
+MAX_SUMMARY_LENGTH = 2000
+MAX_IMAGE_URL_LENGTH = 2048
+WORD = re.compile(r'\w+')
+WHITESPACE = re.compile(r'\s+')
+MARKDOWN_IMAGE = re.compile(r'!\[[^\]]*\]\(\s*<?([^)\s>]+)')
+HTML_IMAGE = re.compile(r'<img\b[^>]*?\bsrc\s*=\s*["\']([^"\']+)', re.IGNORECASE)
+# Cell magics running another language, by the name they are listed under.
+CELL_MAGICS = {
+    'bash': 'bash', 'sh': 'bash', 'html': 'html', 'javascript': 'javascript',
+    'js': 'javascript', 'latex': 'latex', 'perl': 'perl', 'r': 'r', 'ruby': 'ruby',
+    'sql': 'sql', 'svg': 'svg',
+}
+CELL_MAGIC = re.compile(r'\s*%%(\w+)')
+
+
+def _source(cell):
+    source = cell.get('source', '')
+    return ''.join(source) if isinstance(source, list) else source
+
+
+def _blob_url(bundle):
+    for mime, value in (bundle or {}).items():
+        digest = blob_reference(value) if mime in BLOB_TYPES else None
+        if digest:
+            return BLOB_URL.format(digest=digest)
+    return None
+
+
+def cell_image(cell):
+    """Return the URL of the first image of ``cell`` a listing can link to, or ``None``."""
+    if cell.get('cell_type') == 'markdown':
+        source = _source(cell)
+        matches = sorted(
+            (match.start(), match.group(1))
+            for pattern in (MARKDOWN_IMAGE, HTML_IMAGE) for match in pattern.finditer(source)
+        )
+        for _, url in matches:
+            if url.startswith('attachment:'):
+                url = _blob_url((cell.get('attachments') or {}).get(url[len('attachment:'):]))
+            if url and not url.startswith('data:') and len(url) <= MAX_IMAGE_URL_LENGTH:
+                return url
+    for output in cell.get('outputs') or []:
+        url = _blob_url(output.get('data'))
+        if url:
+            return url
+    return None
+
+
+def first_image(cells, previous=None, touched=None):
+    """Return ``{'cell_id', 'url'}`` of the first image of ``cells``, or ``None``.
+
+    When only the ``touched`` cells are complete, as in a cell-level save,
+    the others hold their source alone; ``previous``, the ``first_image`` of
+    the stored revision, is kept when its cell is reached unchanged.
+    """
+    for cell in cells:
+        cell_id = cell.get('id')
+        url = cell_image(cell)
+        if url:
+            return {'cell_id': cell_id, 'url': url}
+        if touched is not None and previous and cell_id == previous.get('cell_id') \
+                and cell_id not in touched:
+            return previous
+    return None
+
+
+def code_languages(notebook):
+    """Return the sorted languages the code cells of ``notebook`` are written in."""
+    metadata = notebook.get('metadata') or {}
+    kernel = ((metadata.get('language_info') or {}).get('name')
+              or (metadata.get('kernelspec') or {}).get('language') or 'python').casefold()
+    languages = set()
+    for cell in notebook.get('cells', []):
+        source = _source(cell)
+        if cell.get('cell_type') != 'code' or not source.strip():
+            continue
+        magic = CELL_MAGIC.match(source)
+        languages.add(CELL_MAGICS.get(magic.group(1).casefold(), kernel) if magic else kernel)
+    return sorted(languages)
+
+
+def summary_fields(notebook, previous=None, touched=None):
+    """Return the :data:`SUMMARY_FIELDS` of ``notebook``.
+
+    ``previous`` holds the fields stored for the previous revision, if any;
+    its ``first_image`` and ``touched`` are passed on to :func:`first_image`.
+    """
+    previous = previous or {}
+    cells = notebook.get('cells', [])
+    summary, words = None, 0
+    for cell in cells:
+        if cell.get('cell_type') != 'markdown':
+            continue
+        source = _source(cell)
+        words += len(WORD.findall(source))
+        if (cell.get('metadata') or {}).get('type') == 'summary':
+            summary = f'{summary} {source}' if summary else source
+    if summary is None:
+        summary = previous.get('summary') or ''
+    return {
+        'summary': WHITESPACE.sub(' ', summary).strip()[:MAX_SUMMARY_LENGTH],
+        'first_image': first_image(cells, previous.get('first_image'), touched),
+        'cell_count': len(cells),
+        'word_count': words,
+        'code_languages': code_languages(notebook),
+    }
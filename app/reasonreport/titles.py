@@ -0,0 +1,54 @@
+"""Title prefix completion, newest first.
+
+Every notebook stores ``title_normalized``, its title case-folded with accents
+and repeated whitespace removed, and ``title_prefixes``, the prefixes of that
+normalized title up to :data:`MAX_PREFIX_LENGTH` characters.  A completion is
+then an equality on the multikey index ``ix_notebooks_title_prefix_updated``,
+which also holds ``updated_at``: MongoDB reads the newest matches in index
+order and stops after ``limit`` readable ones, however many titles share a
+short prefix.  Longer prefixes use their first :data:`MAX_PREFIX_LENGTH`
+characters for the index scan and are compared in full against
+``title_normalized``.
+"""
+
+import re
+import unicodedata
+
+from pymongo import DESCENDING
+
+from access import access_filter
+
+MAX_PREFIX_LENGTH = 20
+PREFIX_INDEX = 'ix_notebooks_title_prefix_updated'
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_title(title):
+    """Return ``title`` case-folded, without accents and with single spaces."""
+    decomposed = unicodedata.normalize('NFKD', title or '')
+    stripped = ''.join(character for character in decomposed if not unicodedata.combining(character))
+    return WHITESPACE.sub(' ', stripped.casefold()).strip()
+
+
+def title_fields(title):
+    """Return the stored fields completing ``title``."""
+    normalized = normalize_title(title)
+    return {
+        'title_normalized': normalized,
+        'title_prefixes': [normalized[:length]
+                           for length in range(1, min(len(normalized), MAX_PREFIX_LENGTH) + 1)],
+    }
+
+
+def complete(db, user_id, prefix, projection=None, limit=10):
+    """Return the ``limit`` newest notebooks ``user_id`` may read whose title starts with ``prefix``."""
+    normalized = normalize_title(prefix)
+    if not normalized:
+        return []
+    query = {'title_prefixes': normalized[:MAX_PREFIX_LENGTH]}
+    if len(normalized) > MAX_PREFIX_LENGTH:
+        query['title_normalized'] = {'$regex': f'^{re.escape(normalized)}'}
+    return list(
+        db.notebooks.find({'$and': [query, access_filter(user_id)]}, projection)
+        .sort('updated_at', DESCENDING).hint(PREFIX_INDEX).limit(limit)
+    )
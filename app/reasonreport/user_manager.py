@@ -1,9 +1,17 @@
 """Administrative user helpers backed by the active PyMongo models."""
 
+from datetime import datetime, timezone
+
 from werkzeug.security import generate_password_hash
 
-from .models import create_user as create_user_record
-from .models import USER_ROLES, mongo
+from access import owner_filter
+from cell_store import discard_notebooks
+from facets import FACET_FIELDS, record_deletions
+from feed import discard as discard_feed
+from revisions import discard_history
+from search import discard as discard_search
+from models import create_user as create_user_record
+from models import USER_ROLES, invalidate_user, mongo
 
 
 def _public_user(user):
@@ -54,7 +62,9 @@ def modify_user(username, new_password=None, new_status=None, new_role=None):
 
     if not update_fields:
         return f"No updates provided for user '{username}'."
+    update_fields['updated_at'] = datetime.now(timezone.utc)
     mongo.db.users.update_one({'_id': user['_id']}, {'$set': update_fields})
+    invalidate_user(user['_id'])
     return f"User '{username}' updated successfully."
 
 
@@ -65,7 +75,14 @@ def delete_user(username):
         return f"User '{username}' not found."
     user_id = str(user['_id'])
     mongo.db.users.delete_one({'_id': user['_id']})
-    mongo.db.notebooks.delete_many({'$or': [
-        {'owner_id': user_id}, {'author': user_id}
-    ]})
+    invalidate_user(user_id)
+    owned = owner_filter(user_id)
+    notebooks = list(mongo.db.notebooks.find(owned, FACET_FIELDS))
+    notebook_ids = [notebook['_id'] for notebook in notebooks]
+    mongo.db.notebooks.delete_many(owned)
+    discard_notebooks(mongo.db, notebook_ids)
+    discard_history(mongo.db, notebook_ids)
+    discard_search(mongo.db, notebook_ids)
+    record_deletions(mongo.db, notebooks)
+    discard_feed(mongo.db, notebook_ids)
     return f"User '{username}' deleted successfully."
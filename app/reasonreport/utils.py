@@ -1,6 +1,6 @@
 # utils.py
 from functools import wraps
-from flask import current_app, request
+from flask import current_app, g, request
 from models import get_user_by_id
 import jwt
 from datetime import datetime, timedelta, timezone
@@ -23,6 +23,19 @@ def decode_token(token):
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         return None
 
+def load_token_user(token):
+    """
+    Return ``(user_id, user)`` for a token, memoized for the current request.
+
+    ``user_id`` is None for an invalid token and ``user`` is None when the
+    account no longer exists.
+    """
+    memo = g.setdefault('token_users', {})
+    if token not in memo:
+        user_id = decode_token(token)
+        memo[token] = (user_id, get_user_by_id(user_id) if user_id else None)
+    return memo[token]
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -32,11 +45,10 @@ def token_required(f):
         if not token:
             return {'message': 'Token is missing!'}, 401
         
-        user_id = decode_token(token)
+        user_id, user = load_token_user(token)
         if not user_id:
             return {'message': 'Token is invalid or expired!'}, 401
         
-        user = get_user_by_id(user_id)
         if not user:
             return {'message': 'User not found!'}, 401
         
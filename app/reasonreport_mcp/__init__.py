@@ -1 +1,14 @@
-"""ReasonReport's authenticated Model Context Protocol server."""
+"""ReasonReport's authenticated Model Context Protocol server.
+
+The server shares the web application's Flask-free storage modules
+(:mod:`access`, :mod:`cell_store`, :mod:`search` and their neighbours), which
+import each other by their flat names, so their directory is put on the path
+before :mod:`reasonreport_mcp.service` imports them.
+"""
+
+import sys
+from pathlib import Path
+
+APPLICATION_MODULES = str(Path(__file__).resolve().parents[1] / "reasonreport")
+if APPLICATION_MODULES not in sys.path:
+    sys.path.append(APPLICATION_MODULES)
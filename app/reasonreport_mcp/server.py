@@ -7,6 +7,8 @@ from mcp.server.auth.settings import AuthSettings
 from mcp.server.fastmcp import FastMCP
 from pymongo import MongoClient
 
+from blob_store import BlobStore, configure_blob_store
+
 from .auth import MongoTokenVerifier
 from .service import KnowledgeService
 
@@ -16,7 +18,16 @@ database = mongo.get_default_database()
 resource_url = os.environ["MCP_PUBLIC_URL"].rstrip("/")
 issuer_url = os.environ.get("MCP_ISSUER_URL") or resource_url
 pepper = os.environ["MCP_TOKEN_PEPPER"]
-service = KnowledgeService(database)
+blobs = configure_blob_store(BlobStore(), {
+    "BLOB_STORE_BACKEND": os.environ.get("BLOB_STORE_BACKEND", "mongo"),
+    "BLOB_STORE_DIR": os.environ.get("BLOB_STORE_DIR", "/var/lib/reasonreport/blobs"),
+    "BLOB_THRESHOLD_BYTES": int(os.environ.get("BLOB_THRESHOLD_BYTES", "16384")),
+}, database)
+service = KnowledgeService(
+    database,
+    render_queue=os.environ.get("RENDER_QUEUE_ENABLED", "").lower() in {"1", "true", "yes"},
+    blobs=blobs,
+)
 verifier = MongoTokenVerifier(database, pepper)
 mcp = FastMCP(
     "ReasonReport Knowledge Database",
@@ -49,17 +60,52 @@ def add_document(title: str, content: str, summary: str = "", tags: list[str] |
 
 
 @mcp.tool()
-def get_document(document_id: str, include_content: bool = True) -> dict:
-    """Read accessible notebook content and server-owned metadata, including author ID."""
-    return service.read(identity("documents:read"), document_id, include_content)
+def get_document(document_id: str, include_content: bool = True,
+                 known_revision: int | None = None, cell_offset: int = 0,
+                 cell_limit: int | None = None) -> dict:
+    """Read accessible notebook content and server-owned metadata, including author ID.
+
+    Pass the revision you already hold as known_revision; if it is still current
+    the reply is metadata with not_modified set and no content.  Large notebooks
+    can be read in pages of cell_limit cells starting at cell_offset; cell_count
+    gives the total.
+    """
+    return service.read(identity("documents:read"), document_id, include_content,
+                        known_revision, cell_offset, cell_limit)
 
 
 @mcp.tool()
 def find_documents(query: str = "", limit: int = 20) -> list[dict]:
-    """Find accessible documents by title, summary, or exact tag."""
+    """Find accessible documents, newest first, or search them with a query.
+
+    A query searches titles, summaries, tags and cell text and returns the best
+    matches with their score.  Use list_documents_page to page through all documents.
+    """
     return service.list(identity("documents:read"), query, limit)
 
 
+@mcp.tool()
+def list_documents_page(limit: int = 20, cursor: str | None = None) -> dict:
+    """List one page of accessible documents, newest first.
+
+    Pass the returned next_cursor as cursor for the following page; it is null
+    on the last page.
+    """
+    return service.list_page(identity("documents:read"), limit, cursor)
+
+
+@mcp.tool()
+def complete_document_titles(prefix: str, limit: int = 10) -> list[dict]:
+    """List the newest accessible documents whose title starts with prefix, to link or clone them."""
+    return service.complete_titles(identity("documents:read"), prefix, limit)
+
+
+@mcp.tool()
+def count_documents_by_facet(facet: str = "tag", mine: bool = False, limit: int = 50) -> list[dict]:
+    """Count public documents (or, with mine, all of yours) per tag or topic, most used first."""
+    return service.facet_counts(identity("documents:read"), facet, mine, limit)
+
+
 @mcp.tool()
 def edit_document(document_id: str, expected_revision: int, title: str | None = None,
                   content: str | None = None, summary: str | None = None,
@@ -69,6 +115,24 @@ def edit_document(document_id: str, expected_revision: int, title: str | None =
                           title, content, summary, tags, visibility)
 
 
+@mcp.tool()
+def list_document_revisions(document_id: str, limit: int = 20) -> list[dict]:
+    """List the newest revisions of an owned document with their save times."""
+    return service.revisions(identity("documents:read"), document_id, limit)
+
+
+@mcp.tool()
+def get_document_revision(document_id: str, revision: int) -> dict:
+    """Read the notebook of an owned document as it was at an earlier revision."""
+    return service.read_revision(identity("documents:read"), document_id, revision)
+
+
+@mcp.tool()
+def diff_document_revisions(document_id: str, from_revision: int, to_revision: int) -> dict:
+    """Compare two revisions of an owned document as cell operations and metadata."""
+    return service.diff(identity("documents:read"), document_id, from_revision, to_revision)
+
+
 @mcp.tool()
 def delete_document(document_id: str, expected_revision: int) -> dict:
     """Permanently delete an owned document at the expected revision."""
@@ -1,41 +1,54 @@
 """MongoDB operations exposed by MCP, isolated for validation and testing."""
 
 from datetime import datetime, timezone
-import re
 
 import nbformat
 from bson import ObjectId
 from pymongo import ReturnDocument
 from slugify import slugify
 
+from access import access_filter, owner_filter, user_key
+from blob_store import BlobStore, blob_digests
+from cell_store import (
+    CONTENT_FIELDS, discard_chunks, discard_notebooks, is_chunked, load_notebook, skeleton,
+    store_cells,
+)
+from facets import PUBLIC, counts, record_change
+from feed import discard as discard_feed, record as record_feed
+from pagination import find_page
+from render_jobs import enqueue_render
+from revisions import (
+    diff_revisions, discard_history, list_revisions, load_revision, record_document,
+    record_notebook,
+)
+from search import discard as discard_index, index_notebook, search
+from slugs import write_with_slug
+from summaries import summary_fields
+from titles import complete, title_fields
+
 
 VALID_VISIBILITIES = {"private", "public"}
+# Everything _metadata reads; the notebook body is fetched only when returned.
+METADATA_PROJECTION = {
+    field: 1 for field in ("title", "slug", "owner_id", "visibility", "tags", "summary",
+                           "first_image", "cell_count", "word_count", "code_languages",
+                           "created_at", "updated_at", "revision")
+}
+TITLE_PROJECTION = {"title": 1, "slug": 1}
 
 
 class KnowledgeService:
-    def __init__(self, database):
+    def __init__(self, database, render_queue=False, blobs=None):
         self.db = database
+        self.render_queue = render_queue
+        # Images the website moved to the blob store are returned inline.
+        self.blobs = blobs or BlobStore()
 
-    @staticmethod
-    def _owner_query(user_id: str):
-        values = [user_id]
-        if ObjectId.is_valid(user_id):
-            values.append(ObjectId(user_id))
-        return {"$in": values}
-
-    def _visible_query(self, user_id: str):
-        identities = self._owner_query(user_id)["$in"]
-        return {"$or": [
-            {"owner_id": {"$in": identities}},
-            {"visibility": "public"},
-            {"allowed_user_ids": {"$in": identities}},
-        ]}
-
-    def _owned_document(self, document_id: str, user_id: str):
+    def _owned_document(self, document_id: str, user_id: str, projection=None):
         if not ObjectId.is_valid(document_id):
             raise ValueError("Invalid document_id")
         document = self.db.notebooks.find_one(
-            {"_id": ObjectId(document_id), "owner_id": self._owner_query(user_id)}
+            {"_id": ObjectId(document_id), **owner_filter(user_id)}, projection
         )
         if not document:
             raise PermissionError("Document not found or not owned by this token's user")
@@ -51,6 +64,10 @@ class KnowledgeService:
             "visibility": document.get("visibility", "private"),
             "tags": document.get("tags", []),
             "summary": document.get("summary", ""),
+            "image_url": (document.get("first_image") or {}).get("url"),
+            "cell_count": document.get("cell_count"),
+            "word_count": document.get("word_count"),
+            "code_languages": document.get("code_languages", []),
             "created_at": document.get("created_at").isoformat() if document.get("created_at") else None,
             "updated_at": document.get("updated_at").isoformat() if document.get("updated_at") else None,
             "revision": document.get("revision", 1),
@@ -69,48 +86,113 @@ class KnowledgeService:
             cells=[nbformat.v4.new_markdown_cell(f"# {title}"),
                    nbformat.v4.new_markdown_cell(content)],
         )
-        base_slug = slugify(title)[:80] or "document"
-        slug = base_slug
-        suffix = 1
-        while self.db.notebooks.find_one({"slug": slug}, {"_id": 1}):
-            slug, suffix = f"{base_slug}-{suffix}", suffix + 1
-        owner_id = ObjectId(user_id) if ObjectId.is_valid(user_id) else user_id
         document = {
-            "notebook": notebook, "owner_id": owner_id, "title": title, "slug": slug,
-            "summary": summary[:2000], "tags": tags, "visibility": visibility,
+            "notebook": notebook, "owner_id": user_key(user_id), "title": title,
+            **title_fields(title), **summary_fields(notebook), "summary": summary[:2000],
+            "tags": tags, "visibility": visibility,
             "allowed_user_ids": [], "topic_ids": [], "created_at": now,
-            "updated_at": now, "revision": 1, "is_public": visibility == "public",
+            "updated_at": now, "revision": 1,
         }
-        result = self.db.notebooks.insert_one(document)
+
+        def insert(slug):
+            document["slug"] = slug
+            return self.db.notebooks.insert_one(document)
+
+        result = write_with_slug(self.db, slugify(title)[:80] or "document", insert)
         document["_id"] = result.inserted_id
+        record_notebook(self.db, document["_id"], 1, notebook)
+        index_notebook(self.db, document["_id"], 1, notebook, title, document["summary"], tags)
+        record_change(self.db, None, document)
+        record_feed(self.db, document, notebook)
         self._audit(user_id, "mcp.document.created", result.inserted_id)
+        self._queue_render(document)
         return self._metadata(document)
 
-    def read(self, user_id, document_id, include_content=True):
+    def read(self, user_id, document_id, include_content=True, known_revision=None,
+             cell_offset=0, cell_limit=None):
+        """Return a visible document.
+
+        When ``known_revision`` is still current only the metadata is returned,
+        marked ``not_modified``, and the notebook body is never loaded.  With
+        ``cell_limit`` only that many cells from ``cell_offset`` are returned;
+        ``cell_count`` always gives the total.
+        """
+        cell_offset = max(0, int(cell_offset))
+        cell_stop = None if cell_limit is None else cell_offset + max(0, int(cell_limit))
         if not ObjectId.is_valid(document_id):
             raise ValueError("Invalid document_id")
-        document = self.db.notebooks.find_one({
-            "$and": [{"_id": ObjectId(document_id)}, self._visible_query(user_id)]
-        })
+        load_content = include_content and known_revision is None
+        document = self.db.notebooks.find_one(
+            {"$and": [{"_id": ObjectId(document_id)}, access_filter(user_id)]},
+            None if load_content else METADATA_PROJECTION,
+        )
         if not document:
             raise PermissionError("Document not found or not accessible")
         result = self._metadata(document)
+        if known_revision is not None and int(known_revision) == result["revision"]:
+            result["not_modified"] = True
+            return result
         if include_content:
-            result["notebook"] = dict(document.get("notebook", {}))
+            if "notebook" not in document and not is_chunked(document):
+                document = self.db.notebooks.find_one(
+                    {"_id": document["_id"]}, CONTENT_FIELDS
+                ) or {"notebook": {}}
+            result["cell_count"] = len(
+                document["cell_chunks"] if is_chunked(document)
+                else document["notebook"].get("cells", [])
+            )
+            result["notebook"] = self.blobs.inline(
+                load_notebook(self.db, document, cell_offset, cell_stop) or {}
+            )
         return result
 
     def list(self, user_id, query="", limit=20):
+        """Return the newest visible documents.
+
+        With a ``query`` the best matches of the search index are returned
+        instead, ranked by relevance with their ``score``.
+        """
         limit = max(1, min(int(limit), 100))
-        filters = [self._visible_query(user_id)]
         if query.strip():
-            safe = re.escape(query.strip()[:200])
-            filters.append({"$or": [
-                {"title": {"$regex": safe, "$options": "i"}},
-                {"summary": {"$regex": safe, "$options": "i"}},
-                {"tags": query.strip().casefold()[:64]},
-            ]})
-        cursor = self.db.notebooks.find({"$and": filters}).sort("updated_at", -1).limit(limit)
-        return [self._metadata(item) for item in cursor]
+            return [
+                {**self._metadata(item), "score": round(rank, 4)}
+                for item, rank in search(self.db, user_id, query[:200], METADATA_PROJECTION, limit)
+            ]
+        return self.list_page(user_id, limit)["documents"]
+
+    def list_page(self, user_id, limit=20, cursor=None):
+        """Return one page of visible documents, newest first.
+
+        The result holds the ``documents`` and the ``next_cursor`` to pass back
+        for the following page, ``None`` on the last one.
+        """
+        documents, next_cursor = find_page(
+            self.db.notebooks, access_filter(user_id), METADATA_PROJECTION,
+            max(1, min(int(limit), 100)), cursor,
+        )
+        return {"documents": [self._metadata(item) for item in documents],
+                "next_cursor": next_cursor}
+
+    def complete_titles(self, user_id, prefix, limit=10):
+        """Return the newest visible documents whose title starts with ``prefix``."""
+        documents = complete(self.db, user_id, prefix[:200], TITLE_PROJECTION,
+                             max(1, min(int(limit), 50)))
+        return [{"id": str(item["_id"]), "title": item.get("title", ""),
+                 "slug": item.get("slug", "")} for item in documents]
+
+    def facet_counts(self, user_id, facet="tag", mine=False, limit=50):
+        """Count public documents, or all of the user's, per tag or topic."""
+        if facet not in ("tag", "topic"):
+            raise ValueError("facet must be tag or topic")
+        scope = user_key(user_id) if mine else PUBLIC
+        found = counts(self.db, facet, scope, max(1, min(int(limit), 200)))
+        names = {}
+        if facet == "topic":
+            names = {topic["_id"]: topic["name"] for topic in self.db.topics.find(
+                {"_id": {"$in": [value for value, _ in found]}}, {"name": 1}
+            )}
+        return [{"value": str(value), "name": names.get(value, str(value)), "count": count}
+                for value, count in found]
 
     def update(self, user_id, document_id, expected_revision, title=None, content=None,
                summary=None, tags=None, visibility=None):
@@ -121,6 +203,7 @@ class KnowledgeService:
             if not title or len(title) > 300:
                 raise ValueError("title must contain 1 to 300 characters")
             changes["title"] = title
+            changes.update(title_fields(title))
             changes["notebook.metadata.title"] = title
         if summary is not None:
             changes["summary"] = summary[:2000]
@@ -129,24 +212,78 @@ class KnowledgeService:
         if visibility is not None:
             if visibility not in VALID_VISIBILITIES:
                 raise ValueError("visibility must be private or public")
-            changes.update({"visibility": visibility, "is_public": visibility == "public"})
+            changes["visibility"] = visibility
         if content is not None:
-            notebook = nbformat.from_dict(current["notebook"])
+            notebook = nbformat.from_dict(load_notebook(self.db, current))
             if len(notebook.cells) < 2:
                 notebook.cells.append(nbformat.v4.new_markdown_cell(content))
             else:
                 notebook.cells[1].source = content
+            if "notebook.metadata.title" in changes:
+                notebook.metadata["title"] = changes.pop("notebook.metadata.title")
             changes["notebook"] = notebook
+            # The summary of MCP documents is given explicitly.
+            derived = summary_fields(notebook)
+            del derived["summary"]
+            changes.update(derived, blob_digests=blob_digests(notebook))
+        previous = current.get("cell_chunks", [])
+        chunks = previous
+        if is_chunked(current) and "notebook" in changes:
+            # Only the edited cell is stored again; the other chunks are reused.
+            notebook = changes.pop("notebook")
+            chunks = store_cells(self.db, current["_id"], notebook["cells"], previous)
+            changes.update({"notebook_skeleton": skeleton(notebook), "cell_chunks": chunks})
+        elif is_chunked(current) and "notebook.metadata.title" in changes:
+            changes["notebook_skeleton.metadata.title"] = changes.pop("notebook.metadata.title")
         updated = self.db.notebooks.find_one_and_update(
             {"_id": current["_id"], "revision": int(expected_revision)},
-            {"$set": changes, "$inc": {"revision": 1}},
+            # The editor's no-op detection must not match the old content.
+            {"$set": changes, "$inc": {"revision": 1}, "$unset": {"content_hash": ""}},
             return_document=ReturnDocument.AFTER,
         )
         if not updated:
+            discard_chunks(self.db, chunks, keep=previous)
             raise RuntimeError("Revision conflict; read the document and retry with its current revision")
+        discard_chunks(self.db, previous, keep=chunks)
+        record_document(self.db, updated)
+        record_change(self.db, current, updated)
+        record_feed(self.db, updated, updated.get("notebook"))
+        if changes.keys() & {"title", "summary", "tags", "notebook", "cell_chunks"}:
+            index_notebook(self.db, updated["_id"], updated["revision"],
+                           load_notebook(self.db, updated), updated.get("title", ""),
+                           updated.get("summary", ""), updated.get("tags", []))
         self._audit(user_id, "mcp.document.updated", current["_id"])
+        self._queue_render(updated)
         return self._metadata(updated)
 
+    def revisions(self, user_id, document_id, limit=20):
+        """List the newest recorded revisions of an owned document."""
+        current = self._owned_document(document_id, user_id, {"_id": 1})
+        return [
+            {**item, "created_at": item["created_at"].isoformat()}
+            for item in list_revisions(self.db, current["_id"], max(1, min(int(limit), 100)))
+        ]
+
+    def read_revision(self, user_id, document_id, revision):
+        """Return the notebook of an owned document as it was at ``revision``."""
+        current = self._owned_document(document_id, user_id, {"_id": 1})
+        notebook = load_revision(self.db, current["_id"], int(revision))
+        if notebook is None:
+            raise LookupError(f"Revision {revision} is not in the document history")
+        return {"id": document_id, "revision": int(revision),
+                "notebook": self.blobs.inline(notebook)}
+
+    def diff(self, user_id, document_id, from_revision, to_revision):
+        """Return the cell operations turning one revision into another."""
+        current = self._owned_document(document_id, user_id, {"_id": 1})
+        diff = diff_revisions(self.db, current["_id"], int(from_revision), int(to_revision))
+        if diff is None:
+            raise LookupError("Both revisions must be in the document history")
+        if diff["operations"] is None:
+            raise ValueError("Revisions without cell ids cannot be compared")
+        self.blobs.inline({"cells": [op["cell"] for op in diff["operations"] if "cell" in op]})
+        return {"id": document_id, **diff}
+
     def delete(self, user_id, document_id, expected_revision):
         current = self._owned_document(document_id, user_id)
         result = self.db.notebooks.delete_one(
@@ -154,6 +291,11 @@ class KnowledgeService:
         )
         if not result.deleted_count:
             raise RuntimeError("Revision conflict; deletion was not performed")
+        discard_notebooks(self.db, [current["_id"]])
+        discard_history(self.db, [current["_id"]])
+        discard_index(self.db, [current["_id"]])
+        record_change(self.db, current, None)
+        discard_feed(self.db, [current["_id"]])
         self._audit(user_id, "mcp.document.deleted", current["_id"])
         return {"deleted": True, "id": document_id}
 
@@ -163,6 +305,10 @@ class KnowledgeService:
             raise ValueError("tags must be a list containing at most 30 values")
         return list(dict.fromkeys(str(tag).strip().casefold()[:64] for tag in tags if str(tag).strip()))
 
+    def _queue_render(self, document):
+        if self.render_queue:
+            enqueue_render(self.db, document["_id"], document["revision"])
+
     def _audit(self, user_id, event_type, document_id):
         self.db.audit_events.insert_one({
             "occurred_at": datetime.now(timezone.utc), "event_type": event_type,
@@ -3,7 +3,7 @@ import { IDocumentManager } from '@jupyterlab/docmanager';
 import { INotebookTracker } from '@jupyterlab/notebook';
 
 type ParentCommand =
-  | { msgtype: 'create'; documentId: string; editorNonce: string }
+  | { msgtype: 'create'; documentId: string; editorNonce: string; draft?: boolean }
   | {
       msgtype: 'publish';
       documentId: string;
@@ -24,14 +24,50 @@ interface BridgeResponse {
   allowedUsers?: string[];
 }
 
+interface CellPayload {
+  id?: string;
+  [key: string]: unknown;
+}
+
 interface NotebookPayload {
-  cells: unknown[];
+  cells: CellPayload[];
   metadata: Record<string, unknown>;
   nbformat: number;
   nbformat_minor: number;
 }
 
+interface OpenedDocument {
+  revision: number;
+  cells: CellPayload[];
+  metadata: Record<string, unknown>;
+  visibility: 'public' | 'private';
+  allowedUsers: string[];
+}
+
+type CellOperation =
+  | { op: 'insert'; index: number; cell: CellPayload }
+  | { op: 'update'; cell: CellPayload }
+  | { op: 'delete'; id: string }
+  | { op: 'move'; id: string; index: number }
+  | { op: 'metadata'; metadata: Record<string, unknown> };
+
+class RequestError extends Error {
+  constructor(
+    message: string,
+    readonly status: number
+  ) {
+    super(message);
+  }
+}
+
 const SOURCE = 'reasonreport-parent';
+// State each document was opened in. Publishing sends the revision back so
+// that the server refuses to overwrite a revision published meanwhile from
+// elsewhere, and only the cells and metadata changed since then are uploaded.
+const openedDocuments = new Map<string, OpenedDocument>();
+// Ids reserved for drafts that are not stored yet; their first publish
+// creates the notebook under that id.
+const draftDocuments = new Set<string>();
 
 function parentOrigin(): string {
   if (!document.referrer) {
@@ -80,11 +116,58 @@ async function requestJSON(url: string, init: RequestInit = {}): Promise<any> {
   });
   const payload = await response.json().catch(() => ({}));
   if (!response.ok) {
-    throw new Error(payload.message || `ReasonReport request failed (${response.status})`);
+    throw new RequestError(
+      payload.message || `ReasonReport request failed (${response.status})`,
+      response.status
+    );
   }
   return payload;
 }
 
+/**
+ * Describe how to turn the opened cells into the current ones, or return null
+ * when cells lack the nbformat 4.5 ids the server matches them by.
+ */
+function cellOperations(before: CellPayload[], after: CellPayload[]): CellOperation[] | null {
+  if (![...before, ...after].every(cell => typeof cell.id === 'string')) {
+    return null;
+  }
+  const previous = new Map(before.map(cell => [cell.id as string, cell]));
+  const current = new Set(after.map(cell => cell.id as string));
+  const operations: CellOperation[] = [];
+  const order: string[] = [];
+  for (const cell of before) {
+    const id = cell.id as string;
+    if (current.has(id)) {
+      order.push(id);
+    } else {
+      operations.push({ op: 'delete', id });
+    }
+  }
+  after.forEach((cell, index) => {
+    const id = cell.id as string;
+    const opened = previous.get(id);
+    if (!opened) {
+      operations.push({ op: 'insert', index, cell });
+      order.splice(index, 0, id);
+      return;
+    }
+    if (order[index] !== id) {
+      operations.push({ op: 'move', id, index });
+      order.splice(order.indexOf(id), 1);
+      order.splice(index, 0, id);
+    }
+    if (JSON.stringify(opened) !== JSON.stringify(cell)) {
+      operations.push({ op: 'update', cell });
+    }
+  });
+  return operations;
+}
+
+function sameUsers(left: string[], right: string[]): boolean {
+  return left.length === right.length && left.every((user, index) => user === right[index]);
+}
+
 async function provisionPythonClient(
   documentManager: IDocumentManager,
   editorNonce: string
@@ -115,11 +198,29 @@ async function provisionPythonClient(
 
 async function openNotebook(
   documentId: string,
+  draft: boolean,
   documentManager: IDocumentManager
 ): Promise<void> {
-  const payload = await requestJSON(`/api/notebooks/query/${encodeURIComponent(documentId)}`);
+  if (draft) {
+    draftDocuments.add(documentId);
+  }
+  const queryId = draft ? '-1' : documentId;
+  const payload = await requestJSON(`/api/notebooks/query/${encodeURIComponent(queryId)}`);
   const notebook = payload.notebook as NotebookPayload;
-  const filename = `reasonreport-${documentId === '-1' ? 'new' : documentId}.ipynb`;
+  const visibility = payload.visibility === 'public' ? 'public' : 'private';
+  const allowedUsers: string[] = Array.isArray(payload.allowed_users) ? payload.allowed_users : [];
+  if (typeof payload.revision === 'number') {
+    openedDocuments.set(documentId, {
+      revision: payload.revision,
+      cells: notebook.cells,
+      metadata: notebook.metadata,
+      visibility,
+      allowedUsers
+    });
+  } else {
+    openedDocuments.delete(documentId);
+  }
+  const filename = `reasonreport-${queryId === '-1' ? 'new' : documentId}.ipynb`;
   const contents = documentManager.services.contents;
 
   await contents.save(filename, {
@@ -132,8 +233,8 @@ async function openNotebook(
     source: 'reasonreport-jupyterlite',
     msgtype: 'loaded',
     documentId,
-    visibility: payload.visibility === 'public' ? 'public' : 'private',
-    allowedUsers: Array.isArray(payload.allowed_users) ? payload.allowed_users : []
+    visibility,
+    allowedUsers
   });
 }
 
@@ -171,19 +272,57 @@ async function publishNotebook(
     throw new Error('The active notebook could not be serialized.');
   }
 
-  const isNew = documentId === '-1';
-  const url = isNew
-    ? '/api/notebooks/create'
-    : `/api/notebooks/save/${encodeURIComponent(documentId)}`;
-  const payload = await requestJSON(url, {
-    method: isNew ? 'POST' : 'PUT',
-    body: JSON.stringify({ notebook, visibility, allowed_users: allowedUsers })
-  });
+  const isNew = documentId === '-1' || draftDocuments.has(documentId);
+  const opened = isNew ? undefined : openedDocuments.get(documentId);
+  const operations =
+    opened &&
+    opened.visibility === visibility &&
+    sameUsers(opened.allowedUsers, allowedUsers)
+      ? cellOperations(opened.cells, notebook.cells as CellPayload[])
+      : null;
+  const metadata = notebook.metadata as Record<string, unknown>;
+  if (operations && JSON.stringify(opened?.metadata) !== JSON.stringify(metadata)) {
+    // Kernelspec, language_info, widget state and custom keys are kept by the
+    // server only when sent; it derives the title from the first cell.
+    operations.push({ op: 'metadata', metadata });
+  }
+  let payload: any = null;
+  if (opened && operations) {
+    try {
+      payload = await requestJSON(`/api/notebooks/${encodeURIComponent(documentId)}/cells`, {
+        method: 'PATCH',
+        body: JSON.stringify({ base_revision: opened.revision, operations })
+      });
+    } catch (error) {
+      // 422: the stored notebook predates cell ids or outgrows embedded storage,
+      // so it is published in full.
+      if (!(error instanceof RequestError && error.status === 422)) {
+        throw error;
+      }
+    }
+  }
+  if (!payload) {
+    const url = isNew
+      ? '/api/notebooks/create'
+      : `/api/notebooks/save/${encodeURIComponent(documentId)}`;
+    payload = await requestJSON(url, {
+      method: isNew ? 'POST' : 'PUT',
+      body: JSON.stringify({
+        notebook,
+        notebook_id: isNew && documentId !== '-1' ? documentId : undefined,
+        visibility,
+        allowed_users: allowedUsers,
+        expected_revision: opened?.revision
+      })
+    });
+  }
   if (typeof payload.slug !== 'string' || !payload.slug) {
     throw new Error(
       'The server did not return a valid page slug. Correct the page and publish again.'
     );
   }
+  openedDocuments.delete(documentId);
+  draftDocuments.delete(documentId);
   await clearEditorStorage(documentManager);
   sendToParent({
     source: 'reasonreport-jupyterlite',
@@ -218,7 +357,7 @@ const plugin: JupyterFrontEndPlugin<void> = {
         let operation: Promise<void>;
         if (command.msgtype === 'create') {
           operation = provisionPythonClient(documentManager, command.editorNonce).then(() =>
-            openNotebook(command.documentId, documentManager)
+            openNotebook(command.documentId, command.draft === true, documentManager)
           );
         } else if (command.msgtype === 'publish') {
           operation = publishNotebook(
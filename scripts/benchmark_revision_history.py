@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Compare revision history storage with full copies and time reconstruction.
+
+Simulates a notebook edited a few cells at a time and records every revision
+with :mod:`revisions`.  By default the history is kept in memory
+as BSON, so sizes are exact and reconstruction times include decoding but no
+network round trips; with ``--mongo-uri`` a scratch collection of a real
+server is used and dropped afterwards.
+"""
+
+import argparse
+import base64
+import copy
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import bson
+import nbformat
+from bson import ObjectId
+from pymongo import ASCENDING, MongoClient
+
+source_app = Path(__file__).resolve().parents[1] / "app" / "reasonreport"
+sys.path.insert(0, str(source_app if source_app.exists() else Path("/app/reasonreport")))
+import revisions  # noqa: E402
+
+
+class MemoryCollection:
+    """The part of a PyMongo collection used by the history, storing BSON.
+
+    Queries match the indexed fields, so only matching records are decoded.
+    """
+
+    def __init__(self):
+        self.documents = []
+
+    def _matches(self, keys, query):
+        for field, condition in query.items():
+            value = keys[field]
+            if isinstance(condition, dict):
+                if value < condition.get("$gte", value) or value > condition.get("$lte", value):
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    def find(self, query, projection=None):
+        return Cursor(bson.decode(raw) for keys, raw in self.documents
+                      if self._matches(keys, query))
+
+    def find_one(self, query, projection=None):
+        return next(iter(self.find(query)), None)
+
+    def insert_one(self, document):
+        keys = {field: document[field] for field in ("notebook_id", "revision")}
+        self.documents.append((keys, bson.encode(document)))
+
+    def size(self):
+        return sum(len(raw) for _, raw in self.documents)
+
+
+class Cursor(list):
+    def sort(self, field, direction):
+        return Cursor(sorted(self, key=lambda document: document[field] * direction))
+
+
+def plot_output(rng, size):
+    return nbformat.v4.new_output("display_data", data={
+        "image/png": base64.b64encode(rng.randbytes(size)).decode("ascii"),
+        "text/plain": "<Figure>",
+    })
+
+
+def simulate(args):
+    rng = random.Random(args.seed)
+    notebook = nbformat.v4.new_notebook(cells=[
+        nbformat.v4.new_code_cell(f"plot({index})", outputs=[plot_output(rng, args.output_bytes)])
+        if index % 3 == 0 else nbformat.v4.new_markdown_cell("Text " * 200)
+        for index in range(args.cells)
+    ])
+    versions = []
+    for _ in range(args.revisions):
+        notebook = copy.deepcopy(notebook)
+        for index in rng.sample(range(len(notebook.cells)), args.edits):
+            cell = notebook.cells[index]
+            cell.source += f"\n# edit {rng.random()}"
+            if cell.cell_type == "code":
+                cell.outputs = [plot_output(rng, args.output_bytes)]
+        versions.append(notebook)
+    return versions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cells", type=int, default=60)
+    parser.add_argument("--output-bytes", type=int, default=20000)
+    parser.add_argument("--revisions", type=int, default=100)
+    parser.add_argument("--edits", type=int, default=2, help="cells changed per revision")
+    parser.add_argument("--interval", type=int, default=revisions.SNAPSHOT_INTERVAL)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mongo-uri", help="use a scratch collection of this server")
+    args = parser.parse_args()
+    if args.mongo_uri:
+        db = MongoClient(args.mongo_uri).get_default_database("reasonreport_benchmark")
+        collection_name = f"notebook_revisions_benchmark_{ObjectId()}"
+        history = db[collection_name]
+        history.create_index([("notebook_id", ASCENDING), ("revision", ASCENDING)], unique=True)
+    else:
+        history = MemoryCollection()
+    database = SimpleNamespace(notebook_revisions=history)
+
+    notebook_id = ObjectId()
+    versions = simulate(args)
+    full_size = sum(len(bson.encode(notebook)) for notebook in versions)
+    try:
+        for revision, notebook in enumerate(versions, start=1):
+            revisions.record_revision(database, notebook_id, revision,
+                                      *revisions.split_notebook(notebook), interval=args.interval)
+        if args.mongo_uri:
+            stored_size = db.command("collStats", collection_name)["size"]
+        else:
+            stored_size = history.size()
+        timings = []
+        for revision, notebook in enumerate(versions, start=1):
+            started = time.perf_counter()
+            rebuilt = revisions.load_revision(database, notebook_id, revision)
+            timings.append((time.perf_counter() - started) * 1000)
+            assert rebuilt == notebook, f"revision {revision} was not rebuilt exactly"
+    finally:
+        if args.mongo_uri:
+            history.drop()
+
+    print(f"{args.revisions} revisions of {args.cells} cells, {args.edits} edited per revision, "
+          f"snapshot every {args.interval}")
+    print(f"full copies: {full_size / 1e6:.1f} MB")
+    print(f"history:     {stored_size / 1e6:.1f} MB ({stored_size / full_size:.1%})")
+    print(f"rebuild ms:  median {statistics.median(timings):.2f}, "
+          f"p95 {statistics.quantiles(timings, n=20)[-1]:.2f}, max {max(timings):.2f}")
+
+
+if __name__ == "__main__":
+    main()
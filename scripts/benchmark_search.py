@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Compare indexed search with the regular expression scan it replaces.
+
+Generates a synthetic corpus of notebooks whose words follow a Zipf
+distribution, indexes it with :mod:`search` and times queries of
+rare, common and several terms against the unanchored case-insensitive
+``$regex`` over titles and summaries that ``find_documents`` used to run.  By
+default the collections are kept in memory, so timings exclude network round
+trips and the regular expression scan is done in Python; with ``--mongo-uri``
+scratch collections of a real server are used and dropped afterwards.
+"""
+
+import argparse
+import itertools
+import random
+import re
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import nbformat
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, MongoClient
+from pymongo.errors import DuplicateKeyError
+
+source_app = Path(__file__).resolve().parents[1] / "app" / "reasonreport"
+sys.path.insert(0, str(source_app if source_app.exists() else Path("/app/reasonreport")))
+import search  # noqa: E402
+from access import access_filter  # noqa: E402
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "qui", "dor"]
+
+
+class Cursor(list):
+    def sort(self, field, direction):
+        return self
+
+    def limit(self, count):
+        return Cursor(self[:count])
+
+
+class MemoryPostings:
+    """The part of ``search_postings`` used by the index, as sorted tuples per term."""
+
+    def __init__(self):
+        self.terms = {}
+        self.size = 0
+
+    def insert_many(self, postings, ordered=True):
+        for posting in postings:
+            self.terms.setdefault(posting["term"], []).append(
+                (-posting["tf"], posting["notebook_id"], posting["length"])
+            )
+            self.size += 1
+
+    def build_index(self):
+        """Order every term's postings by decreasing frequency, like ix_search_postings_term_tf."""
+        for entries in self.terms.values():
+            entries.sort()
+
+    def delete_many(self, query):
+        pass  # the benchmark indexes every notebook once
+
+    def find(self, query, projection=None):
+        return Cursor({"notebook_id": notebook_id, "tf": -tf, "length": length}
+                      for tf, notebook_id, length in self.terms.get(query["term"], [])[:search.MAX_POSTINGS])
+
+    def count_documents(self, query):
+        return len(self.terms.get(query["term"], []))
+
+
+class MemoryDocuments:
+    """``search_documents`` and ``search_stats``: one document per key."""
+
+    def __init__(self):
+        self.documents = {}
+
+    def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        previous = self.documents.get(query["_id"])
+        if previous is not None and previous["revision"] >= query["revision"]["$lt"]:
+            raise DuplicateKeyError("_id")
+        self.documents[query["_id"]] = dict(update["$set"])
+        return previous
+
+    def update_one(self, query, update, upsert=False):
+        document = self.documents.setdefault(query["_id"], {})
+        for field, value in update["$inc"].items():
+            document[field] = document.get(field, 0) + value
+
+    def find_one(self, query):
+        return self.documents.get(query["_id"])
+
+
+class MemoryNotebooks:
+    """Notebook metadata and the subset of queries search and the scan send."""
+
+    def __init__(self, notebooks):
+        self.notebooks = {notebook["_id"]: notebook for notebook in notebooks}
+
+    @staticmethod
+    def _matches(document, query):
+        if "$and" in query:
+            return all(MemoryNotebooks._matches(document, part) for part in query["$and"])
+        if "$or" in query:
+            return any(MemoryNotebooks._matches(document, part) for part in query["$or"])
+        for field, condition in query.items():
+            value = document.get(field)
+            if isinstance(condition, dict) and "$in" in condition:
+                if value not in condition["$in"]:
+                    return False
+            elif isinstance(value, list):
+                if condition not in value:
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    def find(self, query, projection=None):
+        ids = query["$and"][0]["_id"]["$in"]
+        return [self.notebooks[notebook_id] for notebook_id in ids
+                if notebook_id in self.notebooks and self._matches(self.notebooks[notebook_id], query)]
+
+    def regex_scan(self, user_id, text, limit):
+        """Return the newest ``limit`` readable notebooks whose title or summary holds ``text``."""
+        pattern = re.compile(re.escape(text), re.IGNORECASE)
+        readable = access_filter(user_id)
+        found = [notebook for notebook in self.notebooks.values()
+                 if self._matches(notebook, readable)
+                 and (pattern.search(notebook["title"]) or pattern.search(notebook["summary"]))]
+        found.sort(key=lambda notebook: notebook["updated_at"], reverse=True)
+        return found[:limit]
+
+
+def vocabulary(size):
+    words = ("".join(parts) for length in (2, 3, 4) for parts in itertools.product(SYLLABLES, repeat=length))
+    return list(itertools.islice(words, size))
+
+
+def corpus(args):
+    rng = random.Random(args.seed)
+    words = vocabulary(args.vocabulary)
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    users = [ObjectId() for _ in range(args.users)]
+    now = datetime.now(timezone.utc)
+
+    def text(count):
+        return " ".join(rng.choices(words, cum_weights=weights, k=count))
+
+    for index in range(args.documents):
+        title = text(rng.randint(3, 8))
+        summary = text(30)
+        notebook = nbformat.v4.new_notebook(metadata={"title": title}, cells=[
+            nbformat.v4.new_markdown_cell(f"# {title}"),
+            *(nbformat.v4.new_markdown_cell(text(args.words)) for _ in range(2)),
+            nbformat.v4.new_code_cell(f"{text(3).replace(' ', '_')} = load('{text(1)}')"),
+        ])
+        owner = rng.choice(users)
+        yield notebook, {
+            "_id": ObjectId(), "title": title, "summary": summary, "slug": f"report-{index}",
+            "owner_id": owner, "visibility": rng.choice(["public", "public", "private"]),
+            "allowed_user_ids": rng.sample(users, 2), "revision": 1,
+            "updated_at": now - timedelta(minutes=index),
+        }
+
+
+def timed(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, timings
+
+
+def summary(timings):
+    return f"median {statistics.median(timings):8.2f} ms, max {max(timings):8.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--words", type=int, default=40, help="words per markdown cell")
+    parser.add_argument("--vocabulary", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mongo-uri", help="use scratch collections of this server")
+    args = parser.parse_args()
+
+    suffix = f"benchmark_{ObjectId()}"
+    if args.mongo_uri:
+        client = MongoClient(args.mongo_uri).get_default_database("reasonreport_benchmark")
+        collections = {name: client[f"{name}_{suffix}"]
+                       for name in ("notebooks", "search_documents", "search_postings", "search_stats")}
+        collections["search_postings"].create_index([("term", ASCENDING), ("tf", DESCENDING)])
+        collections["search_postings"].create_index([("notebook_id", ASCENDING), ("revision", ASCENDING)])
+        notebooks = []
+    else:
+        collections = {"search_documents": MemoryDocuments(), "search_stats": MemoryDocuments(),
+                       "search_postings": MemoryPostings()}
+        notebooks = []
+    database = SimpleNamespace(**collections)
+
+    try:
+        started = time.perf_counter()
+        for notebook, document in corpus(args):
+            search.index_notebook(database, document["_id"], 1, notebook,
+                                  document["title"], document["summary"])
+            notebooks.append(document)
+            if args.mongo_uri and len(notebooks) == 1000:
+                collections["notebooks"].insert_many(notebooks)
+                notebooks = []
+        if args.mongo_uri:
+            if notebooks:
+                collections["notebooks"].insert_many(notebooks)
+            collections["notebooks"].create_index([("updated_at", DESCENDING)])
+            collections["notebooks"].create_index([("owner_id", ASCENDING), ("updated_at", DESCENDING)])
+            collections["notebooks"].create_index([("visibility", ASCENDING), ("updated_at", DESCENDING)])
+            collections["notebooks"].create_index([("allowed_user_ids", ASCENDING)])
+            postings = collections["search_postings"].estimated_document_count()
+        else:
+            database.notebooks = MemoryNotebooks(notebooks)
+            collections["search_postings"].build_index()
+            postings = collections["search_postings"].size
+        indexing = time.perf_counter() - started
+        print(f"{args.documents} notebooks indexed in {indexing:.1f} s, {postings} postings")
+
+        user_id = str(ObjectId())
+        words = vocabulary(args.vocabulary)
+        queries = {
+            "common term": words[0],
+            "medium term": words[200],
+            "rare term": words[args.vocabulary - 1],
+            "three terms": " ".join(words[i] for i in (3, 150, 4000)),
+        }
+        for label, text in queries.items():
+            results, timings = timed(
+                lambda: search.search(database, user_id, text, {"title": 1}, args.limit), args.repeat
+            )
+            if args.mongo_uri:
+                pattern = re.escape(text)
+                query = {"$and": [access_filter(user_id), {"$or": [
+                    {"title": {"$regex": pattern, "$options": "i"}},
+                    {"summary": {"$regex": pattern, "$options": "i"}},
+                ]}]}
+                _, scan = timed(lambda: list(collections["notebooks"].find(query, {"title": 1})
+                                             .sort("updated_at", DESCENDING).limit(args.limit)),
+                                args.repeat)
+            else:
+                _, scan = timed(lambda: database.notebooks.regex_scan(user_id, text, args.limit),
+                                args.repeat)
+            print(f"{label:12} search {summary(timings)} ({len(results)} results) | "
+                  f"regex scan {summary(scan)}")
+    finally:
+        if args.mongo_uri:
+            for collection in collections.values():
+                collection.drop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Index the notebooks the search index does not hold at their current revision.
+
+Notebooks are indexed when they are saved, so this only has work to do after
+an upgrade or after notebooks were changed outside the application.  It is
+idempotent: a second run reads the revisions and writes nothing.  Entries of
+notebooks that no longer exist are removed.  Unpublished drafts are skipped.
+"""
+
+import os
+import re
+import sys
+from pathlib import Path
+
+from pymongo import MongoClient
+
+source_app = Path(__file__).resolve().parents[1] / "app" / "reasonreport"
+sys.path.insert(0, str(source_app if source_app.exists() else Path("/app/reasonreport")))
+from cell_store import CONTENT_FIELDS, load_notebook  # noqa: E402
+from search import discard, index_notebook  # noqa: E402
+
+DRAFT_SLUG = re.compile(r"^notebook-[0-9a-f]{24}$")
+
+
+def build(db):
+    """Index stale notebooks and return how many were indexed."""
+    indexed = {document["_id"]: document["revision"]
+               for document in db.search_documents.find({}, {"revision": 1})}
+    count = 0
+    metadata = {"title": 1, "slug": 1, "summary": 1, "tags": 1, "revision": 1}
+    for document in db.notebooks.find({}, metadata):
+        revision = indexed.pop(document["_id"], 0)
+        if revision >= document.get("revision", 1):
+            continue
+        if not document.get("title") and DRAFT_SLUG.match(document.get("slug", "")):
+            continue
+        content = db.notebooks.find_one({"_id": document["_id"]}, CONTENT_FIELDS)
+        if content is None:  # deleted meanwhile
+            continue
+        count += index_notebook(
+            db, document["_id"], document.get("revision", 1), load_notebook(db, content),
+            document.get("title", ""), document.get("summary", ""), document.get("tags", []),
+        )
+    # What is left was indexed for notebooks that no longer exist.
+    discard(db, list(indexed))
+    return count
+
+
+if __name__ == "__main__":
+    client = MongoClient(os.environ.get("MONGO_URI", "mongodb://mongo:27017/flaskdb"))
+    indexed = build(client.get_default_database())
+    print(f"Indexed {indexed} notebook(s) for search")
@@ -9,6 +9,14 @@ fi
 
 docker-compose exec mongo sh -c 'exec mongosh "$MONGO_DATABASE" --username "$MONGO_INITDB_ROOT_USERNAME" --password "$MONGO_INITDB_ROOT_PASSWORD" --authenticationDatabase admin --quiet --eval "$1"' sh '
   const notebooks = db.notebooks.deleteMany({});
+  db.notebook_cells.deleteMany({});
+  db.notebook_revisions.deleteMany({});
+  db.notebook_revision_cells.deleteMany({});
+  db.search_postings.deleteMany({});
+  db.search_documents.deleteMany({});
+  db.search_stats.deleteMany({});
+  db.facet_counts.deleteMany({});
+  db.public_feed.deleteMany({});
   const users = db.users.deleteMany({});
   print(`Deleted ${users.deletedCount} user(s) and ${notebooks.deletedCount} notebook(s)`);
 '
@@ -8,7 +8,23 @@ fi
 
 docker-compose exec -e DOCUMENT_ID="$1" mongo sh -c 'exec mongosh "$MONGO_DATABASE" --username "$MONGO_INITDB_ROOT_USERNAME" --password "$MONGO_INITDB_ROOT_PASSWORD" --authenticationDatabase admin --eval "$1"' sh '
   if (!ObjectId.isValid(process.env.DOCUMENT_ID)) { print("Invalid document ID"); quit(2); }
-  const result = db.notebooks.deleteOne({_id: ObjectId.createFromHexString(process.env.DOCUMENT_ID)});
-  if (!result.deletedCount) { print("Document not found"); quit(1); }
+  const notebook = db.notebooks.findOneAndDelete({_id: ObjectId.createFromHexString(process.env.DOCUMENT_ID)});
+  if (!notebook) { print("Document not found"); quit(1); }
+  const scopes = notebook.visibility === "public" ? [notebook.owner_id, "public"] : [notebook.owner_id];
+  for (const [facet, values] of [["tag", notebook.tags || []], ["topic", notebook.topic_ids || []]]) {
+    for (const value of values) {
+      for (const scope of scopes) {
+        db.facet_counts.updateOne({facet, value, scope}, {$inc: {count: -1}});
+      }
+    }
+  }
+  db.facet_counts.deleteMany({count: {$lte: 0}});
+  db.public_feed.deleteOne({_id: notebook._id});
+  db.notebook_cells.deleteMany({notebook_id: ObjectId.createFromHexString(process.env.DOCUMENT_ID)});
+  db.notebook_revisions.deleteMany({notebook_id: ObjectId.createFromHexString(process.env.DOCUMENT_ID)});
+  db.notebook_revision_cells.deleteMany({notebook_id: ObjectId.createFromHexString(process.env.DOCUMENT_ID)});
+  db.search_postings.deleteMany({notebook_id: ObjectId.createFromHexString(process.env.DOCUMENT_ID)});
+  const indexed = db.search_documents.findOneAndDelete({_id: ObjectId.createFromHexString(process.env.DOCUMENT_ID)});
+  if (indexed) db.search_stats.updateOne({_id: "corpus"}, {$inc: {documents: -1, length: -indexed.length}});
   print(`Deleted document ${process.env.DOCUMENT_ID}`);
 '
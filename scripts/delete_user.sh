@@ -9,7 +9,27 @@ fi
 docker-compose exec -e TARGET_USERNAME="$1" mongo sh -c 'exec mongosh "$MONGO_DATABASE" --username "$MONGO_INITDB_ROOT_USERNAME" --password "$MONGO_INITDB_ROOT_PASSWORD" --authenticationDatabase admin --eval "$1"' sh '
   const user = db.users.findOne({username: process.env.TARGET_USERNAME});
   if (!user) { print("User not found"); quit(1); }
-  const documents = db.notebooks.deleteMany({author: user._id.toString()});
+  const owned = {owner_id: user._id};
+  const notebooks = db.notebooks.find(owned, {_id: 1, visibility: 1, tags: 1, topic_ids: 1}).toArray();
+  const ids = notebooks.map(notebook => notebook._id);
+  const documents = db.notebooks.deleteMany({_id: {$in: ids}});
+  db.notebook_cells.deleteMany({notebook_id: {$in: ids}});
+  db.notebook_revisions.deleteMany({notebook_id: {$in: ids}});
+  db.notebook_revision_cells.deleteMany({notebook_id: {$in: ids}});
+  db.search_postings.deleteMany({notebook_id: {$in: ids}});
+  const indexed = db.search_documents.find({_id: {$in: ids}}).toArray();
+  db.search_documents.deleteMany({_id: {$in: ids}});
+  db.search_stats.updateOne({_id: "corpus"}, {$inc: {documents: -indexed.length, length: -indexed.reduce((total, item) => total + item.length, 0)}});
+  db.facet_counts.deleteMany({scope: user._id});
+  for (const notebook of notebooks.filter(item => item.visibility === "public")) {
+    for (const [facet, values] of [["tag", notebook.tags || []], ["topic", notebook.topic_ids || []]]) {
+      for (const value of values) {
+        db.facet_counts.updateOne({facet, value, scope: "public"}, {$inc: {count: -1}});
+      }
+    }
+  }
+  db.facet_counts.deleteMany({count: {$lte: 0}});
+  db.public_feed.deleteMany({_id: {$in: ids}});
   db.users.deleteOne({_id: user._id});
   print(`Deleted user ${user.username} and ${documents.deletedCount} document(s)`);
 '
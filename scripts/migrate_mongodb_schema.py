@@ -1,12 +1,25 @@
 #!/usr/bin/env python3
 """Idempotently migrate legacy ReasonReport MongoDB documents."""
 
+import hashlib
+import json
 import os
+import sys
 from datetime import datetime, timezone
+from pathlib import Path
 
 from bson import ObjectId
 from pymongo import MongoClient
 
+source_app = Path(__file__).resolve().parents[1] / "app" / "reasonreport"
+sys.path.insert(0, str(source_app if source_app.exists() else Path("/app/reasonreport")))
+from blob_store import blob_digests  # noqa: E402
+from cell_store import CONTENT_FIELDS, StaleChunks, load_notebook  # noqa: E402
+from facets import rebuild as rebuild_facets  # noqa: E402
+from feed import rebuild as rebuild_feed  # noqa: E402
+from summaries import summary_fields  # noqa: E402
+from titles import title_fields  # noqa: E402
+
 
 def _object_id(value):
     if isinstance(value, ObjectId):
@@ -27,7 +40,11 @@ def migrate(db):
             {"$set": {key: value for key, value in changes.items() if key not in user}},
         )
 
-    for notebook in db.notebooks.find({}):
+    # Owner and shared-with ids are canonically ObjectIds, which the access
+    # predicate in reasonreport/access.py relies on.
+    legacy_fields = {"author": "", "date": "", "is_public": ""}
+    bodies = {"notebook": 0, "notebook_skeleton": 0, "cell_chunks": 0}
+    for notebook in db.notebooks.find({}, bodies):
         created_at = notebook.get("created_at") or notebook.get("date") or now
         owner_id = _object_id(notebook.get("owner_id") or notebook.get("author"))
         visibility = notebook.get("visibility")
@@ -45,17 +62,122 @@ def migrate(db):
             "topic_ids": [],
             "revision": 1,
         }
-        if owner_id is not None:
-            defaults["owner_id"] = owner_id
-        db.notebooks.update_one(
-            {"_id": notebook["_id"]},
+        changes = {key: value for key, value in defaults.items() if key not in notebook}
+        if owner_id is not None and notebook.get("owner_id") != owner_id:
+            changes["owner_id"] = owner_id
+        allowed_user_ids = [
+            user_id for user_id in map(_object_id, notebook.get("allowed_user_ids", []))
+            if user_id is not None
+        ]
+        if allowed_user_ids != notebook.get("allowed_user_ids", allowed_user_ids):
+            changes["allowed_user_ids"] = allowed_user_ids
+        # Completion fields, also after a change of the normalization.
+        for field, value in title_fields(changes.get("title", notebook.get("title"))).items():
+            if notebook.get(field) != value:
+                changes[field] = value
+        update = {"$unset": legacy_fields} if not legacy_fields.keys().isdisjoint(notebook) else {}
+        if changes:
+            update["$set"] = changes
+        if update:
+            db.notebooks.update_one({"_id": notebook["_id"]}, update)
+
+
+def _cell_digest(cell):
+    # Same canonical form as cell_store.cell_digest, so later saves reuse chunks.
+    canonical = json.dumps(cell, sort_keys=True, separators=(",", ":"),
+                           ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def chunk_large_notebooks(db, threshold):
+    """Move the cells of embedded notebooks of ``threshold`` bytes or more to notebook_cells.
+
+    Each notebook is switched with one update guarded by its revision; a
+    notebook saved meanwhile keeps its new content and is retried next run.
+    """
+    if not threshold:
+        return
+    large = db.notebooks.find({
+        "notebook": {"$exists": True},
+        "$expr": {"$gte": [{"$bsonSize": "$notebook"}, threshold]},
+    })
+    for document in large:
+        notebook = document["notebook"]
+        chunks = [
+            {"_id": ObjectId(), "notebook_id": document["_id"],
+             "digest": _cell_digest(cell), "cell": cell}
+            for cell in notebook.get("cells", [])
+        ]
+        if chunks:
+            db.notebook_cells.insert_many(chunks, ordered=False)
+        result = db.notebooks.update_one(
+            {"_id": document["_id"], "revision": document.get("revision")},
             {
-                "$set": {key: value for key, value in defaults.items() if key not in notebook},
-                "$unset": {"author": "", "date": "", "is_public": ""},
+                "$set": {
+                    "notebook_skeleton": {k: v for k, v in notebook.items() if k != "cells"},
+                    "cell_chunks": [
+                        {"chunk_id": chunk["_id"], "cell_id": chunk["cell"].get("id"),
+                         "digest": chunk["digest"]}
+                        for chunk in chunks
+                    ],
+                },
+                "$unset": {"notebook": ""},
             },
         )
+        if not result.modified_count and chunks:
+            db.notebook_cells.delete_many({"_id": {"$in": [chunk["_id"] for chunk in chunks]}})
+
+
+
+def backfill_summary_fields(db):
+    """Derive the listing fields of notebooks saved before they were stored.
+
+    Each notebook is updated guarded by its revision; a notebook saved
+    meanwhile already has them.
+    """
+    projection = {**CONTENT_FIELDS, "revision": 1, "summary": 1}
+    for document in db.notebooks.find({"cell_count": {"$exists": False}}, projection):
+        if "notebook" not in document and "cell_chunks" not in document:
+            continue
+        try:
+            notebook = load_notebook(db, document)
+        except StaleChunks:  # saved meanwhile
+            continue
+        if notebook is None:
+            continue
+        db.notebooks.update_one(
+            {"_id": document["_id"], "revision": document.get("revision")},
+            {"$set": summary_fields(notebook, document)},
+        )
+
+
+def backfill_blob_digests(db):
+    """List the blobs of notebooks saved before ``blob_digests`` was stored.
+
+    ``/blobs/<digest>`` only serves blobs listed by a notebook the viewer can
+    read.  Updates are guarded by revision like :func:`backfill_summary_fields`.
+    """
+    projection = {**CONTENT_FIELDS, "revision": 1}
+    for document in db.notebooks.find({"blob_digests": {"$exists": False}}, projection):
+        try:
+            notebook = load_notebook(db, document)
+        except StaleChunks:  # saved meanwhile
+            continue
+        db.notebooks.update_one(
+            {"_id": document["_id"], "revision": document.get("revision")},
+            {"$set": {"blob_digests": blob_digests(notebook or {})}},
+        )
 
 
 if __name__ == "__main__":
     client = MongoClient(os.environ.get("MONGO_URI", "mongodb://mongo:27017/flaskdb"))
-    migrate(client.get_default_database())
+    database = client.get_default_database()
+    migrate(database)
+    chunk_large_notebooks(database, int(os.environ.get("CELL_CHUNK_THRESHOLD_BYTES", "1048576")))
+    backfill_summary_fields(database)
+    backfill_blob_digests(database)
+    # Saves keep the counts current once they exist; count older notebooks once.
+    if database.facet_counts.find_one() is None:
+        rebuild_facets(database)
+    if database.public_feed.find_one() is None:
+        rebuild_feed(database)
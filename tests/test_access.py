@@ -0,0 +1,36 @@
+import sys
+import unittest
+from pathlib import Path
+
+from bson import ObjectId
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import access  # noqa: E402
+import database_init  # noqa: E402
+
+
+class AccessFilterTest(unittest.TestCase):
+    def test_user_ids_are_stored_as_object_ids(self):
+        user_id = ObjectId()
+
+        self.assertEqual(access.user_key(str(user_id)), user_id)
+        self.assertIs(access.user_key(user_id), user_id)
+        self.assertEqual(access.owner_filter(str(user_id)), {'owner_id': user_id})
+
+    def test_every_branch_is_an_equality_on_the_first_key_of_an_index(self):
+        user_id = ObjectId()
+        leading_keys = {keys[0][0] for keys, _ in database_init.INDEXES['notebooks']}
+
+        branches = access.access_filter(str(user_id))['$or']
+
+        self.assertEqual(branches, [
+            {'owner_id': user_id}, {'visibility': 'public'}, {'allowed_user_ids': user_id},
+        ])
+        for branch in branches:
+            [(field, value)] = branch.items()
+            self.assertIn(field, leading_keys)
+            self.assertNotIsInstance(value, dict)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,8 @@ from unittest.mock import MagicMock, patch
 
 sys.path.insert(0, str(Path('app/reasonreport').resolve()))
 import app as reasonreport_app  # noqa: E402
+import config  # noqa: E402
+import models  # noqa: E402
 import resources  # noqa: E402
 import utils  # noqa: E402
 from utils import decode_token, generate_token  # noqa: E402
@@ -99,9 +101,10 @@ class AuthenticationCookieTest(unittest.TestCase):
         )
 
     def test_index_uses_configured_admin_and_page(self):
-        admin = {'_id': 'admin-id', 'username': 'site-owner', 'role': 'admin'}
+        admin_id = models.ObjectId()
+        admin = {'_id': admin_id, 'username': 'site-owner', 'role': 'admin'}
         notebooks = MagicMock()
-        notebooks.find_one.return_value = {'slug': 'front-page', 'owner_id': 'admin-id'}
+        notebooks.find_one.return_value = {'slug': 'front-page', 'owner_id': admin_id}
         with (
             patch.object(
                 reasonreport_app, 'get_user_by_username', return_value=admin
@@ -117,26 +120,54 @@ class AuthenticationCookieTest(unittest.TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.location, '/slug/front-page')
         get_admin.assert_called_once_with('site-owner')
-        notebooks.find_one.assert_called_once_with(
-            {
-                'slug': 'front-page',
-                '$or': [
-                    {'owner_id': 'admin-id'},
-                    {'author': 'admin-id'},
-                ],
-            }
-        )
+        notebooks.find_one.assert_called_once_with({'slug': 'front-page', 'owner_id': admin_id})
+
+    def test_index_without_a_main_page_lists_the_public_feed(self):
+        reasonreport_app.app.config['INDEX_PAGE_NAME'] = config.Config.INDEX_PAGE_NAME
+        database = MagicMock()
+        database.public_feed.find.return_value.sort.return_value.limit.return_value = [{
+            '_id': models.ObjectId(), 'title': 'Gradients', 'slug': 'gradients',
+            'author': 'alice', 'summary': 'Descent methods',
+            'updated_at': models.datetime(2024, 5, 1, tzinfo=models.timezone.utc),
+        }]
+        with (
+            patch.object(reasonreport_app, 'get_user_by_username') as get_admin,
+            patch.object(reasonreport_app, 'mongo', SimpleNamespace(db=database)),
+        ):
+            response = self.client.get('/')
+
+        self.assertEqual(response.status_code, 200)
+        get_admin.assert_not_called()
+        self.assertIn(b'/slug/gradients', response.data)
+        self.assertIn(b'Descent methods', response.data)
+        database.notebooks.find_one.assert_not_called()
+        database.notebooks.find.assert_not_called()
 
     def test_editor_redirects_anonymous_user_to_login(self):
         response = self.client.get('/edit/notebook-id')
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.location, '/login?next=/edit/notebook-id')
 
+    def test_create_reserves_a_draft_id_without_storing_a_notebook(self):
+        user = {'_id': 'user-id', 'username': 'alice'}
+        database = MagicMock()
+        self.client.set_cookie('jwt_token1', generate_token('user-id'))
+        with (
+            patch.object(utils, 'get_user_by_id', return_value=user),
+            patch.object(reasonreport_app, 'create_editor_launch', return_value='nonce'),
+            patch.object(reasonreport_app, 'mongo', SimpleNamespace(db=database)),
+        ):
+            response = self.client.get('/create')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'data-draft="true"', response.data)
+        self.assertRegex(response.get_data(as_text=True), r'data-document-id="[0-9a-f]{24}"')
+        database.notebooks.insert_one.assert_not_called()
+
     def test_registration_logs_user_in_and_returns_to_previous_page(self):
         with (
             patch.object(reasonreport_app, 'get_user_by_username', return_value=None),
             patch.object(reasonreport_app, 'create_user', return_value='user-id'),
-            patch.object(reasonreport_app, 'create_notebook', return_value='notebook-id'),
             patch.object(reasonreport_app, 'generate_token', return_value='register-token'),
         ):
             response = self.client.post('/register', data={
@@ -203,6 +234,57 @@ class AuthenticationCookieTest(unittest.TestCase):
         self.assertEqual(response.json['user']['username'], 'alice')
         self.assertNotIn('password', response.json['user'])
 
+    def test_user_records_are_cached_until_the_user_changes(self):
+        user_id = '507f1f77bcf86cd799439011'
+        users = MagicMock()
+        users.find_one.return_value = {'_id': user_id, 'username': 'alice'}
+        users.update_one.return_value.matched_count = 1
+        models.user_cache.clear()
+        self.addCleanup(models.user_cache.clear)
+        public_feed = MagicMock()
+        database = SimpleNamespace(users=users, public_feed=public_feed)
+        with patch.object(models, 'mongo', SimpleNamespace(db=database)):
+            models.get_user_by_id(user_id)['username'] = 'changed by caller'
+            self.assertEqual(models.get_user_by_id(user_id)['username'], 'alice')
+            users.find_one.assert_called_once()
+
+            models.update_user(user_id, {'username': 'alicia'})
+            models.get_user_by_id(user_id)
+
+        self.assertEqual(users.find_one.call_count, 2)
+        public_feed.update_many.assert_called_once_with(
+            {'owner_id': models.ObjectId(user_id)}, {'$set': {'author': 'alicia'}}
+        )
+
+    def test_usernames_are_cached_until_the_user_changes(self):
+        user_id = '507f1f77bcf86cd799439011'
+        users = MagicMock()
+        users.find.return_value = [{'_id': models.ObjectId(user_id), 'username': 'alice'}]
+        models.username_cache.clear()
+        self.addCleanup(models.username_cache.clear)
+        with patch.object(models, 'mongo', SimpleNamespace(db=SimpleNamespace(users=users))):
+            self.assertEqual(models.resolve_usernames([user_id]), {user_id: 'alice'})
+            self.assertEqual(models.resolve_usernames([user_id]), {user_id: 'alice'})
+            users.find.assert_called_once()
+
+            models.invalidate_user(user_id)
+            models.resolve_usernames([user_id])
+
+        self.assertEqual(users.find.call_count, 2)
+
+    def test_identity_is_resolved_once_per_request(self):
+        user = {'_id': 'user-id', 'username': 'alice'}
+        token = generate_token('user-id')
+        with (
+            patch.object(utils, 'get_user_by_id', return_value=user) as lookup,
+            reasonreport_app.app.test_request_context(headers={'Cookie': f'jwt_token1={token}'}),
+        ):
+            first = reasonreport_app.get_user_info_from_token()
+            second = reasonreport_app.get_user_info_from_token()
+
+        self.assertEqual(first['username'], second['username'])
+        lookup.assert_called_once_with('user-id')
+
 
 if __name__ == '__main__':
     unittest.main()
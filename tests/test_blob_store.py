@@ -0,0 +1,128 @@
+import base64
+import copy
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import nbformat
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import app as reasonreport_app  # noqa: E402
+import blob_store  # noqa: E402
+import rendering  # noqa: E402
+
+PNG = base64.b64encode(b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 8).decode('ascii')
+
+
+def plot_notebook(png=PNG):
+    markdown = nbformat.v4.new_markdown_cell('![Diagram](attachment:diagram.png)')
+    markdown.attachments = {'diagram.png': {'image/png': png}}
+    code = nbformat.v4.new_code_cell('plot()', outputs=[nbformat.v4.new_output(
+        'display_data', data={'image/png': png, 'text/plain': '<Figure>'}
+    )])
+    small = nbformat.v4.new_code_cell('icon()', outputs=[nbformat.v4.new_output(
+        'display_data', data={'image/png': base64.b64encode(b'tiny').decode('ascii')}
+    )])
+    return nbformat.v4.new_notebook(cells=[markdown, code, small])
+
+
+class BlobStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = blob_store.DiskBlobStore(directory.name)
+        self.blobs = blob_store.BlobStore(self.store, threshold=1024)
+
+    def test_large_images_are_stored_once_and_restored_for_editing(self):
+        notebook = plot_notebook()
+        original = copy.deepcopy(notebook)
+
+        self.blobs.externalize(notebook)
+
+        reference = notebook.cells[1].outputs[0].data['image/png']
+        digest = blob_store.blob_reference(reference)
+        self.assertIsNotNone(digest)
+        self.assertEqual(notebook.cells[0].attachments['diagram.png']['image/png'], reference)
+        self.assertNotIn(blob_store.BLOB_PREFIX, notebook.cells[2].outputs[0].data['image/png'])
+        self.assertEqual(self.blobs.get(digest), ('image/png', base64.b64decode(PNG)))
+        nbformat.validate(notebook)
+
+        self.blobs.inline(notebook)
+
+        self.assertEqual(notebook, original)
+
+    def test_stored_blobs_are_not_written_again(self):
+        self.blobs.externalize(plot_notebook())
+
+        with patch.object(self.store, 'put') as put:
+            self.blobs.externalize(plot_notebook())
+
+        put.assert_not_called()
+
+    def test_rendered_pages_lazy_load_blob_urls(self):
+        notebook = self.blobs.externalize(plot_notebook())
+        digest = blob_store.blob_reference(notebook.cells[1].outputs[0].data['image/png'])
+
+        html = rendering.notebook_html(notebook, body_only=True)
+
+        url = blob_store.BLOB_URL.format(digest=digest)
+        self.assertEqual(html.count(f'src="{url}"'), 2)
+        self.assertEqual(html.count('loading="lazy"'), 2)
+        self.assertIn('alt="Diagram"', html)
+        self.assertNotIn(PNG[:64], html)
+        self.assertIn(blob_store.BLOB_PREFIX, notebook.cells[1].outputs[0].data['image/png'])
+
+    def get_blob(self, digest, notebooks, user_id=None):
+        user_info = {'user_id': user_id, 'username': None, 'user': None,
+                     'is_authenticated': bool(user_id)}
+        with (
+            patch.object(reasonreport_app, 'notebook_blobs', self.blobs),
+            patch.object(reasonreport_app, 'mongo', SimpleNamespace(
+                db=SimpleNamespace(notebooks=notebooks)
+            )),
+            patch.object(reasonreport_app, 'get_user_info_from_token', return_value=user_info),
+        ):
+            return reasonreport_app.app.test_client().get(f'/blobs/{digest}')
+
+    def test_blob_route_serves_immutable_sandboxed_content(self):
+        notebook = self.blobs.externalize(plot_notebook())
+        digest = blob_store.blob_reference(notebook.cells[1].outputs[0].data['image/png'])
+        self.assertEqual(blob_store.blob_digests(notebook), [digest])
+        notebooks = MagicMock()
+        notebooks.find_one.return_value = {'_id': 'notebook-id'}
+
+        response = self.get_blob(digest, notebooks)
+        missing = self.get_blob('0' * 64, MagicMock(**{'find_one.return_value': None}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertEqual(response.data, base64.b64decode(PNG))
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn('sandbox', response.headers['Content-Security-Policy'])
+        self.assertEqual(notebooks.find_one.call_args.args[0],
+                         {'blob_digests': digest, 'visibility': 'public'})
+        self.assertEqual(missing.status_code, 404)
+
+    def test_blobs_of_private_notebooks_are_served_to_their_readers_only(self):
+        notebook = self.blobs.externalize(plot_notebook())
+        [digest] = blob_store.blob_digests(notebook)
+        notebooks = MagicMock()
+        notebooks.find_one.side_effect = lambda query, projection: (
+            {'_id': 'notebook-id'} if '$and' in query else None
+        )
+
+        anonymous = self.get_blob(digest, notebooks)
+        reader = self.get_blob(digest, notebooks, user_id='507f1f77bcf86cd799439011')
+
+        self.assertEqual(anonymous.status_code, 404)
+        self.assertEqual(reader.status_code, 200)
+        self.assertEqual(reader.headers['Cache-Control'], 'private, max-age=31536000, immutable')
+        query = notebooks.find_one.call_args.args[0]
+        self.assertEqual(query['$and'][0], {'blob_digests': digest})
+
+
+if __name__ == '__main__':
+    unittest.main()
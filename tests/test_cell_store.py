@@ -0,0 +1,170 @@
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from bson import ObjectId
+
+try:
+    import mongomock
+except ImportError:  # optional, for tests that run queries
+    mongomock = None
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import cell_store  # noqa: E402
+
+
+def cell(cell_id, source):
+    return {'id': cell_id, 'cell_type': 'markdown', 'metadata': {}, 'source': source}
+
+
+class CellStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.db = MagicMock()
+        self.chunks = {}
+        self.db.notebook_cells.insert_many.side_effect = lambda documents, ordered: \
+            self.chunks.update((document['_id'], document) for document in documents)
+        self.db.notebook_cells.find.side_effect = lambda query, projection=None: [
+            self.chunks[chunk_id] for chunk_id in query['_id']['$in'] if chunk_id in self.chunks
+        ]
+
+    def test_unchanged_cells_reuse_their_chunks(self):
+        notebook_id = ObjectId()
+        first = cell_store.store_cells(self.db, notebook_id, [cell('a', 'A'), cell('b', 'B')])
+
+        second = cell_store.store_cells(
+            self.db, notebook_id, [cell('b', 'B'), cell('a', 'edited')], previous=first
+        )
+
+        self.assertEqual(second[0], first[1])
+        self.assertNotIn(second[1]['chunk_id'], {ref['chunk_id'] for ref in first})
+        self.assertEqual(len(self.chunks), 3)
+        self.assertEqual(self.db.notebook_cells.insert_many.call_count, 2)
+
+    def test_chunked_notebook_loads_in_order_and_by_range(self):
+        cells = [cell(str(index), f'Cell {index}') for index in range(40)]
+        document = {
+            '_id': ObjectId(),
+            'notebook_skeleton': {'metadata': {'title': 'Large'}, 'nbformat': 4},
+            'cell_chunks': cell_store.store_cells(self.db, ObjectId(), cells),
+        }
+
+        self.assertEqual(cell_store.load_notebook(self.db, document)['cells'], cells)
+        page = cell_store.load_notebook(self.db, document, 10, 12)
+        self.assertEqual(page, {'metadata': {'title': 'Large'}, 'nbformat': 4,
+                                'cells': cells[10:12]})
+        self.assertEqual(self.db.notebook_cells.find.call_count, 4)
+
+    def test_embedded_notebooks_are_read_unchanged(self):
+        document = {'notebook': {'metadata': {}, 'cells': [cell('a', 'A'), cell('b', 'B')]}}
+
+        self.assertEqual(cell_store.load_notebook(self.db, document), document['notebook'])
+        self.assertEqual(cell_store.load_notebook(self.db, document, 1)['cells'], [cell('b', 'B')])
+        self.db.notebook_cells.find.assert_not_called()
+
+    def test_reader_retries_after_a_newer_save_discarded_chunks(self):
+        notebook_id = ObjectId()
+        old = cell_store.store_cells(self.db, notebook_id, [cell('a', 'old')])
+        new = cell_store.store_cells(self.db, notebook_id, [cell('a', 'new')])
+        del self.chunks[old[0]['chunk_id']]
+        self.db.notebooks.find_one.return_value = {
+            '_id': notebook_id, 'notebook_skeleton': {}, 'cell_chunks': new,
+        }
+
+        notebook = cell_store.load_notebook(
+            self.db, {'_id': notebook_id, 'notebook_skeleton': {}, 'cell_chunks': old}
+        )
+
+        self.assertEqual(notebook['cells'], [cell('a', 'new')])
+
+    def test_discard_keeps_shared_chunks(self):
+        first = cell_store.store_cells(self.db, ObjectId(), [cell('a', 'A'), cell('b', 'B')])
+        second = [first[0]]
+
+        cell_store.discard_chunks(self.db, first, keep=second)
+
+        self.db.notebook_cells.delete_many.assert_called_once_with(
+            {'_id': {'$in': [first[1]['chunk_id']]}}
+        )
+
+    def test_only_large_notebooks_are_chunked(self):
+        notebook = {'metadata': {}, 'cells': [cell('a', 'x' * 2000)]}
+
+        self.assertTrue(cell_store.should_chunk(notebook, 1024))
+        self.assertFalse(cell_store.should_chunk(notebook, 1 << 20))
+        self.assertFalse(cell_store.should_chunk(notebook, 0))
+
+
+
+@unittest.skipIf(mongomock is None, 'mongomock is not installed')
+class CopyNotebookTest(unittest.TestCase):
+    def setUp(self):
+        self.db = mongomock.MongoClient().reasonreport
+        self.source_id, self.copy_id = ObjectId(), ObjectId()
+
+    def test_copy_duplicates_chunks_for_the_new_notebook(self):
+        cells = [cell(str(index), f'Cell {index}')
+                 for index in range(cell_store.FETCH_BATCH_SIZE + 3)]
+        refs = cell_store.store_cells(self.db, self.source_id, cells)
+        self.db.notebooks.insert_one({
+            '_id': self.source_id, 'revision': 4, 'title': 'Template',
+            'notebook_skeleton': {'metadata': {'title': 'Template'}}, 'cell_chunks': refs,
+        })
+
+        copied = cell_store.copy_notebook(
+            self.db, {'_id': self.source_id, 'revision': 4, 'cell_chunks': refs},
+            {'_id': self.copy_id, 'title': ''},
+        )
+
+        self.assertTrue(copied)
+        document = self.db.notebooks.find_one({'_id': self.copy_id})
+        self.assertEqual(document['title'], '')
+        self.assertEqual(cell_store.load_notebook(self.db, document),
+                         {'metadata': {'title': 'Template'}, 'cells': cells})
+        chunk_ids = {ref['chunk_id'] for ref in document['cell_chunks']}
+        self.assertFalse(chunk_ids & {ref['chunk_id'] for ref in refs})
+        self.assertEqual(self.db.notebook_cells.count_documents({'notebook_id': self.copy_id}),
+                         len(cells))
+
+        cell_store.discard_notebooks(self.db, [self.source_id])
+        self.assertEqual(cell_store.load_notebook(self.db, document)['cells'], cells)
+
+    def test_copy_of_an_embedded_notebook(self):
+        notebook = {'metadata': {}, 'cells': [cell('a', 'A')]}
+        self.db.notebooks.insert_one({'_id': self.source_id, 'revision': 1, 'notebook': notebook})
+
+        self.assertTrue(cell_store.copy_notebook(
+            self.db, {'_id': self.source_id, 'revision': 1}, {'_id': self.copy_id, 'revision': 1},
+        ))
+
+        self.assertEqual(self.db.notebooks.find_one({'_id': self.copy_id}),
+                         {'_id': self.copy_id, 'revision': 1, 'notebook': notebook})
+
+    def test_copy_of_a_notebook_saved_meanwhile_is_discarded(self):
+        refs = cell_store.store_cells(self.db, self.source_id, [cell('a', 'A')])
+        self.db.notebooks.insert_one({'_id': self.source_id, 'revision': 3, 'cell_chunks': refs})
+
+        copied = cell_store.copy_notebook(
+            self.db, {'_id': self.source_id, 'revision': 2, 'cell_chunks': refs},
+            {'_id': self.copy_id},
+        )
+
+        self.assertFalse(copied)
+        self.assertIsNone(self.db.notebooks.find_one({'_id': self.copy_id}))
+        self.assertEqual(self.db.notebook_cells.count_documents({'notebook_id': self.copy_id}), 0)
+
+    def test_copy_of_chunks_deleted_meanwhile_is_discarded(self):
+        refs = cell_store.store_cells(self.db, self.source_id, [cell('a', 'A'), cell('b', 'B')])
+        self.db.notebook_cells.delete_one({'_id': refs[1]['chunk_id']})
+
+        copied = cell_store.copy_notebook(
+            self.db, {'_id': self.source_id, 'revision': 2, 'cell_chunks': refs},
+            {'_id': self.copy_id},
+        )
+
+        self.assertFalse(copied)
+        self.assertEqual(self.db.notebook_cells.count_documents({'notebook_id': self.copy_id}), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,11 +14,12 @@ class JupyterLiteCspBuildTest(unittest.TestCase):
         self.assertRegex(compose, r'(?m)^  mcp:\s*$')
         self.assertIn('command: python -m reasonreport_mcp.server', compose)
         self.assertIn('MCP_PUBLIC_URL:', compose)
+        self.assertRegex(compose, r'(?m)^  render-worker:\s*$')
         self.assertEqual(
             compose.count(
                 'MONGO_URI: mongodb://${MONGO_ROOT_USERNAME:?set MONGO_ROOT_USERNAME in .env}:'
             ),
-            2,
+            3,
         )
         self.assertIn('MONGO_INITDB_ROOT_USERNAME:', compose)
         self.assertIn('?authSource=admin', compose)
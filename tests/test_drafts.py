@@ -0,0 +1,78 @@
+import sys
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from bson import ObjectId
+
+try:
+    import mongomock
+except ImportError:  # optional, for tests that run queries
+    mongomock = None
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import drafts  # noqa: E402
+
+
+class DraftSweepTest(unittest.TestCase):
+    def test_placeholders_are_deleted_in_batches_with_the_filter_reapplied(self):
+        batches = [[{'_id': ObjectId()} for _ in range(2)], [{'_id': ObjectId()}]]
+        db = MagicMock()
+        db.notebooks.find.return_value.limit.side_effect = batches
+        db.notebooks.delete_many.side_effect = [
+            MagicMock(deleted_count=2), MagicMock(deleted_count=0),
+        ]
+
+        deleted = drafts.sweep_placeholders(db, 3600, batch_size=2)
+
+        self.assertEqual(deleted, 2)
+        self.assertEqual(db.notebooks.delete_many.call_count, 2)
+        query = db.notebooks.find.call_args_list[0].args[0]
+        self.assertEqual(query['slug'], {'$regex': '^notebook-[0-9a-f]{24}$'})
+        self.assertEqual((query['title'], query['revision']), ('', 1))
+        last = db.notebooks.delete_many.call_args.args[0]
+        self.assertEqual(last['_id'], {'$in': [document['_id'] for document in batches[1]]})
+        self.assertEqual(last['$or'], query['$or'])
+        db.notebook_cells.delete_many.assert_called_with(
+            {'notebook_id': {'$in': [document['_id'] for document in batches[1]]}}
+        )
+
+    def test_sweep_stops_when_nothing_is_left(self):
+        db = MagicMock()
+        db.notebooks.find.return_value.limit.return_value = []
+
+        self.assertEqual(drafts.sweep_placeholders(db, 3600), 0)
+        db.notebooks.delete_many.assert_not_called()
+
+    @unittest.skipIf(mongomock is None, 'mongomock is not installed')
+    def test_copies_are_swept_only_when_never_saved_and_old(self):
+        db = mongomock.MongoClient().db
+        now = datetime.now(timezone.utc)
+
+        def draft(age, **fields):
+            notebook_id = ObjectId()
+            db.notebooks.insert_one({
+                '_id': notebook_id, 'slug': f'notebook-{notebook_id}', 'title': '',
+                'revision': 1, 'created_at': now - timedelta(days=age), **fields,
+            })
+            db.notebook_cells.insert_one({'notebook_id': notebook_id, 'cells': []})
+            return notebook_id
+
+        template = ObjectId()
+        draft(2)  # a placeholder
+        fresh_copy = draft(2, cloned_from=template)
+        draft(40, cloned_from=template)
+        saved_copy = draft(40, cloned_from=template, revision=2)
+
+        deleted = drafts.sweep_placeholders(db, 86400, clone_max_age=30 * 86400)
+
+        self.assertEqual(deleted, 2)
+        self.assertEqual({document['_id'] for document in db.notebooks.find()},
+                         {fresh_copy, saved_copy})
+        self.assertEqual({chunk['notebook_id'] for chunk in db.notebook_cells.find()},
+                         {fresh_copy, saved_copy})
+
+
+if __name__ == '__main__':
+    unittest.main()
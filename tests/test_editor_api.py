@@ -10,6 +10,7 @@ from bson import ObjectId
 sys.path.insert(0, str(Path('app/reasonreport').resolve()))
 import app as reasonreport_app  # noqa: E402
 import editor_api  # noqa: E402
+import models  # noqa: E402
 import utils  # noqa: E402
 from utils import generate_token  # noqa: E402
 
@@ -33,10 +34,13 @@ class EditorApiSecurityTest(unittest.TestCase):
             users=self.users,
         )
         self.mongo_patch = patch.object(editor_api, 'mongo', SimpleNamespace(db=self.database))
+        self.models_mongo_patch = patch.object(models, 'mongo', SimpleNamespace(db=self.database))
         self.user_patch = patch.object(utils, 'get_user_by_id', return_value=self.user)
         self.mongo_patch.start()
+        self.models_mongo_patch.start()
         self.user_patch.start()
         self.addCleanup(self.mongo_patch.stop)
+        self.addCleanup(self.models_mongo_patch.stop)
         self.addCleanup(self.user_patch.stop)
 
     def headers(self, editor_token='editor-token'):
@@ -135,6 +139,119 @@ class EditorApiSecurityTest(unittest.TestCase):
             'author': 'Alice',
         }])
 
+    def test_listing_projects_out_notebook_bodies(self):
+        self.sessions.find_one.return_value = {'user_id': '507f1f77bcf86cd799439011'}
+        self.notebooks.find.return_value.sort.return_value.limit.return_value = []
+        response = self.client.post(
+            '/api/editor/notebooks/query', headers=self.headers(), json={'filters': {'slug': 'x'}},
+        )
+        self.client.get('/api/editor/notebooks', headers=self.headers())
+
+        self.assertEqual(response.status_code, 200)
+        for call in self.notebooks.find.call_args_list:
+            projection = call.args[1]
+            self.assertNotIn('notebook', projection)
+            self.assertTrue(all(projection.values()))
+
+    def test_listing_pages_follow_the_returned_cursor(self):
+        self.sessions.find_one.return_value = {'user_id': '507f1f77bcf86cd799439011'}
+        updated_at = datetime(2026, 1, 2, tzinfo=timezone.utc)
+        documents = [{'_id': ObjectId(), 'updated_at': updated_at} for _ in range(3)]
+        self.notebooks.find.return_value.sort.return_value.limit.return_value = documents
+
+        first = self.client.get('/api/editor/notebooks?limit=2', headers=self.headers())
+        cursor = first.get_json()['next_cursor']
+        self.client.post('/api/editor/notebooks/query', headers=self.headers(),
+                         json={'filters': {}, 'limit': 2, 'cursor': cursor})
+        invalid = self.client.get('/api/editor/notebooks?cursor=bogus', headers=self.headers())
+
+        self.assertEqual(len(first.get_json()['documents']), 2)
+        self.notebooks.find.return_value.sort.return_value.limit.assert_called_with(3)
+        query = self.notebooks.find.call_args.args[0]
+        self.assertEqual(query['$and'][1]['$or'][1],
+                         {'updated_at': updated_at, '_id': {'$lt': documents[1]['_id']}})
+        self.assertEqual(invalid.status_code, 400)
+
+    def test_listing_resolves_authors_in_one_query(self):
+        self.sessions.find_one.return_value = {'user_id': '507f1f77bcf86cd799439011'}
+        owners = [ObjectId(), ObjectId()]
+        self.notebooks.find.return_value.sort.return_value.limit.return_value = [
+            {'_id': ObjectId(), 'owner_id': str(owner)} for owner in owners + owners
+        ]
+        self.users.find.return_value = [
+            {'_id': owners[0], 'username': 'alice'}, {'_id': owners[1], 'username': 'bob'},
+        ]
+
+        response = self.client.get('/api/editor/notebooks', headers=self.headers())
+
+        self.assertEqual(
+            [document['author'] for document in response.json['documents']],
+            ['alice', 'bob', 'alice', 'bob'],
+        )
+        self.users.find.assert_called_once()
+        self.assertEqual(set(self.users.find.call_args.args[0]['_id']['$in']), set(owners))
+        self.users.find_one.assert_not_called()
+
+    def test_search_returns_ranked_summaries(self):
+        self.sessions.find_one.return_value = {'user_id': '507f1f77bcf86cd799439011'}
+        documents = [{'_id': ObjectId(), 'title': title} for title in ('Best', 'Second')]
+        self.users.find.return_value = []
+        with patch.object(editor_api, 'search',
+                          return_value=list(zip(documents, [2.5, 1.25]))) as search:
+            response = self.client.get('/api/editor/search?q=gradient&limit=5',
+                                       headers=self.headers())
+            missing = self.client.get('/api/editor/search?q=', headers=self.headers())
+
+        self.assertEqual([(document['title'], document['score'])
+                          for document in response.json['documents']],
+                         [('Best', 2.5), ('Second', 1.25)])
+        _, user_id, text, projection, limit = search.call_args.args
+        self.assertEqual((user_id, text, limit), ('507f1f77bcf86cd799439011', 'gradient', 5))
+        self.assertNotIn('notebook', projection)
+        self.assertEqual(missing.status_code, 400)
+
+    def test_title_completion_returns_only_titles(self):
+        self.sessions.find_one.return_value = {'user_id': '507f1f77bcf86cd799439011'}
+        notebook_id = ObjectId()
+        self.notebooks.find.return_value.sort.return_value.hint.return_value.limit.return_value = [
+            {'_id': notebook_id, 'title': 'Gradient descent', 'slug': 'gradient-descent'},
+        ]
+
+        response = self.client.get('/api/editor/titles?prefix=Grad&limit=3', headers=self.headers())
+
+        self.assertEqual(response.json['documents'], [
+            {'id': str(notebook_id), 'title': 'Gradient descent', 'slug': 'gradient-descent'},
+        ])
+        query, projection = self.notebooks.find.call_args.args
+        self.assertEqual(query['$and'][0], {'title_prefixes': 'grad'})
+        self.assertNotIn('notebook', projection)
+
+    def test_read_revalidation_skips_notebook_body(self):
+        self.sessions.find_one.return_value = {'user_id': '507f1f77bcf86cd799439011'}
+        notebook_id = ObjectId()
+        self.notebooks.find_one.return_value = {
+            '_id': notebook_id, 'owner_id': '507f1f77bcf86cd799439011', 'revision': 3,
+            'notebook': {'cells': []},
+        }
+        response = self.client.get(f'/api/editor/notebooks/{notebook_id}', headers=self.headers())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Cache-Control'], 'private, no-cache')
+        etag = response.headers['ETag']
+
+        self.notebooks.find_one.reset_mock()
+        response = self.client.get(
+            f'/api/editor/notebooks/{notebook_id}',
+            headers={**self.headers(), 'If-None-Match': etag},
+        )
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.notebooks.find_one.assert_called_once()
+        self.assertEqual(
+            self.notebooks.find_one.call_args.args[1],
+            {'notebook': 0, 'notebook_skeleton': 0, 'cell_chunks': 0},
+        )
+
 
 if __name__ == '__main__':
     unittest.main()
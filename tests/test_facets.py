@@ -0,0 +1,93 @@
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from bson import ObjectId
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import facets  # noqa: E402
+
+
+def increments(counts):
+    """Return the ``$inc`` of every upsert sent to ``facet_counts``, by key."""
+    [operations] = counts.bulk_write.call_args.args
+    return {(op._filter['facet'], op._filter['value'], op._filter['scope']): op._doc['$inc']['count']
+            for op in operations}
+
+
+class FacetCountTest(unittest.TestCase):
+    def setUp(self):
+        self.owner = ObjectId()
+        self.topic = ObjectId()
+        self.counts = MagicMock()
+        self.db = SimpleNamespace(facet_counts=self.counts)
+
+    def notebook(self, visibility='private', tags=('ml',)):
+        return {'owner_id': self.owner, 'visibility': visibility,
+                'tags': list(tags), 'topic_ids': [self.topic]}
+
+    def test_public_notebooks_count_for_their_owner_and_the_public(self):
+        facets.record_change(self.db, None, self.notebook('public'))
+
+        self.assertEqual(increments(self.counts), {
+            ('tag', 'ml', self.owner): 1, ('tag', 'ml', 'public'): 1,
+            ('topic', self.topic, self.owner): 1, ('topic', self.topic, 'public'): 1,
+        })
+        self.counts.delete_many.assert_not_called()
+
+    def test_updates_only_apply_the_difference(self):
+        facets.record_change(self.db, self.notebook('public'),
+                             self.notebook('private', tags=('ml', 'stats')))
+
+        self.assertEqual(increments(self.counts), {
+            ('tag', 'ml', 'public'): -1, ('topic', self.topic, 'public'): -1,
+            ('tag', 'stats', self.owner): 1,
+        })
+        [emptied] = self.counts.delete_many.call_args.args
+        self.assertEqual(emptied['count'], {'$lte': 0})
+        self.assertEqual(len(emptied['$or']), 2)
+
+    def test_unchanged_facets_write_nothing(self):
+        facets.record_change(self.db, self.notebook(), {**self.notebook(), 'title': 'Renamed'})
+
+        self.counts.bulk_write.assert_not_called()
+
+    def test_deletions_are_summed_per_counter(self):
+        facets.record_deletions(self.db, [self.notebook(), self.notebook(tags=())])
+
+        self.assertEqual(increments(self.counts), {
+            ('tag', 'ml', self.owner): -1, ('topic', self.topic, self.owner): -2,
+        })
+
+    def test_counts_are_read_most_frequent_first(self):
+        self.counts.find.return_value.sort.return_value.limit.return_value = [
+            {'value': 'ml', 'count': 3},
+        ]
+
+        self.assertEqual(facets.counts(self.db, 'tag', limit=5), [('ml', 3)])
+        query = self.counts.find.call_args.args[0]
+        self.assertEqual(query, {'facet': 'tag', 'scope': 'public', 'count': {'$gt': 0}})
+        self.counts.find.return_value.sort.assert_called_once_with('count', -1)
+
+    def test_rebuild_replaces_counts_and_removes_stale_ones(self):
+        stale = ObjectId()
+        self.db.notebooks = MagicMock()
+        self.db.notebooks.find.return_value = [self.notebook('public'), self.notebook()]
+        self.counts.find.return_value = [
+            {'_id': stale, 'facet': 'tag', 'value': 'old', 'scope': 'public'},
+        ]
+
+        self.assertEqual(facets.rebuild(self.db), 4)
+
+        [operations] = self.counts.bulk_write.call_args.args
+        replaced = {(op._filter['facet'], op._filter['value'], op._filter['scope']): op._doc['count']
+                    for op in operations if hasattr(op, '_doc')}
+        self.assertEqual(replaced[('tag', 'ml', self.owner)], 2)
+        self.assertEqual(replaced[('tag', 'ml', 'public')], 1)
+        self.assertEqual(operations[-1]._filter, {'_id': stale})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import sys
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import nbformat
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import feed  # noqa: E402
+
+
+def summary_notebook(text):
+    summary = nbformat.v4.new_markdown_cell(text)
+    summary.metadata['type'] = 'summary'
+    return nbformat.v4.new_notebook(cells=[nbformat.v4.new_markdown_cell('# Title'), summary])
+
+
+class FeedTest(unittest.TestCase):
+    def setUp(self):
+        self.entries = MagicMock()
+        self.entries.find.return_value.sort.return_value.skip.return_value.limit.return_value = []
+        self.users = MagicMock()
+        self.users.find_one.return_value = {'username': 'alice'}
+        self.db = SimpleNamespace(public_feed=self.entries, users=self.users)
+        self.owner = ObjectId()
+        self.updated_at = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+    def document(self, visibility='public', **fields):
+        return {'_id': ObjectId(), 'owner_id': self.owner, 'visibility': visibility,
+                'revision': 3, 'title': 'Gradients', 'slug': 'gradients',
+                'created_at': datetime(2024, 1, 1, tzinfo=timezone.utc),
+                'updated_at': self.updated_at, **fields}
+
+    def test_summaries_are_plain_text_cut_at_a_word(self):
+        self.assertEqual(feed.summary_text({}, summary_notebook('Step  by\nstep')), 'Step by step')
+        self.assertEqual(feed.summary_text({'summary': 'Stored'}, summary_notebook('Cell')), 'Stored')
+        with patch.object(feed, 'SUMMARY_LENGTH', 12):
+            self.assertEqual(feed.summary_text({'summary': 'gradient descent methods'}),
+                             'gradient…')
+
+    def test_public_notebooks_are_written_for_newer_revisions(self):
+        document = self.document()
+
+        self.assertTrue(feed.record(self.db, document, summary_notebook('Descent')))
+
+        query, update = self.entries.update_one.call_args.args
+        self.assertEqual(query, {'_id': document['_id'], 'revision': {'$lt': 3}})
+        self.assertEqual(update['$set'], {
+            'revision': 3, 'title': 'Gradients', 'slug': 'gradients', 'owner_id': self.owner,
+            'author': 'alice', 'summary': 'Descent', 'published_at': document['created_at'],
+            'updated_at': self.updated_at,
+        })
+        self.assertTrue(self.entries.update_one.call_args.kwargs['upsert'])
+
+    def test_known_authors_are_not_looked_up(self):
+        feed.record(self.db, self.document(), author='bob')
+
+        self.users.find_one.assert_not_called()
+        self.assertEqual(self.entries.update_one.call_args.args[1]['$set']['author'], 'bob')
+
+    def test_entries_of_later_revisions_are_kept(self):
+        self.entries.update_one.side_effect = DuplicateKeyError('duplicate _id')
+
+        self.assertFalse(feed.record(self.db, self.document()))
+
+        self.entries.delete_many.assert_not_called()
+
+    def test_unpublished_notebooks_leave_the_feed(self):
+        document = self.document('private')
+        self.entries.delete_one.return_value.deleted_count = 1
+
+        self.assertTrue(feed.record(self.db, document))
+
+        self.entries.delete_one.assert_called_once_with(
+            {'_id': document['_id'], 'revision': {'$lt': 3}}
+        )
+        self.entries.update_one.assert_not_called()
+
+    def test_entries_after_the_newest_are_trimmed(self):
+        boundary = {'_id': ObjectId(), 'updated_at': self.updated_at}
+        cursor = self.entries.find.return_value.sort.return_value
+        cursor.skip.return_value.limit.return_value = [boundary]
+
+        feed.record(self.db, self.document())
+
+        cursor.skip.assert_called_once_with(feed.FEED_LENGTH - 1)
+        self.entries.delete_many.assert_called_once_with({'$or': [
+            {'updated_at': {'$lt': self.updated_at}},
+            {'updated_at': self.updated_at, '_id': {'$lt': boundary['_id']}},
+        ]})
+
+    def test_rebuild_reads_the_newest_public_notebooks(self):
+        stored, summarized = self.document(), self.document(summary='Stored summary')
+        self.db.notebooks = MagicMock()
+        self.db.notebooks.find.return_value.sort.return_value.limit.return_value = [
+            stored, summarized,
+        ]
+        self.db.notebooks.find_one.return_value = {
+            '_id': stored['_id'], 'notebook': summary_notebook('From cells'),
+        }
+
+        self.assertEqual(feed.rebuild(self.db), 2)
+
+        self.assertEqual(self.db.notebooks.find.call_args.args[0], {'visibility': 'public'})
+        self.db.notebooks.find_one.assert_called_once()
+        self.entries.delete_many.assert_called_once_with({})
+        entries = self.entries.insert_many.call_args.args[0]
+        self.assertEqual([entry['_id'] for entry in entries], [stored['_id'], summarized['_id']])
+        self.assertEqual([entry['summary'] for entry in entries], ['From cells', 'Stored summary'])
+
+
+if __name__ == '__main__':
+    unittest.main()
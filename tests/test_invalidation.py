@@ -0,0 +1,86 @@
+import sys
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+from invalidation import InvalidationBus  # noqa: E402
+from render_cache import RenderCache  # noqa: E402
+
+
+class InvalidationBusTest(unittest.TestCase):
+    def setUp(self):
+        self.db = MagicMock()
+        self.bus = InvalidationBus(self.db, poll_interval=0)
+        self.notebooks = []
+        self.bus.subscribe('notebooks', self.notebooks.append)
+
+    def test_change_stream_events_reach_subscribers(self):
+        notebook_id = ObjectId()
+        stream = self.db.watch.return_value.__enter__.return_value
+
+        def next_change():
+            if stream.try_next.call_count == 1:
+                return {'ns': {'coll': 'notebooks'}, 'documentKey': {'_id': notebook_id}}
+            self.bus.stop()
+            return None
+        stream.try_next.side_effect = next_change
+
+        self.bus.watch()
+
+        self.assertEqual(self.notebooks, [notebook_id])
+        pipeline = self.db.watch.call_args.args[0]
+        self.assertEqual(pipeline[0]['$match']['ns.coll'], {'$in': ['notebooks']})
+
+    def test_standalone_server_falls_back_to_polling(self):
+        self.db.watch.side_effect = OperationFailure(
+            'The $changeStream stage is only supported on replica sets', code=40573
+        )
+        with patch.object(self.bus, 'poll', side_effect=self.bus.stop) as poll:
+            self.bus.run()
+
+        poll.assert_called_once_with()
+
+    def test_polling_publishes_updates_and_advances(self):
+        since = datetime(2026, 1, 1)
+        changed = [
+            {'_id': ObjectId(), 'updated_at': since + timedelta(seconds=1)},
+            {'_id': ObjectId(), 'updated_at': since + timedelta(seconds=2)},
+        ]
+        self.db['notebooks'].find.return_value.sort.return_value = changed
+
+        high_water = self.bus.poll_once('notebooks', since)
+
+        self.assertEqual(self.notebooks, [document['_id'] for document in changed])
+        self.assertEqual(high_water, changed[-1]['updated_at'])
+        self.assertEqual(
+            self.db['notebooks'].find.call_args.args[0], {'updated_at': {'$gt': since}}
+        )
+
+    def test_failing_subscriber_does_not_block_others(self):
+        self.bus.subscribe('users', MagicMock(side_effect=RuntimeError))
+        received = []
+        self.bus.subscribe('users', received.append)
+
+        with self.assertLogs('reasonreport.invalidation', 'ERROR'):
+            self.bus.publish('users', 'user-id')
+
+        self.assertEqual(received, ['user-id'])
+
+    def test_remote_change_keeps_shared_store_entries(self):
+        store = MagicMock()
+        cache = RenderCache(store=store)
+        cache.local.set(('notebook-id', 1, 'classic'), '<p>old</p>')
+
+        cache.discard_local('notebook-id')
+
+        self.assertEqual(len(cache.local), 0)
+        store.delete_notebook.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,19 @@
+import ast
+import base64
 import sys
+import tempfile
 import unittest
 from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from bson import ObjectId
 
 sys.path.insert(0, str(Path('app').resolve()))
 
 from reasonreport_mcp.tokens import token_digest  # noqa: E402
 from reasonreport_mcp.service import KnowledgeService  # noqa: E402
+from blob_store import BlobStore, DiskBlobStore  # noqa: E402
 
 
 class McpSecurityTest(unittest.TestCase):
@@ -20,11 +28,179 @@ class McpSecurityTest(unittest.TestCase):
         with self.assertRaisesRegex(ValueError, 'at most 30'):
             KnowledgeService._validate_tags([str(value) for value in range(31)])
 
-    def test_owner_query_supports_current_and_legacy_schema(self):
-        user_id = '507f1f77bcf86cd799439011'
-        values = KnowledgeService._owner_query(user_id)['$in']
-        self.assertIn(user_id, values)
-        self.assertIn('507f1f77bcf86cd799439011', [str(value) for value in values])
+    def test_documents_are_created_with_the_canonical_owner_id(self):
+        notebooks = MagicMock()
+        notebooks.insert_one.return_value.inserted_id = ObjectId()
+        history = MagicMock()
+        history.find_one.return_value = None
+        indexed = MagicMock()
+        indexed.find_one_and_update.return_value = None
+        users = MagicMock()
+        users.find_one.return_value = {'username': 'alice'}
+        public_feed = MagicMock()
+        public_feed.find.return_value.sort.return_value.skip.return_value.limit.return_value = []
+        service = KnowledgeService(SimpleNamespace(
+            notebooks=notebooks, notebook_revisions=history, audit_events=MagicMock(),
+            search_documents=indexed, search_stats=MagicMock(), search_postings=MagicMock(),
+            users=users, public_feed=public_feed,
+        ))
+
+        service.create('507f1f77bcf86cd799439011', 'Notes', 'Text', 'First notes', visibility='public')
+
+        document = notebooks.insert_one.call_args.args[0]
+        self.assertEqual(document['owner_id'], ObjectId('507f1f77bcf86cd799439011'))
+        self.assertEqual(document['visibility'], 'public')
+        self.assertNotIn('is_public', document)
+        self.assertEqual(document['title_prefixes'], ['n', 'no', 'not', 'note', 'notes'])
+        self.assertEqual((document['summary'], document['cell_count'], document['word_count']),
+                         ('First notes', 2, 2))
+        query, update = public_feed.update_one.call_args.args
+        self.assertEqual(query, {'_id': document['_id'], 'revision': {'$lt': 1}})
+        self.assertEqual(update['$set']['author'], 'alice')
+        self.assertEqual(update['$set']['summary'], 'First notes')
+
+    def test_list_loads_only_metadata_fields(self):
+        notebooks = MagicMock()
+        notebooks.find.return_value.sort.return_value.limit.return_value = [
+            {'_id': ObjectId(), 'title': 'Notes', 'revision': 2},
+        ]
+        service = KnowledgeService(SimpleNamespace(notebooks=notebooks))
+
+        [result] = service.list('507f1f77bcf86cd799439011')
+        page = service.list_page('507f1f77bcf86cd799439011')
+
+        self.assertEqual(result['title'], 'Notes')
+        self.assertEqual(page['documents'], [result])
+        self.assertIsNone(page['next_cursor'])
+        projection = notebooks.find.call_args.args[1]
+        self.assertNotIn('notebook', projection)
+        self.assertIn('revision', projection)
+
+    def test_queries_are_answered_from_the_search_index(self):
+        notebook_id = ObjectId()
+        postings = MagicMock()
+        postings.find.return_value.sort.return_value.limit.return_value = [
+            {'notebook_id': notebook_id, 'tf': 3, 'length': 10},
+        ]
+        stats = MagicMock()
+        stats.find_one.return_value = {'documents': 4, 'length': 40}
+        notebooks = MagicMock()
+        notebooks.find.return_value = [{'_id': notebook_id, 'title': 'Notes', 'revision': 2}]
+        service = KnowledgeService(SimpleNamespace(
+            notebooks=notebooks, search_postings=postings, search_stats=stats
+        ))
+
+        [result] = service.list('507f1f77bcf86cd799439011', 'Notes')
+
+        self.assertEqual(result['title'], 'Notes')
+        self.assertGreater(result['score'], 0)
+        self.assertEqual(postings.find.call_args.args[0], {'term': 'notes'})
+        query, projection = notebooks.find.call_args.args
+        self.assertEqual(query['$and'][0], {'_id': {'$in': [notebook_id]}})
+        self.assertIn({'visibility': 'public'}, query['$and'][1]['$or'])
+        self.assertNotIn('notebook', projection)
+
+    def test_topic_counts_are_read_from_the_summary_with_their_names(self):
+        topic_id = ObjectId()
+        counts = MagicMock()
+        counts.find.return_value.sort.return_value.limit.return_value = [
+            {'value': topic_id, 'count': 3},
+        ]
+        topics = MagicMock()
+        topics.find.return_value = [{'_id': topic_id, 'name': 'Statistics'}]
+        service = KnowledgeService(SimpleNamespace(facet_counts=counts, topics=topics))
+
+        result = service.facet_counts('507f1f77bcf86cd799439011', 'topic', mine=True)
+
+        self.assertEqual(result, [{'value': str(topic_id), 'name': 'Statistics', 'count': 3}])
+        query = counts.find.call_args.args[0]
+        self.assertEqual(query['scope'], ObjectId('507f1f77bcf86cd799439011'))
+        with self.assertRaisesRegex(ValueError, 'tag or topic'):
+            service.facet_counts('507f1f77bcf86cd799439011', 'owner')
+
+    def test_read_with_current_revision_does_not_load_content(self):
+        notebooks = MagicMock()
+        notebooks.find_one.return_value = {'_id': ObjectId(), 'revision': 4}
+        service = KnowledgeService(SimpleNamespace(notebooks=notebooks))
+
+        result = service.read('507f1f77bcf86cd799439011', str(ObjectId()), known_revision=4)
+
+        self.assertTrue(result['not_modified'])
+        self.assertNotIn('notebook', result)
+        notebooks.find_one.assert_called_once()
+        self.assertNotIn('notebook', notebooks.find_one.call_args.args[1])
+
+    def test_read_pages_through_chunked_cells(self):
+        refs = [{'chunk_id': ObjectId(), 'cell_id': str(index)} for index in range(5)]
+        notebooks = MagicMock()
+        notebooks.find_one.return_value = {
+            '_id': ObjectId(), 'revision': 2,
+            'notebook_skeleton': {'metadata': {}}, 'cell_chunks': refs,
+        }
+        cells = MagicMock()
+        cells.find.return_value = [
+            {'_id': ref['chunk_id'], 'cell': {'id': ref['cell_id']}} for ref in refs[2:4]
+        ]
+        service = KnowledgeService(SimpleNamespace(notebooks=notebooks, notebook_cells=cells))
+
+        result = service.read('507f1f77bcf86cd799439011', str(ObjectId()),
+                              cell_offset=2, cell_limit=2)
+
+        self.assertEqual(result['cell_count'], 5)
+        self.assertEqual(result['notebook']['cells'], [{'id': '2'}, {'id': '3'}])
+        self.assertEqual(
+            cells.find.call_args.args[0], {'_id': {'$in': [ref['chunk_id'] for ref in refs[2:4]]}}
+        )
+
+    def test_reads_return_externalized_images_inline(self):
+        png = base64.b64encode(b'\x89PNG' + bytes(64)).decode('ascii')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        blobs = BlobStore(DiskBlobStore(directory.name), threshold=16)
+        notebook = blobs.externalize({'metadata': {}, 'cells': [{
+            'id': 'plot', 'cell_type': 'code', 'source': 'plot()', 'metadata': {},
+            'outputs': [{'output_type': 'display_data', 'metadata': {},
+                         'data': {'image/png': png}}],
+        }]})
+        self.assertTrue(notebook['cells'][0]['outputs'][0]['data']['image/png']
+                        .startswith('reasonreport-blob:'))
+        notebooks = MagicMock()
+        notebooks.find_one.return_value = {'_id': ObjectId(), 'revision': 1, 'notebook': notebook}
+        service = KnowledgeService(SimpleNamespace(notebooks=notebooks), blobs=blobs)
+
+        result = service.read('507f1f77bcf86cd799439011', str(ObjectId()))
+
+        self.assertEqual(result['notebook']['cells'][0]['outputs'][0]['data']['image/png'], png)
+
+    def test_revision_reads_require_ownership_and_a_recorded_revision(self):
+        document_id = ObjectId()
+        notebooks = MagicMock()
+        history = MagicMock()
+        history.find_one.return_value = None
+        service = KnowledgeService(SimpleNamespace(notebooks=notebooks, notebook_revisions=history))
+
+        notebooks.find_one.return_value = None
+        with self.assertRaises(PermissionError):
+            service.read_revision('507f1f77bcf86cd799439011', str(document_id), 1)
+        notebooks.find_one.return_value = {'_id': document_id}
+        with self.assertRaisesRegex(LookupError, 'Revision 3'):
+            service.read_revision('507f1f77bcf86cd799439011', str(document_id), 3)
+
+        self.assertEqual(notebooks.find_one.call_args.args[1], {'_id': 1})
+        self.assertEqual(history.find_one.call_args.args[0],
+                         {'notebook_id': document_id, 'revision': 3})
+
+
+
+class ApplicationModulesTest(unittest.TestCase):
+    def test_application_modules_import_each_other_by_flat_name(self):
+        relative = [
+            path.name
+            for path in Path('app/reasonreport').glob('*.py')
+            for node in ast.walk(ast.parse(path.read_text()))
+            if isinstance(node, ast.ImportFrom) and node.level
+        ]
+        self.assertEqual(relative, [])
 
 
 if __name__ == '__main__':
@@ -1,3 +1,5 @@
+import base64
+import copy
 import sys
 import unittest
 from pathlib import Path
@@ -7,6 +9,7 @@ from unittest.mock import MagicMock, patch
 import nbformat
 
 sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import blob_store  # noqa: E402
 import models  # noqa: E402
 
 
@@ -43,7 +46,7 @@ class NotebookPublicationTest(unittest.TestCase):
                 {'notebook': publication_notebook('# A Better Page #')},
             )
 
-        self.assertEqual(document['owner_id'], '507f1f77bcf86cd799439011')
+        self.assertEqual(document['owner_id'], models.ObjectId('507f1f77bcf86cd799439011'))
         self.assertEqual(document['title'], 'A Better Page')
         self.assertEqual(document['slug'], 'a-better-page')
         server_metadata_cells = [
@@ -68,9 +71,10 @@ class NotebookPublicationTest(unittest.TestCase):
             )
 
         self.assertEqual(document['slug'], 'renamed-page')
-        query = notebooks.find_one.call_args.args[0]
-        self.assertEqual(query['slug'], 'renamed-page')
+        query = notebooks.find.call_args.args[0]
+        self.assertEqual(query['slug'], {'$regex': r'^renamed\-page(-[0-9]+)?$'})
         self.assertIn('$ne', query['_id'])
+        notebooks.find_one.assert_not_called()
 
     def test_publication_uses_only_first_line_as_title(self):
         notebooks = MagicMock()
@@ -121,16 +125,84 @@ class NotebookPublicationTest(unittest.TestCase):
         self.assertEqual(notebook.metadata['title'], models.DEFAULT_TITLE)
         self.assertEqual(notebook.cells[0].source, f'# {models.DEFAULT_TITLE}')
 
-    def test_create_notebook_generates_id_before_building_document(self):
+    def test_published_draft_is_created_under_its_reserved_id(self):
+        reserved_id = str(models.ObjectId())
         notebooks = MagicMock()
-        with patch.object(
-            models, 'mongo', SimpleNamespace(db=SimpleNamespace(notebooks=notebooks))
+        notebooks.find_one.return_value = None
+        with (
+            patch.object(models, 'mongo',
+                         SimpleNamespace(db=SimpleNamespace(notebooks=notebooks))),
+            patch.object(models.revisions, 'record_notebook') as record_notebook,
+            patch.object(models.search, 'index_notebook') as index_notebook,
+            patch.object(models.feed, 'record') as record_feed,
         ):
-            notebook_id = models.create_notebook('user-id', 'Alice')
+            notebook_id, slug = models.create_new_notebook(
+                'user-id', 'Alice', {'notebook': publication_notebook('Draft page')}, reserved_id
+            )
 
         document = notebooks.insert_one.call_args.args[0]
-        self.assertEqual(notebook_id, str(document['_id']))
-        self.assertEqual(document['slug'], f"notebook-{notebook_id}")
+        self.assertEqual(notebook_id, reserved_id)
+        self.assertEqual(document['_id'], models.ObjectId(reserved_id))
+        self.assertEqual(slug, 'draft-page')
+        self.assertEqual(record_notebook.call_args.args[1], document['_id'])
+        _, indexed_id, revision, _, title = index_notebook.call_args.args
+        self.assertEqual((indexed_id, revision, title), (document['_id'], 1, 'Draft page'))
+        _, entry_source, _, author = record_feed.call_args.args
+        self.assertEqual((entry_source['_id'], author), (document['_id'], 'Alice'))
+
+    def clone(self, source, copied=(True,)):
+        notebooks = MagicMock()
+        notebooks.find_one.return_value = source
+        with (
+            patch.object(models, 'mongo',
+                         SimpleNamespace(db=SimpleNamespace(notebooks=notebooks))),
+            patch.object(models.cell_store, 'copy_notebook', side_effect=copied) as copy,
+        ):
+            result = models.clone_notebook('template-page', 'reader-id')
+        return result, notebooks, copy
+
+    def test_template_is_cloned_into_a_private_draft_of_the_reader(self):
+        source = {'_id': models.ObjectId(), 'owner_id': 'owner-id',
+                  'visibility': 'public', 'revision': 5}
+
+        notebook_id, notebooks, copy = self.clone(source)
+
+        notebooks.find_one.assert_called_once_with(
+            {'slug': 'template-page'}, models.CLONE_SOURCE_FIELDS
+        )
+        _, copied_source, draft = copy.call_args.args
+        self.assertIs(copied_source, source)
+        self.assertEqual(notebook_id, str(draft['_id']))
+        self.assertEqual(draft['owner_id'], 'reader-id')
+        self.assertEqual(draft['slug'], f'notebook-{notebook_id}')
+        self.assertEqual((draft['title'], draft['visibility'], draft['revision']),
+                         ('', 'private', 1))
+        self.assertEqual(draft['cloned_from'], source['_id'])
+        self.assertNotIn('content_hash', draft)
+
+    def test_clone_retries_when_the_template_is_saved_meanwhile(self):
+        source = {'_id': models.ObjectId(), 'owner_id': 'owner-id',
+                  'visibility': 'public', 'revision': 5}
+
+        notebook_id, notebooks, copy = self.clone(source, copied=[False, True])
+
+        self.assertEqual(notebooks.find_one.call_count, 2)
+        self.assertEqual(notebook_id, str(copy.call_args.args[2]['_id']))
+
+    def test_private_templates_of_others_are_not_cloned(self):
+        source = {'_id': models.ObjectId(), 'owner_id': 'owner-id',
+                  'visibility': 'private', 'allowed_user_ids': [], 'revision': 5}
+
+        result, _, copy = self.clone(source)
+
+        self.assertEqual(result, {'message': 'not_authorized'})
+        copy.assert_not_called()
+
+    def test_reserved_id_must_be_an_object_id(self):
+        with self.assertRaisesRegex(ValueError, 'notebook_id must be an ObjectId'):
+            models.create_new_notebook(
+                'user-id', 'Alice', {'notebook': publication_notebook('Draft page')}, '../x'
+            )
 
     def test_private_publication_resolves_allowed_usernames(self):
         reader_id = models.ObjectId()
@@ -150,7 +222,7 @@ class NotebookPublicationTest(unittest.TestCase):
 
         self.assertEqual(document['visibility'], 'private')
         self.assertEqual(document['allowed_user_ids'], [reader_id])
-        self.assertFalse(document['is_public'])
+        self.assertNotIn('is_public', document)
         users.find_one.assert_called_once_with({'username_normalized': 'bob'})
         self.assertTrue(models.check_authorization(document, str(reader_id)))
         self.assertFalse(models.check_authorization(document, 'somebody-else'))
@@ -173,17 +245,6 @@ class NotebookPublicationTest(unittest.TestCase):
                 }
             )
 
-    def test_create_notebook_generates_id_before_building_document(self):
-        notebooks = MagicMock()
-        with patch.object(
-            models, 'mongo', SimpleNamespace(db=SimpleNamespace(notebooks=notebooks))
-        ):
-            notebook_id = models.create_notebook('user-id', 'Alice')
-
-        document = notebooks.insert_one.call_args.args[0]
-        self.assertEqual(notebook_id, str(document['_id']))
-        self.assertEqual(document['slug'], f"notebook-{notebook_id}")
-
     def test_legacy_author_and_date_cells_are_removed_without_user_content_loss(self):
         notebook = nbformat.v4.new_notebook(metadata={'title': 'Migrated Page'})
         notebook.cells = [
@@ -238,21 +299,389 @@ class NotebookPublicationTest(unittest.TestCase):
         old_updated_at = models.datetime(2020, 1, 3, 3, 4, 5, tzinfo=models.timezone.utc)
         notebooks = MagicMock()
         notebooks.find_one.side_effect = [
-            {'created_at': created_at, 'updated_at': old_updated_at},
+            {'_id': models.ObjectId(notebook_id), 'owner_id': 'user-id', 'revision': 3,
+             'created_at': created_at, 'updated_at': old_updated_at},
             None,
         ]
+        notebooks.find_one_and_update.return_value = {'slug': 'updated-page', 'revision': 4}
         with patch.object(
             models, 'mongo', SimpleNamespace(db=SimpleNamespace(notebooks=notebooks))
-        ):
-            models.save_notebook(
+        ), patch.object(models.revisions, 'record_notebook') as record, \
+                patch.object(models.search, 'index_notebook') as index, \
+                patch.object(models.feed, 'record') as record_feed:
+            result = models.save_notebook(
                 notebook_id, 'user-id', 'Alice',
                 {'notebook': publication_notebook('Updated Page')},
             )
 
-        update = notebooks.update_one.call_args.args[1]
+        self.assertEqual(result, {'slug': 'updated-page', 'revision': 4})
+        _, recorded_id, recorded_revision, recorded = record.call_args.args
+        self.assertEqual((recorded_id, recorded_revision), (models.ObjectId(notebook_id), 4))
+        self.assertEqual(recorded.metadata['title'], 'Updated Page')
+        self.assertEqual(index.call_args.args[2:], (4, recorded, 'Updated Page'))
+        _, entry_source, _, author = record_feed.call_args.args
+        self.assertEqual((entry_source['slug'], entry_source['revision']), ('updated-page', 4))
+        self.assertEqual(entry_source['created_at'], created_at)
+        query, update = notebooks.find_one_and_update.call_args.args
+        self.assertEqual(query, {
+            '_id': models.ObjectId(notebook_id), 'owner_id': 'user-id', 'revision': 3,
+        })
         self.assertEqual(update['$set']['created_at'], created_at)
+        self.assertEqual(update['$set']['revision'], 4)
         self.assertGreater(update['$set']['updated_at'], old_updated_at)
-        self.assertEqual(update['$unset'], {'author': '', 'date': ''})
+        self.assertEqual(update['$unset'], {
+            'author': '', 'date': '', 'notebook_skeleton': '', 'cell_chunks': '',
+        })
+        notebooks.update_one.assert_not_called()
+
+    def test_save_of_stale_revision_is_a_conflict(self):
+        notebook_id = '507f1f77bcf86cd799439011'
+        notebooks = MagicMock()
+        notebooks.find_one.return_value = {
+            '_id': models.ObjectId(notebook_id), 'owner_id': 'user-id', 'revision': 5,
+            'slug': 'updated-page',
+        }
+        with patch.object(
+            models, 'mongo', SimpleNamespace(db=SimpleNamespace(notebooks=notebooks))
+        ):
+            stale = models.save_notebook(
+                notebook_id, 'user-id', 'Alice',
+                {'notebook': publication_notebook('Updated Page')}, expected_revision=4,
+            )
+            notebooks.find_one_and_update.return_value = None
+            raced = models.save_notebook(
+                notebook_id, 'user-id', 'Alice',
+                {'notebook': publication_notebook('Updated Page')}, expected_revision=5,
+            )
+
+        self.assertEqual(stale, {'message': 'conflict'})
+        self.assertEqual(raced, {'message': 'conflict'})
+        notebooks.find_one_and_update.assert_called_once()
+
+    def test_unchanged_title_keeps_slug_without_uniqueness_queries(self):
+        notebooks = MagicMock()
+        with patch.object(
+            models, 'mongo', SimpleNamespace(db=SimpleNamespace(notebooks=notebooks))
+        ):
+            document = models.build_notebook_document(
+                '507f1f77bcf86cd799439011', 'Alice',
+                {'notebook': publication_notebook('Renamed Page')},
+                notebook_id='507f1f77bcf86cd799439011', current_slug='renamed-page-2',
+            )
+
+        self.assertEqual(document['slug'], 'renamed-page-2')
+        notebooks.find.assert_not_called()
+
+    def test_republishing_identical_content_writes_nothing(self):
+        notebook_id = '507f1f77bcf86cd799439011'
+        notebook = publication_notebook('Same Page')
+        published = models.build_notebook_document(
+            'user-id', 'Alice', {'notebook': copy.deepcopy(notebook)}, current_slug='same-page',
+        )
+        notebooks = MagicMock()
+        notebooks.find_one.return_value = {
+            '_id': models.ObjectId(notebook_id), 'owner_id': 'user-id', 'revision': 7,
+            'slug': 'same-page', 'visibility': 'public', 'allowed_user_ids': [],
+            'topic_ids': [], 'content_hash': published['content_hash'],
+        }
+        with patch.object(
+            models, 'mongo', SimpleNamespace(db=SimpleNamespace(notebooks=notebooks))
+        ):
+            result = models.save_notebook(
+                notebook_id, 'user-id', 'Alice',
+                {'notebook': notebook}, expected_revision=7,
+            )
+
+        self.assertEqual(result, {'slug': 'same-page', 'revision': 7, 'unchanged': True})
+        notebooks.find_one_and_update.assert_not_called()
+
+    def test_republishing_identical_content_stores_no_images_or_slugs(self):
+        notebook_id = '507f1f77bcf86cd799439011'
+        notebook = publication_notebook('Same Page')
+        notebook.cells.append(nbformat.v4.new_code_cell('plot()', outputs=[nbformat.v4.new_output(
+            'display_data', data={'image/png': base64.b64encode(bytes(64)).decode('ascii')}
+        )]))
+        store = MagicMock()
+        notebooks = MagicMock()
+        with (
+            patch.object(models, 'notebook_blobs', blob_store.BlobStore(store, threshold=16)),
+            patch.object(
+                models, 'mongo', SimpleNamespace(db=SimpleNamespace(notebooks=notebooks))
+            ),
+        ):
+            published = models.build_notebook_document(
+                'user-id', 'Alice', {'notebook': copy.deepcopy(notebook)},
+                current_slug='same-page',
+            )
+            store.reset_mock()
+            # A draft's placeholder slug would need a new one if anything changed.
+            notebooks.find_one.return_value = {
+                '_id': models.ObjectId(notebook_id), 'owner_id': 'user-id', 'revision': 7,
+                'slug': f'notebook-{notebook_id}', 'visibility': 'public',
+                'allowed_user_ids': [], 'topic_ids': [], 'content_hash': published['content_hash'],
+            }
+            result = models.save_notebook(notebook_id, 'user-id', 'Alice', {'notebook': notebook})
+
+        self.assertTrue(result['unchanged'])
+        self.assertEqual(len(published['blob_digests']), 1)
+        store.missing.assert_not_called()
+        store.put.assert_not_called()
+        notebooks.find.assert_not_called()
+        notebooks.find_one_and_update.assert_not_called()
+
+    def test_large_notebooks_are_saved_as_cell_chunks(self):
+        notebook_id = '507f1f77bcf86cd799439011'
+        previous = [{'chunk_id': models.ObjectId(), 'cell_id': 'old', 'digest': 'old'}]
+        notebooks = MagicMock()
+        notebooks.find_one.return_value = {
+            '_id': models.ObjectId(notebook_id), 'owner_id': 'user-id', 'revision': 2,
+            'slug': 'large-page', 'cell_chunks': previous,
+        }
+        notebooks.find_one_and_update.return_value = {'slug': 'large-page', 'revision': 3}
+        cells = MagicMock()
+        database = SimpleNamespace(notebooks=notebooks, notebook_cells=cells)
+        with patch.object(models, 'mongo', SimpleNamespace(db=database)), \
+                patch.object(models, 'DEFAULT_CHUNK_THRESHOLD', 1), \
+                patch.object(models.revisions, 'record_notebook'), \
+                patch.object(models.search, 'index_notebook'), \
+                patch.object(models.feed, 'record'):
+            result = models.save_notebook(
+                notebook_id, 'user-id', 'Alice', {'notebook': publication_notebook('Large Page')},
+            )
+
+        self.assertEqual(result, {'slug': 'large-page', 'revision': 3})
+        update = notebooks.find_one_and_update.call_args.args[1]
+        self.assertNotIn('notebook', update['$set'])
+        self.assertEqual(update['$unset']['notebook'], '')
+        self.assertNotIn('cells', update['$set']['notebook_skeleton'])
+        stored = cells.insert_many.call_args.args[0]
+        self.assertEqual(
+            [ref['chunk_id'] for ref in update['$set']['cell_chunks']],
+            [chunk['_id'] for chunk in stored],
+        )
+        cells.delete_many.assert_called_once_with({'_id': {'$in': [previous[0]['chunk_id']]}})
+
+    def test_content_hash_ignores_key_order_and_id_types(self):
+        owner = models.ObjectId()
+        document = {'notebook': {'cells': [], 'metadata': {'a': 1, 'b': 2}},
+                    'visibility': 'private', 'allowed_user_ids': [owner], 'topic_ids': []}
+        reordered = {'topic_ids': [], 'allowed_user_ids': [str(owner)], 'visibility': 'private',
+                     'notebook': {'metadata': {'b': 2, 'a': 1}, 'cells': []},
+                     'updated_at': models.datetime.now(models.timezone.utc)}
+
+        self.assertEqual(models.content_hash(document), models.content_hash(reordered))
+        self.assertNotEqual(
+            models.content_hash(document),
+            models.content_hash({**document, 'visibility': 'public'}),
+        )
+
+
+class CellDeltaSaveTest(unittest.TestCase):
+    notebook_id = '507f1f77bcf86cd799439011'
+
+    def stored(self, *cells, minor=5):
+        notebook = nbformat.v4.new_notebook(cells=list(cells))
+        notebook.nbformat_minor = minor
+        return {
+            '_id': models.ObjectId(self.notebook_id), 'owner_id': 'user-id',
+            'revision': 3, 'slug': 'stored-page', 'notebook': notebook,
+        }
+
+    def save(self, existing, operations, base_revision=3):
+        notebooks = MagicMock()
+        notebooks.find_one.return_value = existing
+        notebooks.find_one_and_update.return_value = {'slug': 'stored-page', 'revision': 4}
+        with patch.object(
+            models, 'mongo', SimpleNamespace(db=SimpleNamespace(notebooks=notebooks))
+        ), patch.object(models.revisions, 'record_revision') as self.record, \
+                patch.object(models.search, 'index_notebook') as self.index, \
+                patch.object(models.feed, 'record') as self.feed:
+            result = models.save_notebook_cells(
+                self.notebook_id, 'user-id', base_revision, operations
+            )
+        return result, notebooks
+
+    def test_operations_apply_in_order(self):
+        inserted = nbformat.v4.new_markdown_cell('New', id='new')
+        edited = nbformat.v4.new_code_cell('print(1)', id='b')
+
+        order, touched = models.apply_cell_operations(['a', 'b', 'c'], [
+            {'op': 'delete', 'id': 'a'},
+            {'op': 'move', 'id': 'c', 'index': 0},
+            {'op': 'insert', 'index': 1, 'cell': inserted},
+            {'op': 'update', 'cell': edited},
+        ])
+
+        self.assertEqual(order, ['c', 'new', 'b'])
+        self.assertEqual(set(touched), {'new', 'b'})
+
+    def test_invalid_operations_are_rejected(self):
+        cell = nbformat.v4.new_markdown_cell('Text', id='a')
+        for operations in (
+            [{'op': 'rename', 'id': 'a'}],
+            [{'op': 'delete', 'id': 'missing'}],
+            [{'op': 'insert', 'index': 0, 'cell': cell}],
+            [{'op': 'move', 'id': 'a', 'index': 1}],
+            [{'op': 'update', 'cell': {'id': 'a', 'cell_type': 'markdown'}}],
+        ):
+            with self.subTest(operations=operations), self.assertRaises(ValueError):
+                models.apply_cell_operations(['a'], operations)
+
+    def test_only_touched_cells_are_sent(self):
+        title = nbformat.v4.new_markdown_cell('# Stored Page', id='title')
+        output = nbformat.v4.new_code_cell('plot()', id='plot')
+        edited = nbformat.v4.new_markdown_cell('Edited', id='text')
+
+        result, notebooks = self.save(
+            self.stored(title, output, nbformat.v4.new_markdown_cell('Text', id='text')),
+            [{'op': 'update', 'cell': edited}],
+        )
+
+        self.assertEqual(result, {'slug': 'stored-page', 'revision': 4})
+        query, pipeline = notebooks.find_one_and_update.call_args.args
+        self.assertEqual(query, {
+            '_id': models.ObjectId(self.notebook_id), 'owner_id': 'user-id', 'revision': 3,
+        })
+        fields = pipeline[0]['$set']
+        self.assertEqual(
+            fields['notebook.cells']['$map']['input']['$literal'],
+            [{'id': 'title'}, {'id': 'plot'}, {'cell': edited}],
+        )
+        self.assertEqual(fields['revision'], {'$add': ['$revision', 1]})
+        self.assertEqual(fields['slug'], {'$literal': 'stored-page'})
+        self.assertEqual(fields['title_normalized'], {'$literal': 'stored page'})
+        self.assertEqual(fields['cell_count'], {'$literal': 3})
+        self.assertEqual(fields['word_count'], {'$literal': 3})
+        self.assertEqual(fields['code_languages'], {'$literal': ['python']})
+        self.assertEqual(fields['blob_digests'], {'$literal': []})
+        self.assertEqual(notebooks.find_one.call_count, 1)
+        _, _, revision, skeleton, order, changed = self.record.call_args.args
+        digest = models.cell_store.cell_digest(edited)
+        self.assertEqual(revision, 4)
+        self.assertEqual(skeleton['metadata']['title'], 'Stored Page')
+        self.assertEqual(order, [['title', None], ['plot', None], ['text', digest]])
+        self.assertEqual(changed, {digest: edited})
+        _, _, revision, indexed, title = self.index.call_args.args
+        self.assertEqual(revision, 4)
+        self.assertEqual(title, 'Stored Page')
+        self.assertEqual([cell['source'] for cell in indexed['cells']],
+                         ['# Stored Page', 'plot()', 'Edited'])
+
+    def test_metadata_only_change_is_published(self):
+        existing = self.stored(
+            nbformat.v4.new_markdown_cell('# Stored Page', id='title'),
+            nbformat.v4.new_code_cell('plot()', id='plot'),
+        )
+        metadata = {
+            'kernelspec': {'name': 'julia-1.10', 'display_name': 'Julia', 'language': 'julia'},
+            'language_info': {'name': 'julia'},
+            'widgets': {'state': {}},
+            'title': 'Stale title',
+        }
+
+        result, notebooks = self.save(existing, [{'op': 'metadata', 'metadata': metadata}])
+
+        self.assertEqual(result, {'slug': 'stored-page', 'revision': 4})
+        fields = notebooks.find_one_and_update.call_args.args[1][0]['$set']
+        self.assertEqual(fields['notebook.metadata'],
+                         {'$literal': {**metadata, 'title': 'Stored Page'}})
+        self.assertNotIn('notebook.metadata.title', fields)
+        self.assertEqual(fields['code_languages'], {'$literal': ['julia']})
+        skeleton = self.record.call_args.args[3]
+        self.assertEqual(skeleton['metadata']['kernelspec']['language'], 'julia')
+
+    def test_metadata_differing_only_in_title_writes_nothing(self):
+        existing = self.stored(nbformat.v4.new_markdown_cell('# Stored Page', id='title'))
+        metadata = {**existing['notebook']['metadata'], 'title': 'Edited in the editor'}
+
+        result, notebooks = self.save(existing, [{'op': 'metadata', 'metadata': metadata}])
+
+        self.assertEqual(result, {'slug': 'stored-page', 'revision': 3, 'unchanged': True})
+        notebooks.find_one_and_update.assert_not_called()
+
+    def test_empty_change_set_writes_nothing(self):
+        result, notebooks = self.save(
+            self.stored(nbformat.v4.new_markdown_cell('# Stored Page', id='title')), []
+        )
+
+        self.assertEqual(result, {'slug': 'stored-page', 'revision': 3, 'unchanged': True})
+        notebooks.find_one_and_update.assert_not_called()
+
+    def test_unchanged_draft_is_published_under_its_title(self):
+        draft = self.stored(nbformat.v4.new_markdown_cell('# Stored Page', id='title'))
+        draft['slug'] = f'notebook-{self.notebook_id}'
+
+        result, notebooks = self.save(draft, [])
+
+        self.assertEqual(result, {'slug': 'stored-page', 'revision': 4})
+        fields = notebooks.find_one_and_update.call_args.args[1][0]['$set']
+        self.assertEqual(fields['slug'], {'$literal': 'stored-page'})
+
+    def test_chunked_notebooks_store_only_touched_cells(self):
+        refs = [{'chunk_id': models.ObjectId(), 'cell_id': cell_id, 'digest': cell_id}
+                for cell_id in ('title', 'plot')]
+        existing = self.stored()
+        existing.update(notebook_skeleton=existing.pop('notebook'), cell_chunks=refs)
+        del existing['notebook_skeleton']['cells']
+        edited = nbformat.v4.new_code_cell('plot(2)', id='plot')
+        notebooks = MagicMock()
+        notebooks.find_one.return_value = existing
+        notebooks.find_one_and_update.return_value = {'slug': 'stored-page', 'revision': 4}
+        cells = MagicMock()
+        cells.find.return_value = [{'_id': refs[0]['chunk_id'], 'cell': {
+            'id': 'title', 'cell_type': 'markdown', 'source': '# Stored Page'
+        }}]
+        database = SimpleNamespace(notebooks=notebooks, notebook_cells=cells)
+        with patch.object(models, 'mongo', SimpleNamespace(db=database)), \
+                patch.object(models.revisions, 'record_revision') as record, \
+                patch.object(models.search, 'index_notebook'), \
+                patch.object(models.feed, 'record'):
+            result = models.save_notebook_cells(
+                self.notebook_id, 'user-id', 3, [{'op': 'update', 'cell': edited}]
+            )
+
+        self.assertEqual(result, {'slug': 'stored-page', 'revision': 4})
+        [chunk] = cells.insert_many.call_args.args[0]
+        self.assertEqual(chunk['cell'], edited)
+        update = notebooks.find_one_and_update.call_args.args[1]
+        self.assertEqual(
+            [ref['chunk_id'] for ref in update['$set']['cell_chunks']],
+            [refs[0]['chunk_id'], chunk['_id']],
+        )
+        self.assertEqual(update['$inc'], {'revision': 1})
+        cells.delete_many.assert_called_once_with({'_id': {'$in': [refs[1]['chunk_id']]}})
+        self.assertEqual(record.call_args.args[4], [['title', 'title'], ['plot', chunk['digest']]])
+
+    def test_stale_base_revision_is_a_conflict(self):
+        result, notebooks = self.save(
+            self.stored(nbformat.v4.new_markdown_cell('# Stored Page', id='title')),
+            [], base_revision=2,
+        )
+
+        self.assertEqual(result, {'message': 'conflict'})
+        notebooks.find_one_and_update.assert_not_called()
+
+    def test_notebooks_without_cell_ids_need_a_full_save(self):
+        result, notebooks = self.save(
+            self.stored(nbformat.v4.new_markdown_cell('# Stored Page'), minor=4), []
+        )
+
+        self.assertEqual(result, {'message': 'unsupported'})
+        notebooks.find_one_and_update.assert_not_called()
+
+    def test_embedded_notebooks_growing_past_the_chunk_threshold_need_a_full_save(self):
+        existing = self.stored(nbformat.v4.new_markdown_cell('# Stored Page', id='title'))
+        existing['notebook_size'] = models.DEFAULT_CHUNK_THRESHOLD - 100
+        output = nbformat.v4.new_code_cell('print(1)', id='title', outputs=[
+            nbformat.v4.new_output('stream', text='x' * 200),
+        ])
+
+        result, notebooks = self.save(existing, [{'op': 'update', 'cell': output}])
+
+        self.assertEqual(result, {'message': 'unsupported'})
+        notebooks.find_one_and_update.assert_not_called()
+        projection = notebooks.find_one.call_args.args[1]
+        self.assertEqual(projection['notebook_size'], {'$bsonSize': '$notebook'})
 
 
 if __name__ == '__main__':
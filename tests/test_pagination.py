@@ -0,0 +1,78 @@
+import sys
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from bson import ObjectId
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import pagination  # noqa: E402
+
+
+def matches(document, query):
+    if '$and' in query:
+        return all(matches(document, part) for part in query['$and'])
+    if '$or' in query:
+        return any(matches(document, part) for part in query['$or'])
+    for field, condition in query.items():
+        value = document[field]
+        if isinstance(condition, dict):
+            if not value < condition['$lt']:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class KeysetPaginationTest(unittest.TestCase):
+    def setUp(self):
+        # Two documents per timestamp, so pages split between equal updated_at.
+        self.documents = [
+            {'_id': ObjectId(), 'updated_at': datetime(2026, 1, 1 + index // 2, tzinfo=timezone.utc)}
+            for index in range(7)
+        ]
+        self.collection = MagicMock()
+
+        def find(query, projection=None):
+            found = [document for document in self.documents if matches(document, query)]
+            cursor = MagicMock()
+            cursor.sort.return_value.limit.side_effect = lambda limit: sorted(
+                found, key=lambda document: (document['updated_at'], document['_id']),
+                reverse=True,
+            )[:limit]
+            return cursor
+
+        self.collection.find.side_effect = find
+
+    def test_cursors_walk_every_document_once_in_order(self):
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = pagination.find_page(self.collection, {}, None, 3, cursor)
+            seen.extend(page)
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, sorted(
+            self.documents, key=lambda document: (document['updated_at'], document['_id']),
+            reverse=True,
+        ))
+        self.assertEqual(self.collection.find.call_count, 3)
+
+    def test_cursor_round_trips_naive_utc_datetimes(self):
+        document = {'_id': ObjectId(), 'updated_at': datetime(2026, 3, 4, 5, 6, 7, 8000)}
+
+        updated_at, document_id = pagination.decode_cursor(pagination.encode_cursor(document))
+
+        self.assertEqual(updated_at, document['updated_at'].replace(tzinfo=timezone.utc))
+        self.assertEqual(document_id, document['_id'])
+
+    def test_malformed_cursors_are_rejected(self):
+        for cursor in ('not a cursor', 'W10=', 42):
+            with self.subTest(cursor=cursor), self.assertRaisesRegex(ValueError, 'Invalid cursor'):
+                pagination.decode_cursor(cursor)
+
+
+if __name__ == '__main__':
+    unittest.main()
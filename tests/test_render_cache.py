@@ -0,0 +1,70 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import render_cache  # noqa: E402
+from caching import LRUCache  # noqa: E402
+
+
+class RenderCacheTest(unittest.TestCase):
+    def test_lru_evicts_least_recently_used_entry(self):
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_page_is_rendered_once_per_revision(self):
+        cache = render_cache.RenderCache(max_entries=4)
+        render = MagicMock(side_effect=['<p>one</p>', '<p>two</p>'])
+        document = {'_id': 'notebook-id', 'revision': 3}
+
+        first = cache.get_or_render(render_cache.page_key(document), render)
+        second = cache.get_or_render(render_cache.page_key(document), render)
+        document['revision'] = 4
+        third = cache.get_or_render(render_cache.page_key(document), render)
+
+        self.assertEqual((first, second, third), ('<p>one</p>', '<p>one</p>', '<p>two</p>'))
+        self.assertEqual(render.call_count, 2)
+
+    def test_legacy_documents_without_revision_are_not_cached(self):
+        self.assertIsNone(render_cache.page_key({'_id': 'legacy'}))
+        render = MagicMock(return_value='<p>legacy</p>')
+        cache = render_cache.RenderCache()
+        cache.get_or_render(None, render)
+        cache.get_or_render(None, render)
+        self.assertEqual(render.call_count, 2)
+
+    def test_shared_store_hit_skips_rendering(self):
+        store = MagicMock()
+        store.get.return_value = '<p>shared</p>'
+        cache = render_cache.RenderCache(store=store)
+        render = MagicMock()
+
+        html = cache.get_or_render(('notebook-id', 1, 'classic'), render)
+
+        self.assertEqual(html, '<p>shared</p>')
+        render.assert_not_called()
+        store.set.assert_not_called()
+
+    def test_disk_store_round_trip_and_invalidation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = render_cache.RenderCache(store=render_cache.DiskRenderStore(directory))
+            key = ('507f1f77bcf86cd799439011', 2, 'classic')
+            cache.set(key, '<p>stored</p>')
+            cache.local.clear()
+            self.assertEqual(cache.get(key), '<p>stored</p>')
+
+            cache.invalidate('507f1f77bcf86cd799439011')
+            self.assertIsNone(cache.get(key))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import multiprocessing
+import sys
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from bson import ObjectId
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import render_jobs  # noqa: E402
+import render_worker  # noqa: E402
+
+
+class RenderQueueTest(unittest.TestCase):
+    def test_enqueue_keeps_one_job_per_notebook(self):
+        db = SimpleNamespace(render_jobs=MagicMock())
+        render_jobs.enqueue_render(db, '507f1f77bcf86cd799439011', 4)
+
+        query, update = db.render_jobs.update_one.call_args.args
+        self.assertEqual(query, {'notebook_id': ObjectId('507f1f77bcf86cd799439011')})
+        self.assertEqual(update['$set']['status'], 'queued')
+        self.assertEqual(update['$max'], {'revision': 4})
+        self.assertTrue(db.render_jobs.update_one.call_args.kwargs['upsert'])
+
+    def test_failed_render_is_retried_until_attempts_are_exhausted(self):
+        db = SimpleNamespace(render_jobs=MagicMock())
+        job = {'_id': 'job-id', 'lease_token': 'lease', 'attempts': 1}
+        render_jobs.finish_render_job(db, job, 'boom', revision=3)
+        self.assertEqual(db.render_jobs.update_one.call_args.args[1]['$set']['status'], 'queued')
+
+        job['attempts'] = render_jobs.MAX_ATTEMPTS
+        render_jobs.finish_render_job(db, job, 'boom', revision=3)
+        query, update = db.render_jobs.update_one.call_args.args
+        self.assertEqual(query, {'_id': 'job-id', 'lease_token': 'lease'})
+        self.assertEqual(update['$set']['status'], 'failed')
+        self.assertEqual(update['$set']['revision'], 3)
+
+    def test_claim_fails_jobs_abandoned_on_their_last_attempt(self):
+        db = SimpleNamespace(render_jobs=MagicMock())
+        render_jobs.claim_render_job(db, 30)
+
+        query, update = db.render_jobs.update_many.call_args.args
+        self.assertEqual(query['status'], 'running')
+        self.assertEqual(query['attempts'], {'$gte': render_jobs.MAX_ATTEMPTS})
+        self.assertEqual(update['$set']['status'], 'failed')
+        claimed = db.render_jobs.find_one_and_update.call_args.args[0]
+        self.assertEqual(claimed['attempts'], {'$lt': render_jobs.MAX_ATTEMPTS})
+
+    def test_render_status_of_a_revision(self):
+        db = SimpleNamespace(render_jobs=MagicMock())
+        expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+        cases = [
+            (None, None),
+            ({'status': 'queued', 'attempts': 0}, 'pending'),
+            ({'status': 'running', 'attempts': 1, 'lease_until': expired}, 'pending'),
+            ({'status': 'running', 'attempts': render_jobs.MAX_ATTEMPTS,
+              'lease_until': datetime.now(timezone.utc) + timedelta(seconds=30)}, 'pending'),
+            ({'status': 'running', 'attempts': render_jobs.MAX_ATTEMPTS,
+              'lease_until': expired.replace(tzinfo=None)}, 'failed'),
+            ({'status': 'failed', 'attempts': render_jobs.MAX_ATTEMPTS}, 'failed'),
+        ]
+        for job, expected in cases:
+            with self.subTest(job=job):
+                db.render_jobs.find_one.return_value = job
+                self.assertEqual(render_jobs.render_status(db, 'notebook-id', 2), expected)
+        self.assertEqual(db.render_jobs.find_one.call_args.args[0],
+                         {'notebook_id': 'notebook-id', 'revision': 2})
+
+    def test_reader_is_not_rendered_for_while_the_job_is_pending(self):
+        import app as reasonreport_app
+        from render_cache import page_cache
+
+        reasonreport_app.app.config.update(TESTING=True, RENDER_QUEUE_ENABLED=True)
+        self.addCleanup(reasonreport_app.app.config.update, RENDER_QUEUE_ENABLED=False)
+        page_cache.local.clear()
+        document = {'_id': ObjectId(), 'owner_id': 'owner-id', 'author': 'Alice', 'revision': 2}
+        with (
+            patch.object(reasonreport_app, 'get_notebook', return_value=document),
+            patch.object(reasonreport_app, 'render_status', return_value='pending'),
+            patch.object(reasonreport_app, 'get_notebook_content') as content,
+            patch.object(reasonreport_app, 'notebook_html') as render,
+        ):
+            response = reasonreport_app.app.test_client().get('/slug/report')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '5')
+        self.assertIn(b'being rendered', response.data)
+        content.assert_not_called()
+        render.assert_not_called()
+
+    def test_worker_stores_rendered_revision_and_completes_job(self):
+        notebooks = MagicMock()
+        notebooks.find_one.return_value = {'_id': 'notebook-id', 'revision': 2, 'notebook': {}}
+        store = MagicMock()
+        slot = render_worker.RenderSlot(SimpleNamespace(notebooks=notebooks), store, 5, 0)
+        slot.pool = MagicMock()
+        slot.pool.apply_async.return_value.get.return_value = '<p>page</p>'
+        job = {'_id': 'job-id', 'notebook_id': 'notebook-id', 'lease_token': 'lease'}
+        with (
+            patch.object(render_worker, 'claim_render_job', return_value=job),
+            patch.object(render_worker, 'finish_render_job') as finish,
+        ):
+            self.assertTrue(slot.run_once())
+
+        store.set.assert_called_once_with(('notebook-id', 2, 'classic'), '<p>page</p>')
+        finish.assert_called_once_with(slot.db, job)
+
+    def test_worker_replaces_renderer_process_after_timeout(self):
+        notebooks = MagicMock()
+        notebooks.find_one.return_value = {'_id': 'notebook-id', 'revision': 2, 'notebook': {}}
+        slot = render_worker.RenderSlot(SimpleNamespace(notebooks=notebooks), MagicMock(), 5, 0)
+        pool = slot.pool = MagicMock()
+        pool.apply_async.return_value.get.side_effect = multiprocessing.TimeoutError
+        job = {'_id': 'job-id', 'notebook_id': 'notebook-id', 'lease_token': 'lease'}
+        with (
+            patch.object(render_worker, 'claim_render_job', return_value=job),
+            patch.object(render_worker, 'finish_render_job') as finish,
+        ):
+            slot.run_once()
+
+        pool.terminate.assert_called_once_with()
+        self.assertIsNone(slot.pool)
+        self.assertIn('exceeded 5 seconds', finish.call_args.args[2])
+        slot.store.set.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import sys
+import unittest
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+from bson import ObjectId
+
+import nbformat
+from nbconvert import HTMLExporter
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import app as reasonreport_app  # noqa: E402
+import rendering  # noqa: E402
+from render_cache import page_cache  # noqa: E402
+
+
+def report_notebook(size=6):
+    cells = []
+    for index in range(size):
+        cells.append(nbformat.v4.new_markdown_cell(f'## Section {index}\nSome *text*'))
+        cells.append(nbformat.v4.new_code_cell(
+            f'value = {index}\nprint(value)',
+            execution_count=index + 1,
+            outputs=[nbformat.v4.new_output('stream', text=f'{index}\n')],
+        ))
+    return nbformat.v4.new_notebook(
+        cells=cells, metadata={'title': 'Report', 'language_info': {'name': 'python'}}
+    )
+
+
+class IncrementalRenderingTest(unittest.TestCase):
+    def setUp(self):
+        rendering.fragment_cache.clear()
+        rendering.shell_cache.clear()
+
+    def test_assembled_page_matches_classic_export(self):
+        notebook = report_notebook()
+        expected, _ = HTMLExporter(template_name='classic').from_notebook_node(notebook)
+
+        self.assertEqual(rendering.notebook_html(notebook), expected)
+
+    def test_only_changed_cells_are_converted(self):
+        notebook = report_notebook()
+        rendering.notebook_html(notebook)
+        notebook.cells[3].source = 'print("edited")'
+
+        with patch.object(
+            rendering, '_render_cells', wraps=rendering._render_cells
+        ) as render_cells:
+            html = rendering.notebook_html(notebook)
+
+        converted = render_cells.call_args.args[0]
+        self.assertEqual([cell.source for cell in converted], ['print("edited")'])
+        self.assertIn('edited', html)
+
+    def test_language_change_invalidates_cell_fragments(self):
+        notebook = report_notebook(size=1)
+        context = rendering._render_context(notebook.metadata)
+        before = rendering.cell_digest(notebook.cells[1], context)
+        notebook.metadata['language_info']['name'] = 'r'
+        after = rendering.cell_digest(
+            notebook.cells[1], rendering._render_context(notebook.metadata)
+        )
+
+        self.assertNotEqual(before, after)
+
+
+class SharedStylesheetTest(unittest.TestCase):
+    def setUp(self):
+        reasonreport_app.app.config.update(TESTING=True, RENDER_EXTERNAL_CSS=True)
+        self.client = reasonreport_app.app.test_client()
+        page_cache.local.clear()
+
+    def test_body_only_page_links_one_fingerprinted_stylesheet(self):
+        document = {
+            '_id': ObjectId(), 'owner_id': 'owner-id', 'author': 'Alice',
+            'revision': 1, 'notebook': report_notebook(size=1),
+        }
+        with patch.object(reasonreport_app, 'get_notebook', return_value=document):
+            response = self.client.get('/slug/report')
+
+        digest, css = rendering.notebook_stylesheet()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'/assets/notebook-{digest}.css'.encode(), response.data)
+        self.assertNotIn(b'<style', response.data)
+        self.assertIn(b'id="notebook-container"', response.data)
+        self.assertGreater(len(css), len(response.data))
+
+    def test_body_only_page_still_loads_mathjax(self):
+        notebook = nbformat.v4.new_notebook(cells=[nbformat.v4.new_markdown_cell('$x^2$')])
+        document = {
+            '_id': ObjectId(), 'owner_id': 'owner-id', 'author': 'Alice', 'revision': 1,
+            'notebook': notebook,
+        }
+        with patch.object(reasonreport_app, 'get_notebook', return_value=document):
+            page = self.client.get('/slug/report').get_data(as_text=True)
+
+        self.assertIn('$x^2$', page)
+        self.assertIn('mathjax/2.7.7/latest.js', page)
+        self.assertIn('MathJax.Hub.Config', page)
+        self.assertIn('require.min.js', page)
+        self.assertLess(page.index('MathJax.Hub.Config'), page.index('$x^2$'))
+
+    def test_stylesheet_is_served_with_immutable_caching(self):
+        digest, css = rendering.notebook_stylesheet()
+        response = self.client.get(f'/assets/notebook-{digest}.css')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/css')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertEqual(response.get_data(as_text=True), css)
+
+        stale = self.client.get('/assets/notebook-0000000000000000.css')
+        self.assertEqual(stale.status_code, 302)
+        self.assertTrue(stale.location.endswith(f'/assets/notebook-{digest}.css'))
+
+
+class NotebookRevalidationTest(unittest.TestCase):
+    def setUp(self):
+        reasonreport_app.app.config.update(TESTING=True, RENDER_EXTERNAL_CSS=True)
+        self.client = reasonreport_app.app.test_client()
+        page_cache.local.clear()
+        self.document = {
+            '_id': ObjectId(), 'owner_id': 'owner-id', 'author': 'Alice', 'revision': 1,
+            'updated_at': datetime(2026, 1, 2, 3, 4, 5),
+        }
+        self.author = 'Alice'
+
+    def get(self, **headers):
+        with (
+            patch.object(reasonreport_app, 'get_notebook', return_value=dict(self.document)),
+            patch.object(reasonreport_app, 'notebook_author', return_value=self.author),
+            patch.object(reasonreport_app, 'get_notebook_content',
+                         return_value=report_notebook(size=1)) as content,
+        ):
+            return self.client.get('/slug/report', headers=headers), content
+
+    def test_unchanged_revision_is_not_loaded_or_rendered(self):
+        response, _ = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Last-Modified'], 'Fri, 02 Jan 2026 03:04:05 GMT')
+
+        page_cache.local.clear()
+        revalidated, content = self.get(**{'If-None-Match': response.headers['ETag']})
+
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.data, b'')
+        content.assert_not_called()
+
+    def test_new_revision_changes_the_validator(self):
+        response, _ = self.get()
+        self.document['revision'] = 2
+        changed, content = self.get(**{'If-None-Match': response.headers['ETag']})
+
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], response.headers['ETag'])
+        content.assert_called_once()
+
+    def test_renamed_author_changes_the_validator(self):
+        response, _ = self.get()
+        self.author = 'Alicia'
+        changed, _ = self.get(**{'If-None-Match': response.headers['ETag']})
+
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], response.headers['ETag'])
+
+
+if __name__ == '__main__':
+    unittest.main()
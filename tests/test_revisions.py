@@ -0,0 +1,165 @@
+import copy
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import nbformat
+from bson import ObjectId
+from pymongo.errors import DocumentTooLarge
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import revisions  # noqa: E402
+from cell_store import cell_digest  # noqa: E402
+
+
+def matches(record, query):
+    for field, condition in query.items():
+        value = record[field]
+        if isinstance(condition, dict) and '$in' in condition:
+            if value not in condition['$in']:
+                return False
+        elif isinstance(condition, dict):
+            if value < condition.get('$gte', value) or value > condition.get('$lte', value):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def edited(notebook, index, source):
+    notebook = copy.deepcopy(notebook)
+    notebook.cells[index].source = source
+    return notebook
+
+
+class RevisionHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.db = MagicMock()
+        self.records = []
+        history = self.db.notebook_revisions
+        history.insert_one.side_effect = self.records.append
+        history.find_one.side_effect = lambda query, projection=None: next(
+            (record for record in self.records if matches(record, query)), None
+        )
+        history.find.side_effect = lambda query, projection=None: MagicMock(
+            sort=lambda field, direction: sorted(
+                (record for record in self.records if matches(record, query)),
+                key=lambda record: record[field] * direction,
+            )
+        )
+        self.parts = []
+        parts = self.db.notebook_revision_cells
+        parts.insert_one.side_effect = self.parts.append
+        parts.find.side_effect = lambda query: [
+            part for part in self.parts if matches(part, query)
+        ]
+        self.notebook_id = ObjectId()
+        self.notebook = nbformat.v4.new_notebook(cells=[
+            nbformat.v4.new_markdown_cell(f'Cell {index}') for index in range(5)
+        ])
+
+    def test_revisions_are_rebuilt_from_a_snapshot_and_bounded_deltas(self):
+        versions = {}
+        notebook = self.notebook
+        for revision in range(1, 13):
+            notebook = edited(notebook, revision % 5, f'Revision {revision}')
+            versions[revision] = notebook
+            revisions.record_notebook(self.db, self.notebook_id, revision, notebook)
+
+        bases = [record['base'] for record in self.records]
+        self.assertEqual(bases, [1] * 10 + [11, 11])
+        self.assertEqual(len(self.records[0]['cells']), 5)
+        self.assertEqual([len(record['cells']) for record in self.records[1:10]], [1] * 9)
+        for revision, expected in versions.items():
+            self.assertEqual(revisions.load_revision(self.db, self.notebook_id, revision), expected)
+        self.assertIsNone(revisions.load_revision(self.db, self.notebook_id, 13))
+
+    def test_cell_saves_take_unchanged_digests_from_the_previous_revision(self):
+        revisions.record_notebook(self.db, self.notebook_id, 1, self.notebook)
+        changed = nbformat.v4.new_markdown_cell('Changed', id=self.notebook.cells[2].id)
+        order = [[cell.id, None] for cell in self.notebook.cells]
+        order[2][1] = cell_digest(changed)
+
+        record = revisions.record_revision(
+            self.db, self.notebook_id, 2, revisions.cell_store.skeleton(self.notebook), order,
+            {cell_digest(changed): changed},
+        )
+
+        self.assertEqual(list(record['cells'].values()), [changed])
+        expected = copy.deepcopy(self.notebook)
+        expected.cells[2] = changed
+        self.assertEqual(revisions.load_revision(self.db, self.notebook_id, 2), expected)
+        self.db.notebooks.find_one.assert_not_called()
+
+    def test_unknown_content_is_read_back_from_the_stored_notebook(self):
+        self.db.notebooks.find_one.return_value = {
+            '_id': self.notebook_id, 'notebook': self.notebook,
+        }
+
+        record = revisions.record_revision(
+            self.db, self.notebook_id, 4, {}, [[cell.id, None] for cell in self.notebook.cells]
+        )
+
+        self.assertEqual(record['base'], 4)
+        self.assertEqual(revisions.load_revision(self.db, self.notebook_id, 4), self.notebook)
+        self.assertEqual(self.db.notebooks.find_one.call_args.args[0],
+                         {'_id': self.notebook_id, 'revision': 4})
+
+    def test_oversized_snapshots_continue_in_parts(self):
+        notebook = copy.deepcopy(self.notebook)
+        for cell in notebook.cells:
+            cell.source = cell.source * 100
+        revisions.record_notebook(self.db, self.notebook_id, 1, notebook)
+        revisions.record_revision(
+            self.db, self.notebook_id, 2, *revisions.split_notebook(edited(notebook, 0, 'Short')),
+            limit=1500,
+        )
+        revisions.record_revision(
+            self.db, self.notebook_id, 3, *revisions.split_notebook(notebook),
+            interval=1, limit=1500,
+        )
+
+        snapshot = self.records[-1]
+        self.assertEqual(snapshot['parts'], 2)
+        self.assertEqual([len(part['cells']) for part in self.parts], [2, 1])
+        self.assertEqual(len(snapshot['cells']), 2)
+        self.assertEqual(revisions.load_revision(self.db, self.notebook_id, 3), notebook)
+        self.assertEqual(revisions.load_revision(self.db, self.notebook_id, 2),
+                         edited(notebook, 0, 'Short'))
+
+        self.parts.pop()
+        self.assertIsNone(revisions.load_revision(self.db, self.notebook_id, 3))
+
+    def test_history_failures_do_not_fail_the_save(self):
+        self.db.notebook_revisions.insert_one.side_effect = DocumentTooLarge('too large')
+
+        with self.assertLogs('revisions', 'ERROR'):
+            record = revisions.record_notebook(self.db, self.notebook_id, 1, self.notebook)
+
+        self.assertIsNone(record)
+
+    def test_diff_lists_cell_operations_between_revisions(self):
+        after = edited(self.notebook, 1, 'Edited')
+        removed = after.cells.pop(4)
+        after.cells.insert(0, after.cells.pop(3))
+        inserted = nbformat.v4.new_code_cell('print(1)')
+        after.cells.append(inserted)
+        after.metadata['title'] = 'Renamed'
+        revisions.record_notebook(self.db, self.notebook_id, 1, self.notebook)
+        revisions.record_notebook(self.db, self.notebook_id, 2, after)
+
+        diff = revisions.diff_revisions(self.db, self.notebook_id, 1, 2)
+
+        self.assertEqual(diff['operations'], [
+            {'op': 'delete', 'id': removed.id},
+            {'op': 'move', 'id': self.notebook.cells[3].id, 'index': 0},
+            {'op': 'update', 'cell': after.cells[2]},
+            {'op': 'insert', 'index': 4, 'cell': inserted},
+        ])
+        self.assertEqual(diff['metadata'], {'title': 'Renamed'})
+        self.assertIsNone(revisions.diff_revisions(self.db, self.notebook_id, 1, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import nbformat
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import search  # noqa: E402
+
+
+def notebook(*cells):
+    return nbformat.v4.new_notebook(cells=list(cells))
+
+
+class TextExtractionTest(unittest.TestCase):
+    def test_tokenize_drops_stopwords_short_terms_and_data_uris(self):
+        self.assertEqual(
+            search.tokenize('The Gradient of a loss ![plot](data:image/png;base64,iVBORw0KGgo)'),
+            ['gradient', 'loss', 'plot'],
+        )
+
+    def test_title_and_summary_terms_are_weighted_and_outputs_skipped(self):
+        summary = nbformat.v4.new_markdown_cell('Descent methods')
+        summary.metadata['type'] = 'summary'
+        code = nbformat.v4.new_code_cell('descent(step)', outputs=[
+            nbformat.v4.new_output('stream', text='converged'),
+        ])
+
+        frequencies = search.term_frequencies(
+            'Gradient descent', '', ['optimization'],
+            notebook(summary, code, nbformat.v4.new_raw_cell('raw text')),
+        )
+
+        self.assertEqual(frequencies, {
+            'descent': 1 + 2 + 3, 'step': 1, 'methods': 2, 'optimization': 2, 'gradient': 3,
+        })
+
+
+class IndexTest(unittest.TestCase):
+    def setUp(self):
+        self.documents = MagicMock()
+        self.documents.find_one_and_update.return_value = None
+        self.postings = MagicMock()
+        self.stats = MagicMock()
+        self.db = SimpleNamespace(search_documents=self.documents, search_postings=self.postings,
+                                  search_stats=self.stats)
+        self.notebook_id = ObjectId()
+
+    def test_new_notebooks_add_postings_and_corpus_totals(self):
+        indexed = search.index_notebook(
+            self.db, self.notebook_id, 2, notebook(nbformat.v4.new_markdown_cell('loss loss')),
+            'Loss',
+        )
+
+        self.assertTrue(indexed)
+        query, update = self.documents.find_one_and_update.call_args.args
+        self.assertEqual(query, {'_id': self.notebook_id, 'revision': {'$lt': 2}})
+        self.assertEqual(update, {'$set': {'revision': 2, 'length': 5}})
+        self.stats.update_one.assert_called_once_with(
+            {'_id': 'corpus'}, {'$inc': {'documents': 1, 'length': 5}}, upsert=True,
+        )
+        [posting] = self.postings.insert_many.call_args.args[0]
+        self.assertEqual(posting, {'term': 'loss', 'notebook_id': self.notebook_id,
+                                   'revision': 2, 'tf': 5, 'length': 5})
+        self.postings.delete_many.assert_called_once_with(
+            {'notebook_id': self.notebook_id, 'revision': {'$lt': 2}}
+        )
+
+    def test_reindexing_adjusts_the_corpus_length(self):
+        self.documents.find_one_and_update.return_value = {'revision': 1, 'length': 7}
+
+        search.index_notebook(self.db, self.notebook_id, 2, notebook(), 'Loss')
+
+        self.stats.update_one.assert_called_once_with(
+            {'_id': 'corpus'}, {'$inc': {'documents': 0, 'length': 3 - 7}}, upsert=True,
+        )
+
+    def test_older_revisions_are_not_indexed(self):
+        self.documents.find_one_and_update.side_effect = DuplicateKeyError('duplicate _id')
+
+        self.assertFalse(search.index_notebook(self.db, self.notebook_id, 2, notebook(), 'Loss'))
+
+        self.postings.insert_many.assert_not_called()
+        self.postings.delete_many.assert_not_called()
+        self.stats.update_one.assert_not_called()
+
+    def test_discard_removes_postings_and_totals(self):
+        missing = ObjectId()
+        self.documents.find_one_and_delete.side_effect = [{'length': 4}, None]
+
+        search.discard(self.db, [self.notebook_id, missing])
+
+        self.postings.delete_many.assert_called_once_with(
+            {'notebook_id': {'$in': [self.notebook_id, missing]}}
+        )
+        self.stats.update_one.assert_called_once_with(
+            {'_id': 'corpus'}, {'$inc': {'documents': -1, 'length': -4}},
+        )
+
+
+class SearchTest(unittest.TestCase):
+    def setUp(self):
+        self.dense, self.sparse, self.private = ObjectId(), ObjectId(), ObjectId()
+        self.postings = {
+            'gradient': [
+                {'notebook_id': self.private, 'tf': 9, 'length': 10},
+                {'notebook_id': self.dense, 'tf': 4, 'length': 10},
+                {'notebook_id': self.sparse, 'tf': 4, 'length': 400},
+            ],
+        }
+        postings = MagicMock()
+
+        def find(query, projection):
+            cursor = MagicMock()
+            cursor.sort.return_value.limit.side_effect = \
+                lambda limit: self.postings.get(query['term'], [])[:limit]
+            return cursor
+
+        postings.find.side_effect = find
+        postings.count_documents.return_value = 3
+        stats = MagicMock()
+        stats.find_one.return_value = {'documents': 100, 'length': 10000}
+        self.notebooks = MagicMock()
+        self.notebooks.find.side_effect = lambda query, projection: [
+            {'_id': notebook_id} for notebook_id in query['$and'][0]['_id']['$in']
+            if notebook_id != self.private
+        ]
+        self.db = SimpleNamespace(search_postings=postings, search_stats=stats,
+                                  notebooks=self.notebooks)
+
+    def test_results_are_ranked_and_filtered_by_access(self):
+        results = search.search(self.db, '507f1f77bcf86cd799439011', 'Gradient of the loss', {})
+
+        self.assertEqual([document['_id'] for document, _ in results], [self.dense, self.sparse])
+        self.assertGreater(results[0][1], results[1][1])
+        query = self.notebooks.find.call_args.args[0]
+        self.assertIn({'owner_id': ObjectId('507f1f77bcf86cd799439011')}, query['$and'][1]['$or'])
+
+    def test_anonymous_users_only_find_public_notebooks(self):
+        search.search(self.db, None, 'gradient', {})
+
+        self.assertEqual(self.notebooks.find.call_args.args[0]['$and'][1],
+                         {'visibility': 'public'})
+
+    def test_capped_terms_count_all_their_postings(self):
+        with patch.object(search, 'MAX_POSTINGS', 2):
+            results = search.search(self.db, None, 'gradient', {}, limit=1)
+
+        self.db.search_postings.count_documents.assert_called_once_with({'term': 'gradient'})
+        self.assertEqual([document['_id'] for document, _ in results], [self.dense])
+
+    def test_queries_without_terms_read_nothing(self):
+        self.assertEqual(search.search(self.db, None, 'the of', {}), [])
+
+        self.db.search_postings.find.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from pymongo.errors import DuplicateKeyError
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import slugs  # noqa: E402
+
+
+def duplicate(key):
+    return DuplicateKeyError('E11000 duplicate key error', 11000, {'keyPattern': {key: 1}})
+
+
+class SlugAllocationTest(unittest.TestCase):
+    def test_first_free_suffix_is_found_with_one_query(self):
+        db = MagicMock()
+        db.notebooks.find.return_value = [
+            {'slug': 'notes'}, {'slug': 'notes-1'}, {'slug': 'notes-3'},
+        ]
+
+        self.assertEqual(slugs.allocate_slug(db, 'notes', '507f1f77bcf86cd799439011'), 'notes-2')
+        db.notebooks.find.assert_called_once()
+        query = db.notebooks.find.call_args.args[0]
+        self.assertEqual(query['slug'], {'$regex': '^notes(-[0-9]+)?$'})
+        self.assertIn('$ne', query['_id'])
+
+    def test_free_base_is_used_unchanged(self):
+        db = MagicMock()
+        db.notebooks.find.return_value = [{'slug': 'notes-1'}]
+
+        self.assertEqual(slugs.allocate_slug(db, 'notes'), 'notes')
+
+    def test_write_retries_when_a_concurrent_publish_took_the_slug(self):
+        db = MagicMock()
+        db.notebooks.find.return_value = [{'slug': 'notes'}]
+        write = MagicMock(side_effect=[duplicate('slug'), 'written'])
+
+        self.assertEqual(slugs.write_with_slug(db, 'notes', write, slug='notes'), 'written')
+        self.assertEqual([call.args[0] for call in write.call_args_list], ['notes', 'notes-1'])
+
+    def test_other_duplicate_keys_are_not_retried(self):
+        write = MagicMock(side_effect=duplicate('_id'))
+
+        with self.assertRaises(DuplicateKeyError):
+            slugs.write_with_slug(MagicMock(), 'notes', write, slug='notes')
+        write.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
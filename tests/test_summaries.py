@@ -0,0 +1,83 @@
+import sys
+import unittest
+from pathlib import Path
+
+import nbformat
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import summaries  # noqa: E402
+
+DIGEST = 'a' * 64
+BLOB = f'reasonreport-blob:{DIGEST}'
+
+
+def summary_cell(text):
+    cell = nbformat.v4.new_markdown_cell(text, id='summary')
+    cell.metadata['type'] = 'summary'
+    return cell
+
+
+def plot_cell(cell_id='plot'):
+    return nbformat.v4.new_code_cell('plot()', id=cell_id, outputs=[
+        nbformat.v4.new_output('display_data', data={'image/png': BLOB, 'text/plain': 'Figure'}),
+    ])
+
+
+class SummaryFieldsTest(unittest.TestCase):
+    def test_fields_are_derived_from_the_cells(self):
+        notebook = nbformat.v4.new_notebook(cells=[
+            nbformat.v4.new_markdown_cell('# Gradient descent', id='title'),
+            summary_cell('Steps  downhill,\nslowly.'),
+            plot_cell(),
+            nbformat.v4.new_code_cell('%%bash\nls', id='shell'),
+            nbformat.v4.new_code_cell('', id='empty'),
+        ], metadata={'language_info': {'name': 'Python'}})
+
+        self.assertEqual(summaries.summary_fields(notebook), {
+            'summary': 'Steps downhill, slowly.',
+            'first_image': {'cell_id': 'plot', 'url': f'/blobs/{DIGEST}'},
+            'cell_count': 5,
+            'word_count': 2 + 3,
+            'code_languages': ['bash', 'python'],
+        })
+
+    def test_markdown_images_and_blob_attachments_are_linked(self):
+        remote = nbformat.v4.new_markdown_cell(
+            'Inline ![dot](data:image/png;base64,iVBORw0KGgo) and <img src="/static/a.png">'
+        )
+        attached = nbformat.v4.new_markdown_cell('![chart](attachment:chart.png)')
+        attached.attachments = {'chart.png': {'image/png': BLOB}}
+
+        self.assertEqual(summaries.cell_image(remote), '/static/a.png')
+        self.assertEqual(summaries.cell_image(attached), f'/blobs/{DIGEST}')
+        self.assertIsNone(summaries.cell_image(nbformat.v4.new_markdown_cell('![x](data:,)')))
+
+    def test_notebooks_without_summary_cells_keep_the_stored_summary(self):
+        notebook = nbformat.v4.new_notebook(cells=[nbformat.v4.new_markdown_cell('Text')])
+
+        fields = summaries.summary_fields(notebook, {'summary': 'Given through MCP'})
+
+        self.assertEqual(fields['summary'], 'Given through MCP')
+        self.assertEqual(fields['code_languages'], [])
+        emptied = nbformat.v4.new_notebook(cells=[summary_cell('')])
+        self.assertEqual(summaries.summary_fields(emptied, {'summary': 'Old'})['summary'], '')
+
+    def test_cell_saves_keep_the_image_of_an_untouched_cell(self):
+        previous = {'first_image': {'cell_id': 'plot', 'url': f'/blobs/{DIGEST}'}}
+        # Untouched cells of a cell-level save carry their source only.
+        outline = [nbformat.v4.new_markdown_cell('Intro', id='intro'),
+                   {'id': 'plot', 'cell_type': 'code', 'source': 'plot()'}]
+
+        kept = summaries.summary_fields({'cells': outline}, previous, touched={'intro': outline[0]})
+        self.assertEqual(kept['first_image'], previous['first_image'])
+
+        replaced = summaries.summary_fields({'cells': outline}, previous, touched={'plot': outline[1]})
+        self.assertIsNone(replaced['first_image'])
+
+        moved = [plot_cell('new'), *outline]
+        found = summaries.summary_fields({'cells': moved}, previous, touched={'new': moved[0]})
+        self.assertEqual(found['first_image']['cell_id'], 'new')
+
+
+if __name__ == '__main__':
+    unittest.main()
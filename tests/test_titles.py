@@ -0,0 +1,59 @@
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from bson import ObjectId
+
+sys.path.insert(0, str(Path('app/reasonreport').resolve()))
+import titles  # noqa: E402
+
+
+class TitleCompletionTest(unittest.TestCase):
+    def setUp(self):
+        self.notebooks = MagicMock()
+        self.cursor = self.notebooks.find.return_value.sort.return_value.hint.return_value
+        self.cursor.limit.return_value = [{'_id': ObjectId(), 'title': 'Étude'}]
+        self.db = SimpleNamespace(notebooks=self.notebooks)
+
+    def test_titles_are_normalized_without_case_accents_or_extra_spaces(self):
+        self.assertEqual(titles.normalize_title('  Étude   de  CAS '), 'etude de cas')
+        self.assertEqual(titles.title_fields('Ab c'), {
+            'title_normalized': 'ab c', 'title_prefixes': ['a', 'ab', 'ab ', 'ab c'],
+        })
+        self.assertEqual(len(titles.title_fields('x' * 50)['title_prefixes']),
+                         titles.MAX_PREFIX_LENGTH)
+
+    def test_completion_reads_the_newest_readable_titles_from_the_prefix_index(self):
+        result = titles.complete(self.db, '507f1f77bcf86cd799439011', 'ÉT', {'title': 1}, 5)
+
+        self.assertEqual(result, [{'_id': self.cursor.limit.return_value[0]['_id'],
+                                   'title': 'Étude'}])
+        query, projection = self.notebooks.find.call_args.args
+        self.assertEqual(query['$and'][0], {'title_prefixes': 'et'})
+        self.assertIn({'visibility': 'public'}, query['$and'][1]['$or'])
+        self.assertEqual(projection, {'title': 1})
+        self.notebooks.find.return_value.sort.assert_called_once_with('updated_at', -1)
+        self.notebooks.find.return_value.sort.return_value.hint.assert_called_once_with(
+            titles.PREFIX_INDEX
+        )
+        self.cursor.limit.assert_called_once_with(5)
+
+    def test_long_prefixes_are_compared_in_full(self):
+        prefix = 'a very long report title prefix'
+
+        titles.complete(self.db, '507f1f77bcf86cd799439011', prefix)
+
+        query = self.notebooks.find.call_args.args[0]['$and'][0]
+        self.assertEqual(query['title_prefixes'], prefix[:titles.MAX_PREFIX_LENGTH])
+        self.assertEqual(query['title_normalized'],
+                         {'$regex': '^' + titles.re.escape(prefix)})
+
+    def test_blank_prefixes_read_nothing(self):
+        self.assertEqual(titles.complete(self.db, '507f1f77bcf86cd799439011', '  '), [])
+        self.notebooks.find.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
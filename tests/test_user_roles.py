@@ -6,6 +6,7 @@ from unittest.mock import MagicMock, patch
 
 sys.path.insert(0, str(Path('app/reasonreport').resolve()))
 import models  # noqa: E402
+import user_manager  # noqa: E402
 
 
 class UserRoleTest(unittest.TestCase):
@@ -25,6 +26,20 @@ class UserRoleTest(unittest.TestCase):
         with self.assertRaisesRegex(ValueError, 'Role must be one of'):
             models.create_user('alice', 'secret12', role='owner')
 
+    def test_modify_user_changes_role_and_forgets_cached_record(self):
+        users = MagicMock()
+        users.find_one.return_value = {'_id': 'user-id', 'username': 'alice'}
+
+        with (
+            patch.object(user_manager, 'mongo', SimpleNamespace(db=SimpleNamespace(users=users))),
+            patch.object(user_manager, 'invalidate_user') as invalidate,
+        ):
+            message = user_manager.modify_user('alice', new_role='editor')
+
+        self.assertEqual(message, "User 'alice' updated successfully.")
+        self.assertEqual(users.update_one.call_args.args[1]['$set']['role'], 'editor')
+        invalidate.assert_called_once_with('user-id')
+
 
 if __name__ == '__main__':
     unittest.main()